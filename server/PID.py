@@ -1,4 +1,7 @@
 import time
+from typing import Optional, Sequence, Tuple, Union
+
+import numpy as np
 
 
 class PID:
@@ -21,7 +24,7 @@ class PID:
         self.prev_error = preverror
 
     def Initialize(self):
-        self.currtime = time.time()
+        self.currtime = time.monotonic()
         self.prevtime = self.currtime
 
         self.prev_error = 0
@@ -31,7 +34,7 @@ class PID:
         self.Cd = 0
 
     def GenOut(self,error):
-        self.currtime = time.time()
+        self.currtime = time.monotonic()
         dt = self.currtime - self.prevtime
         de = error - self.prev_error
 
@@ -46,6 +49,237 @@ class PID:
         self.prev_error = error
 
         return self.Cp + (self.Ki*self.Ci) + (self.Kd*self.Cd)
+
+
+Channels = Union[int, Sequence[int], np.ndarray, None]
+
+# Banks up to this size update on plain floats, NumPy's per-call overhead
+# costs more than it saves for a handful of channels
+SCALAR_CHANNELS = 4
+
+
+class PIDBank:
+    """
+    N PID controllers with their state in NumPy arrays, updated in one call.
+
+        pid = PIDBank(2, kp=5, ki=0.01, kd=0, dt=0.01)
+        out = pid.update([error_x, error_y])            # fixed dt
+        out = pid.update(error, dt=elapsed, channels=1)  # explicit dt, one channel
+
+    Unlike PID.GenOut, the time step is deterministic: the `dt` of the call, else
+    the bank's fixed dt, else the time.monotonic() difference since the channel's
+    last update. The derivative acts on the error and is low-passed with the time
+    constant derivative_tau. Windup is kept in check twice: the integral term is
+    clamped to +-integral_limit, and while the output saturates at output_limits
+    back-calculation bleeds the integral by tracking_gain * (saturated - raw) per
+    second. Gains and limits may be one value or one per channel.
+
+    Banks of SCALAR_CHANNELS channels or fewer keep their state in Python lists
+    and update channel by channel, with the same results.
+    """
+
+    def __init__(self, channels: int, kp=0.0, ki=0.0, kd=0.0, dt: Optional[float] = None,
+                 derivative_tau=0.0, integral_limit=np.inf,
+                 output_limits: Tuple = (-np.inf, np.inf), tracking_gain=None) -> None:
+        self.channels = channels
+        self.kp = self.per_channel(kp)
+        self.ki = self.per_channel(ki)
+        self.kd = self.per_channel(kd)
+        self.dt = dt
+        self.derivative_tau = self.per_channel(derivative_tau)
+        self.integral_limit = self.per_channel(integral_limit)
+        self.output_min = self.per_channel(output_limits[0])
+        self.output_max = self.per_channel(output_limits[1])
+        if tracking_gain is None:
+            # 1 / Ti, the usual choice: the integral unwinds at its own pace
+            tracking_gain = np.where(self.kp > 0, self.ki / np.where(self.kp > 0, self.kp, 1), 1.0)
+        self.tracking_gain = self.per_channel(tracking_gain)
+        # Steps update() can skip, most controllers use only some of the features
+        self.filtered = bool(np.any(self.derivative_tau > 0))
+        self.clamped = bool(np.any(np.isfinite(self.integral_limit)))
+        self.saturated = bool(np.any(np.isfinite(self.output_min) | np.isfinite(self.output_max)))
+        # Coefficients of the fixed dt, computed once
+        self.fixed_coefficients = self.coefficients(dt) if dt else None
+        self.scalar = channels <= SCALAR_CHANNELS
+        if self.scalar:
+            # Per channel: kp, ki, kd, tau, integral limit, output min, output max, tracking gain
+            self.scalar_gains = list(zip(*(a.tolist() for a in (
+                self.kp, self.ki, self.kd, self.derivative_tau, self.integral_limit,
+                self.output_min, self.output_max, self.tracking_gain))))
+        self.reset()
+
+    def per_channel(self, value) -> np.ndarray:
+        return np.broadcast_to(np.asarray(value, dtype=float), (self.channels,)).copy()
+
+    def coefficients(self, dt: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Derivative filter factor, ki * dt and tracking_gain * dt of all channels for a time step.
+        """
+        return dt / (self.derivative_tau + dt), self.ki * dt, self.tracking_gain * dt
+
+    def reset(self, channels: Channels = None) -> None:
+        if channels is None:
+            self.integral = np.zeros(self.channels)  # Integral term, output units
+            self.derivative = np.zeros(self.channels)  # Filtered de/dt
+            self.prev_error = np.zeros(self.channels)
+            self.prev_time = np.full(self.channels, np.nan)
+            self.started = np.zeros(self.channels, dtype=bool)
+            self.output = np.zeros(self.channels)
+            if self.scalar:
+                for name in ('integral', 'derivative', 'prev_error', 'prev_time', 'started', 'output'):
+                    setattr(self, name, getattr(self, name).tolist())
+        elif self.scalar:
+            for i in np.arange(self.channels)[channels].reshape(-1).tolist():
+                self.integral[i] = 0.0
+                self.derivative[i] = 0.0
+                self.prev_error[i] = 0.0
+                self.prev_time[i] = np.nan
+                self.started[i] = False
+                self.output[i] = 0.0
+        else:
+            self.integral[channels] = 0.0
+            self.derivative[channels] = 0.0
+            self.prev_error[channels] = 0.0
+            self.prev_time[channels] = np.nan
+            self.started[channels] = False
+            self.output[channels] = 0.0
+
+    def update(self, errors, dt: Optional[float] = None, channels: Channels = None):
+        """
+        One control step of all channels, or of `channels`.
+
+        Returns:
+            The saturated outputs of the updated channels, a float for a single channel index.
+        """
+        if self.scalar:
+            return self.update_scalar(errors, dt, channels)
+        index = slice(None) if channels is None else channels
+        error = np.asarray(errors, dtype=float)
+        now = time.monotonic()
+        if dt is None:
+            dt = self.dt
+        if dt is None:
+            # Nothing to integrate or differentiate over on a channel's first update
+            dt = np.nan_to_num(now - self.prev_time[index], nan=0.0)
+        if not self.started[index].all():
+            # A channel's first error has no derivative
+            fresh = np.zeros(self.channels, dtype=bool)
+            fresh[index] = ~self.started[index]
+            self.prev_error[fresh] = np.broadcast_to(error, self.prev_error[index].shape)[fresh[index]]
+            self.derivative[fresh] = 0.0
+            self.started[index] = True
+
+        prev_derivative = self.derivative[index]
+        change = error - self.prev_error[index]
+        if np.ndim(dt) == 0 and dt > 0:
+            coefficients = self.fixed_coefficients if dt == self.dt else self.coefficients(float(dt))
+            alpha, ki_dt, tracking_dt = (c[index] for c in coefficients)
+            raw_derivative = change / dt
+        else:
+            dt = np.maximum(dt, 0.0)
+            tau = self.derivative_tau[index]
+            alpha = np.divide(dt, tau + dt, out=np.zeros(np.broadcast(tau, dt).shape), where=(tau + dt) > 0)
+            ki_dt = self.ki[index] * dt
+            tracking_dt = self.tracking_gain[index] * dt
+            raw_derivative = np.divide(change, dt, out=np.zeros(np.broadcast(change, dt).shape), where=dt > 0)
+        if self.filtered:
+            derivative = prev_derivative + alpha * (raw_derivative - prev_derivative)
+        else:
+            derivative = raw_derivative
+
+        integral = self.integral[index] + ki_dt * error
+        if self.clamped:
+            limit = self.integral_limit[index]
+            integral = np.minimum(np.maximum(integral, -limit), limit)
+        raw = self.kp[index] * error + integral + self.kd[index] * derivative
+        if self.saturated:
+            output = np.minimum(np.maximum(raw, self.output_min[index]), self.output_max[index])
+            # Back-calculation: a saturated output pulls the integral back
+            integral = integral + tracking_dt * (output - raw)
+            if self.clamped:
+                integral = np.minimum(np.maximum(integral, -limit), limit)
+        else:
+            output = raw
+
+        self.integral[index] = integral
+        self.derivative[index] = derivative
+        self.prev_error[index] = error
+        self.prev_time[index] = now
+        self.output[index] = output
+        return float(output) if np.ndim(output) == 0 else output
+
+    def update_scalar(self, errors, dt, channels: Channels):
+        """
+        update() of a small bank, the same steps on plain floats.
+        """
+        if channels is None:
+            indices = range(self.channels)
+        elif isinstance(channels, (int, np.integer)):
+            indices = (int(channels),)
+        else:
+            indices = np.arange(self.channels)[channels].tolist()
+        # isinstance() first, np.ndim() of a list or float costs more than the update
+        if isinstance(errors, (list, tuple)):
+            errors = [float(e) for e in errors]
+        elif isinstance(errors, (int, float, np.number)) or np.ndim(errors) == 0:
+            errors = [float(errors)] * len(indices)
+        else:
+            errors = np.asarray(errors, dtype=float).tolist()
+        if dt is None:
+            dt = self.dt
+        now = time.monotonic()
+        if dt is None:
+            # Nothing to integrate or differentiate over on a channel's first update
+            steps = [0.0 if self.prev_time[i] != self.prev_time[i] else now - self.prev_time[i] for i in indices]
+        elif isinstance(dt, (int, float, np.number)) or np.ndim(dt) == 0:
+            steps = [float(dt)] * len(indices)
+        else:
+            steps = np.broadcast_to(np.asarray(dt, dtype=float), (len(indices),)).tolist()
+        # Locals: attribute lookups are a good part of the cost at this size
+        integrals, derivatives, prev_errors = self.integral, self.derivative, self.prev_error
+        prev_times, last_outputs = self.prev_time, self.output
+        started, filtered, clamped, saturated = self.started, self.filtered, self.clamped, self.saturated
+        outputs = []
+        for i, error, step in zip(indices, errors, steps):
+            kp, ki, kd, tau, limit, output_min, output_max, tracking_gain = self.scalar_gains[i]
+            if not started[i]:
+                # A channel's first error has no derivative
+                prev_errors[i] = error
+                derivatives[i] = 0.0
+                started[i] = True
+            if step > 0:
+                raw_derivative = (error - prev_errors[i]) / step
+            else:
+                step = raw_derivative = 0.0
+            if filtered:
+                derivative = derivatives[i]
+                derivative += step / (tau + step) * (raw_derivative - derivative) if step else 0.0
+            else:
+                derivative = raw_derivative
+
+            integral = integrals[i] + ki * step * error
+            if clamped:
+                integral = limit if integral > limit else -limit if integral < -limit else integral
+            raw = kp * error + integral + kd * derivative
+            if saturated:
+                output = output_max if raw > output_max else output_min if raw < output_min else raw
+                # Back-calculation: a saturated output pulls the integral back
+                integral += tracking_gain * step * (output - raw)
+                if clamped:
+                    integral = limit if integral > limit else -limit if integral < -limit else integral
+            else:
+                output = raw
+
+            integrals[i] = integral
+            derivatives[i] = derivative
+            prev_errors[i] = error
+            prev_times[i] = now
+            last_outputs[i] = output
+            outputs.append(output)
+        if isinstance(channels, (int, np.integer)):
+            return outputs[0]
+        return np.array(outputs)
+
 '''
 pid = PID()
 pid.SetKp(Kp)
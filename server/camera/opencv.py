@@ -13,7 +13,7 @@ from picamera2 import Picamera2
 import servo
 # from light.strip import LightStrip
 from camera.base import BaseCamera
-from system.kalman_filter import KalmanFilter
+from system.kalman_filter import KalmanFilterBank
 
 # os.environ["LIBCAMERA_LOG_LEVELS"] = "2"
 # logging.getLogger('picamera2').setLevel(logging.INFO)
@@ -40,8 +40,8 @@ colorLower = np.array([24, 100, 100])
 class CVThread(threading.Thread):
 	font = cv2.FONT_HERSHEY_SIMPLEX
 
-	kalman_filter_X = KalmanFilter(0.01, 0.1)
-	kalman_filter_Y = KalmanFilter(0.01, 0.1)
+	# Channel 0: pan (X) error, channel 1: tilt (Y) error
+	kalman_filter = KalmanFilterBank(2, 0.01, 0.1)
 	P_direction = -1
 	T_direction = 1
 	P_servo = 12
@@ -57,8 +57,10 @@ class CVThread(threading.Thread):
 	tor = 27
 
 	# TODO: MUST be inited from webServer and passed!
-	scGear = servo.base.ServoCtrl()
-	scGear.move_init()
+	# No init pass of its own, servo.move.init() puts the head in its init pose
+	scGear = servo.base.ServoCtrl(name="opencv")
+	# Tracking only moves the head, mixed over the gait
+	scGear.use_layer('head')
 	# Single LED switches, not used now
 	# switch.switchSetup()
 
@@ -268,7 +270,7 @@ class CVThread(threading.Thread):
 
 	def servo_move(ID, Dir, errorInput):
 		if ID == 12:
-			errorGenOut = CVThread.kalman_filter_X.kalman(errorInput)
+			errorGenOut = CVThread.kalman_filter.kalman(errorInput, channels=0)
 			CVThread.P_anglePos += 0.15*(errorGenOut*Dir)*CVThread.cameraDiagonalW/CVThread.videoW
 
 			if abs(errorInput) > CVThread.tor:
@@ -277,7 +279,7 @@ class CVThread(threading.Thread):
 			else:
 				CVThread.X_lock = 1
 		elif ID == 13:
-			error_gen_out = CVThread.kalman_filter_Y.kalman(errorInput)
+			error_gen_out = CVThread.kalman_filter.kalman(errorInput, channels=1)
 			CVThread.T_anglePos += 0.15*(error_gen_out*Dir)*CVThread.cameraDiagonalH/CVThread.videoH
 
 			if abs(errorInput) > CVThread.tor:
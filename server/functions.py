@@ -1,11 +1,12 @@
 import time
 import threading
 import logging
-from mpu6050 import mpu6050
 
 import config
-from system.kalman_filter import KalmanFilter
+from system import boot
+from system import imu
 from servo import base
+from servo import mixer
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -14,20 +15,28 @@ logger.info('Functions: starting..')
 
 # Initialize the servo control
 logger.info('Functions: initializing servo')
-scGear = base.ServoCtrl()
+scGear = base.ServoCtrl(name="functions")
+# Radar scan pans the head
+scGear.use_layer('head')
 
-# Initialize Kalman filter for X axis
-kalman_filter_X = KalmanFilter(0.01, 0.1)
+# Set by init() if the shared IMU service has a sensor
+MPU_connection = 0
+
+
+@boot.init_once("functions")
+def init():
+    '''
+    Starts the servo bus and connects to the shared IMU service. Runs once per process, on the first Functions() instance.
+    '''
+    global MPU_connection
+    mixer.init()
+    imu.init()
+    MPU_connection = int(imu.imu_service.connected)
+    if MPU_connection:
+        logger.info('mpu6050 connected, PT MODE ON')
+    else:
+        logger.info('mpu6050 disconnected, ARM MODE ON')
 
-# Initialize MPU6050 sensor
-logger.info('Functions: initializing MPU6050')
-MPU_connection = 1
-try:
-    sensor = mpu6050(0x68)
-    logger.info('mpu6050 connected, PT MODE ON')
-except:
-    MPU_connection = 0
-    logger.info('mpu6050 disconnected, ARM MODE ON')
 
 # Initialize PWM values and directions
 pwm_config = config.read("pwm")
@@ -59,6 +68,7 @@ def pwmGenOut(angleInput):
 class Functions(threading.Thread):
     def __init__(self, *args, **kwargs):
         logger.info('Functions: __init__')
+        init()
         self.functionMode = 'none'
         self.steadyGoal = 0
 
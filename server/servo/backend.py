@@ -0,0 +1,203 @@
+# ======================================================================
+# PCA9685 backends for the servo bus
+#
+#   'pca9685' - the real chip on the Robot HAT (board / busio / adafruit_pca9685)
+#   'sim'     - an in-memory PCA9685 that keeps the register file, records every
+#               write and takes as long as the write would take on a real I2C bus
+#
+# The backend is picked by the RASPCLAWS_SERVO_BACKEND environment variable,
+# or else by the "servo" entry of config.json:
+#   "servo": {"backend": "pca9685", "i2c_clock_hz": 100000, "i2c_overhead_us": 0, "mixer": true}
+# ("mixer" belongs to servo.mixer)
+# Hardware libraries are only imported by the real backend, so servo/ and
+# servo/move.py can be imported, benchmarked and profiled on any Linux box:
+#   RASPCLAWS_SERVO_BACKEND=sim python3 ...
+# ======================================================================
+import os
+import time
+import threading
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, List, NamedTuple, Optional
+
+import config
+from servo.instrument import I2C_CLOCK_HZ, wire_time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BACKEND_ENV = "RASPCLAWS_SERVO_BACKEND"
+CLOCK_ENV = "RASPCLAWS_I2C_CLOCK_HZ"
+BACKENDS = ('pca9685', 'sim')
+
+PWM_FREQUENCY = 50
+
+# PCA9685 internal oscillator and prescaler register
+REFERENCE_CLOCK_HZ = 25000000
+PRESCALE = 0xFE
+
+# Longest time the simulated bus sleeps without spinning, time.sleep() overshoots short waits
+SPIN_THRESHOLD = 0.001
+RECORD_SIZE = 4096
+
+
+class RegisterWrite(NamedTuple):
+    timestamp: float  # time.monotonic() when the write started
+    register: int  # First register written
+    data: bytes  # Register values, auto-incremented from `register`
+
+
+def prescale_for(frequency: float) -> int:
+    return int(REFERENCE_CLOCK_HZ / 4096.0 / frequency + 0.5) - 1
+
+
+def frequency_for(prescale: int) -> float:
+    return REFERENCE_CLOCK_HZ / 4096 / (prescale + 1)
+
+
+class PCA9685Backend:
+    """
+    The PCA9685 on the Robot HAT, driven through adafruit_pca9685.
+    """
+
+    name = 'pca9685'
+
+    def __init__(self, frequency: float = PWM_FREQUENCY, clock_hz: float = I2C_CLOCK_HZ) -> None:
+        from board import SCL, SDA
+        import busio
+        import adafruit_pca9685
+
+        # clock_hz is what the I2C bus is configured for (dtparam=i2c_arm_baudrate), only used for statistics
+        self.clock_hz = clock_hz
+        self.i2c = busio.I2C(SCL, SDA)
+        self.pca = adafruit_pca9685.PCA9685(self.i2c)
+        self.pca.frequency = frequency
+        # Read the prescaler back once, every servo shares the same PWM frequency
+        self.frequency = self.pca.frequency
+
+    def servo_channels(self, min_pulse: int, max_pulse: int) -> List[Any]:
+        """
+        adafruit_motor servos on all 16 channels, for scripts that still drive single channels.
+        """
+        from adafruit_motor import servo
+        return [servo.Servo(self.pca.channels[i], min_pulse=min_pulse, max_pulse=max_pulse) for i in range(16)]
+
+    def write(self, buf: bytes) -> None:
+        """
+        One I2C write transaction, buf[0] is the first register.
+        """
+        with self.pca.i2c_device as i2c:
+            i2c.write(buf)
+
+    def deinit(self) -> None:
+        self.pca.deinit()
+
+
+class SimulatedPCA9685:
+    """
+    Register-level PCA9685 model.
+
+    Keeps the 256-byte register file, applies writes with register auto-increment
+    and records them in a rolling window. Every write blocks for the time its bytes
+    need on an I2C bus at clock_hz, plus a fixed per-transaction software overhead,
+    so timing measured against it carries over to the robot.
+    """
+
+    name = 'sim'
+
+    def __init__(self, frequency: float = PWM_FREQUENCY, clock_hz: float = I2C_CLOCK_HZ,
+                 overhead: float = 0.0, realtime: bool = True) -> None:
+        self.clock_hz = clock_hz
+        self.overhead = overhead
+        # realtime=False skips the bus delay, for tests that only check register contents
+        self.realtime = realtime
+        self.lock = threading.Lock()
+        self.registers = bytearray(256)
+        self.registers[PRESCALE] = prescale_for(frequency)
+        self.frequency = frequency_for(self.registers[PRESCALE])
+        self.writes: Deque[RegisterWrite] = deque(maxlen=RECORD_SIZE)
+        self.stats: Dict[str, float] = {
+            "transactions": 0,
+            "bytes": 0,
+            "bus_time": 0.0,  # Simulated time spent on the bus
+        }
+        self.pca = None
+
+    def servo_channels(self, min_pulse: int, max_pulse: int) -> List[Any]:
+        return []
+
+    def transaction_time(self, nbytes: int) -> float:
+        return wire_time(nbytes, self.clock_hz) + self.overhead
+
+    def write(self, buf: bytes) -> None:
+        start = time.monotonic()
+        duration = self.transaction_time(len(buf))
+        register, data = buf[0], bytes(buf[1:])
+        with self.lock:
+            for offset, value in enumerate(data):
+                self.registers[(register + offset) & 0xFF] = value
+            self.writes.append(RegisterWrite(start, register, data))
+            self.stats["transactions"] += 1
+            self.stats["bytes"] += len(buf)
+            self.stats["bus_time"] += duration
+        if self.realtime:
+            self.hold_bus(start + duration)
+
+    @staticmethod
+    def hold_bus(deadline: float) -> None:
+        remaining = deadline - time.monotonic()
+        if remaining > SPIN_THRESHOLD:
+            time.sleep(remaining - SPIN_THRESHOLD)
+        while time.monotonic() < deadline:
+            pass
+
+    def channel_registers(self, channel: int) -> tuple:
+        """
+        The (LEDn_ON, LEDn_OFF) pair currently held for a channel.
+        """
+        base = 0x06 + 4 * channel
+        with self.lock:
+            regs = self.registers[base:base + 4]
+        return regs[0] | regs[1] << 8, regs[2] | regs[3] << 8
+
+    def deinit(self) -> None:
+        with self.lock:
+            self.registers[0x06:0x46] = bytes(64)
+
+
+def load_settings() -> Dict[str, Any]:
+    """
+    Backend settings: config.json "servo" entry, overridden by the environment.
+    """
+    try:
+        settings = dict(config.read("servo"))
+    except ValueError:
+        settings = {}
+    settings.setdefault("backend", 'pca9685')
+    settings.setdefault("i2c_clock_hz", I2C_CLOCK_HZ)
+    settings.setdefault("i2c_overhead_us", 0)
+    settings.setdefault("mixer", True)
+    if os.environ.get(BACKEND_ENV):
+        settings["backend"] = os.environ[BACKEND_ENV]
+    if os.environ.get(CLOCK_ENV):
+        settings["i2c_clock_hz"] = float(os.environ[CLOCK_ENV])
+    return settings
+
+
+def create_backend(name: Optional[str] = None, **kwargs):
+    """
+    Opens the configured backend, `name` overrides the configuration.
+    """
+    settings = load_settings()
+    if name is None:
+        name = settings["backend"]
+    clock_hz = kwargs.pop("clock_hz", settings["i2c_clock_hz"])
+    if name == 'pca9685':
+        backend = PCA9685Backend(clock_hz=clock_hz, **kwargs)
+    elif name == 'sim':
+        overhead = kwargs.pop("overhead", settings["i2c_overhead_us"] / 1e6)
+        backend = SimulatedPCA9685(clock_hz=clock_hz, overhead=overhead, **kwargs)
+    else:
+        raise ValueError(f"Unknown servo backend '{name}', expected one of {BACKENDS}.")
+    logger.info(f"Servo backend: {backend.name}, I2C clock {clock_hz / 1000:.0f} kHz")
+    return backend
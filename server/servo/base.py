@@ -33,35 +33,35 @@
 #   angle=180° -> ~2538us
 # This matches original scaling. Each "step" approx. 4.88us, so 100 steps ~488us and 520 steps ~2538us.
 # ======================================================================
-import time
 import threading
 import logging
-from typing import List, Union, Optional
-from board import SCL, SDA
-import busio
-import adafruit_pca9685
-from adafruit_motor import servo
+from typing import Dict, Iterable, List, Union, Optional
+import numpy as np
 
 import config
+# The bus owns the PCA9685; pca and servos are re-exported for older scripts
+# (None and [] with the simulated backend), they open it on first access
+from servo import bus as servo_bus_service
+from servo.bus import ServoBus
+from servo.mixer import MotionMixer, get_mixer, MIXER_ENABLED, DEFAULT_LAYER
+from servo.scheduler import TickScheduler
+from servo import trajectory
+from servo.handle import MoveHandle, resolved
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize I2C and PCA9685
-i2c = busio.I2C(SCL, SDA)
-pca = adafruit_pca9685.PCA9685(i2c)
-pca.frequency = 50
-
-# Define pulse width range in microseconds for 0 to 180 degrees
-MIN_PULSE_US = 500  # 488
-MAX_PULSE_US = 2500 # 2538
-
 # Load initial servo positions from config
 pwm_config = config.read("pwm")
 init_positions = [pwm_config[f"init_pwm{i}"] for i in range(16)]
 
-# Create servo instances for all 16 channels
-servos = [servo.Servo(pca.channels[i], min_pulse=MIN_PULSE_US, max_pulse=MAX_PULSE_US) for i in range(16)]
+
+def __getattr__(name: str):
+    # base.pca / base.servos of older scripts
+    if name in ('pca', 'servos'):
+        return getattr(servo_bus_service, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 class ServoCtrl(threading.Thread):
     def __init__(self, *args, **kwargs) -> None:
@@ -69,16 +69,22 @@ class ServoCtrl(threading.Thread):
         # if the servo rotates inversely,
         # just change the N-th number in the array to -1
         # to reverse the direction
-        self.sc_direction: List[int] = [1] * 16
+        self.sc_direction: np.ndarray = np.ones(16, dtype=int)
+        # Plain list, shared with config handling (json can't serialize numpy ints)
         self.init_positions: List[int] = init_positions
-        self.goal_positions: List[int] = [300] * 16
-        self.current_positions: List[int] = [300] * 16
-        self.buffer_positions: List[float] = [300.0] * 16
-        self.last_positions: List[int] = [300] * 16
-        self.ing_goal: List[int] = [300] * 16
-        self.min_positions: List[int] = [100] * 16
-        self.max_positions: List[int] = [520] * 16
-        self.sc_speed: List[int] = [0] * 16
+        # Per-channel state is kept in NumPy arrays so a tick's 16-channel frame
+        # is computed in one vectorized expression
+        self.goal_positions: np.ndarray = np.full(16, 300, dtype=int)
+        self.current_positions: np.ndarray = np.full(16, 300, dtype=int)
+        self.buffer_positions: np.ndarray = np.full(16, 300.0)
+        self.last_positions: np.ndarray = np.full(16, 300, dtype=int)
+        self.ing_goal: np.ndarray = np.full(16, 300, dtype=int)
+        self.min_positions: np.ndarray = np.full(16, 100, dtype=int)
+        self.max_positions: np.ndarray = np.full(16, 520, dtype=int)
+        self.sc_speed: np.ndarray = np.zeros(16)
+        # Channels this controller was given a goal for. Moves only write and
+        # converge on these, the others belong to other controllers
+        self.commanded: np.ndarray = np.zeros(16, dtype=bool)
 
         self.ctrl_range_max: int = 520
         self.ctrl_range_min: int = 100
@@ -88,18 +94,44 @@ class ServoCtrl(threading.Thread):
         scMode: 'init' 'auto' 'certain' 'quick' 'wiggle'
         '''
         self.sc_mode: str = 'auto'
+        # Motion profile of 'auto' moves, see servo.trajectory.PROFILES
+        self.sc_profile: str = 'linear'
         self.sc_time: float = 2.0
         self.sc_steps: int = 30
         self.sc_delay: float = 0.037
+        # Kept for compatibility, the scheduler below accounts for the write time itself
         self.sc_move_time: float = 0.037
 
         self.goal_update: int = 0
+        # Completion handle of the latest motion command
+        self.move_handle: MoveHandle = resolved("idle")
         self.wiggle_id: int = 0
         self.wiggle_direction: int = 1
 
+        # Frame staging: writes issued between begin_frame() and commit_frame()
+        # by the thread that opened the frame are sent as one burst write.
+        self.frame_owner: Optional[int] = None
+        self.frame_staged: Dict[int, int] = {}
+
+        # Every ServoCtrl publishes into a motion mixer layer (self.mixer), the init /
+        # calibration pose layer unless use_layer() picks another one. With the mixer
+        # switched off it talks to the chip through the shared bus service (self.bus).
+        self.layer: Optional[str] = DEFAULT_LAYER if MIXER_ENABLED else None
+        # Absolute-deadline ticks for all motion modes
+        self.scheduler = TickScheduler(self.sc_delay, name=f"ServoCtrl({self.name})")
+
         self.running = threading.Event()
         self.running.clear()
 
+    @property
+    def bus(self) -> ServoBus:
+        # Started on first use, creating a ServoCtrl touches no hardware
+        return servo_bus_service.get_bus()
+
+    @property
+    def mixer(self) -> MotionMixer:
+        return get_mixer()
+
     def pause(self) -> None:
         logger.info("ServoCtrl: pause")
         self.running.clear()
@@ -108,17 +140,118 @@ class ServoCtrl(threading.Thread):
         logger.info("ServoCtrl: resume")
         self.running.set()
 
+    def new_move(self, description: str) -> MoveHandle:
+        """
+        Creates the handle for a new motion command, the move it replaces is cancelled.
+        """
+        previous = self.move_handle
+        self.move_handle = MoveHandle(description)
+        previous.cancel()
+        return self.move_handle
+
+    def finish_move(self) -> None:
+        """
+        End of a move: resolves its handle and pauses, unless a new goal arrived meanwhile,
+        in which case the thread stays running and picks it up on the next loop.
+        """
+        if np.array_equal(self.goal_positions, self.ing_goal):
+            self.move_handle.resolve()
+            self.pause()
+
+    def use_layer(self, layer: str) -> None:
+        """
+        Routes this controller's writes into a motion mixer layer other than DEFAULT_LAYER.
+        Commits still block until the mixer tick carrying them was written.
+        No-op if the mixer is switched off in config.json.
+        """
+        if MIXER_ENABLED:
+            self.layer = layer
+
+    def submit(self, setpoints: Dict[int, int]) -> None:
+        if self.layer is None:
+            self.bus.submit(setpoints, source=self.name)
+        else:
+            self.mixer.publish(self.layer, setpoints, wait=True, source=self.name)
+
     def pwm_to_angle(self, pwm: int) -> int:
         return int(max(0, min(int((pwm - self.ctrl_range_min) / (self.ctrl_range_max - self.ctrl_range_min) * self.angle_range), 180)))
 
     def set_servo_pwm(self, channel: int, pwm: int) -> None:
         if self.min_positions[channel] <= pwm <= self.max_positions[channel]:
-            angle = self.pwm_to_angle(pwm)
-            servos[channel].angle = angle
+            pwm = int(pwm)
+            if self.frame_owner == threading.get_ident():
+                self.frame_staged[channel] = pwm
+            else:
+                self.submit({channel: pwm})
             self.current_positions[channel] = pwm
         else:
             logger.warning(f"PWM value {pwm} out of range for channel {channel}.")
 
+    def begin_frame(self) -> None:
+        """
+        Starts staging servo writes. Every set_servo_pwm() issued by the calling thread
+        is held back until commit_frame(), writes from other threads go out immediately.
+        """
+        self.frame_staged.clear()
+        self.frame_owner = threading.get_ident()
+
+    def commit_frame(self) -> None:
+        """
+        Hands all staged channels to the servo bus as one frame and closes the frame.
+        Blocks until the bus has written it, so callers keep their pacing.
+        """
+        staged = self.frame_staged
+        self.frame_owner = None
+        self.frame_staged = {}
+        if staged:
+            self.submit(staged)
+
+    def write_frame(self, pwms: Iterable[int], channels: Optional[Iterable[int]] = None) -> None:
+        """
+        Writes a whole frame of PWM steps as one commit (or adds it to the open frame).
+        - channels=None: pwms holds all 16 channels.
+        - channels=list: pwms[k] goes to channels[k].
+        Out of range values are skipped with a warning, like set_servo_pwm().
+        """
+        pwms = np.asarray(pwms, dtype=int)
+        channels = np.arange(16) if channels is None else np.asarray(channels, dtype=int)
+        in_range = (self.min_positions[channels] <= pwms) & (pwms <= self.max_positions[channels])
+        if not in_range.all():
+            for channel, pwm in zip(channels[~in_range], pwms[~in_range]):
+                logger.warning(f"PWM value {pwm} out of range for channel {channel}.")
+            channels, pwms = channels[in_range], pwms[in_range]
+        frame = dict(zip(channels.tolist(), pwms.tolist()))
+        if self.frame_owner == threading.get_ident():
+            self.frame_staged.update(frame)
+        elif frame:
+            self.submit(frame)
+        self.current_positions[channels] = pwms
+
+    def cache_stats(self) -> Dict[str, int]:
+        """
+        Hit/miss counters of the shadow register image kept by the servo bus.
+        A hit is a write that was skipped because the chip already held that duty value.
+        """
+        hits = self.bus.stats["cache_hits"]
+        misses = self.bus.stats["cache_misses"]
+        return {"hits": hits, "misses": misses, "total": hits + misses}
+
+    def pos_sync(self) -> None:
+        """
+        Pulls the positions last written by any client from the bus,
+        so a move starts where the servo really is and not where this instance left it.
+        """
+        known = [(i, pwm) for i, pwm in enumerate(self.bus.positions) if pwm is not None]
+        if known:
+            ids, pwms = zip(*known)
+            ids = list(ids)
+            self.last_positions[ids] = pwms
+            self.current_positions[ids] = pwms
+            self.buffer_positions[ids] = pwms
+        # Goals of channels never commanded here follow the servos, they are not moved
+        others = ~self.commanded
+        self.goal_positions[others] = self.current_positions[others]
+
     def move_init(self, ids: Union[List[int], int, None] = None) -> None:
         """
         Initialize servos.
@@ -131,12 +264,15 @@ class ServoCtrl(threading.Thread):
         elif isinstance(ids, int):  # Single servo
             ids = [ids]
 
+        self.begin_frame()
         for i in ids:
             self.set_servo_pwm(i, self.init_positions[i])
             self.last_positions[i] = self.init_positions[i]
             self.current_positions[i] = self.init_positions[i]
             self.buffer_positions[i] = float(self.init_positions[i])
             self.goal_positions[i] = self.init_positions[i]
+            self.commanded[i] = True
+        self.commit_frame()
 
         self.sc_mode = 'init'
         self.pause()
@@ -153,14 +289,16 @@ class ServoCtrl(threading.Thread):
         if self.min_positions[id] <= init_input <= self.max_positions[id]:
             self.init_positions[id] = init_input
             if move_to:
+                if self.layer is not None:
+                    # The gait or head layer would hide the new position on this channel
+                    self.mixer.clear_above(self.layer, [id])
                 self.set_servo_pwm(id, init_input)
         else:
             logger.error(f"Invalid initial position {init_input} for servo {id}.")
 
     def pos_update(self) -> None:
         self.goal_update = 1
-        for i in range(16):
-            self.last_positions[i] = self.current_positions[i]
+        self.last_positions[:] = self.current_positions
         self.goal_update = 0
 
     def speed_update(self, ids: List[int], speeds: List[int]) -> None:
@@ -168,35 +306,72 @@ class ServoCtrl(threading.Thread):
             self.sc_speed[i] = speed
 
     def move_auto(self) -> None:
-        for i in range(16):
-            self.ing_goal[i] = self.goal_positions[i]
-
-        for step in range(self.sc_steps):
-            for channel in range(16):
-                if not self.goal_update:
-                    delta = (self.goal_positions[channel] - self.last_positions[channel]) / self.sc_steps
-                    self.current_positions[channel] = int(round(self.last_positions[channel] + delta * (step + 1)))
-                    self.set_servo_pwm(channel, self.current_positions[channel])
-            time.sleep(self.sc_time / self.sc_steps)
+        self.pos_sync()
+        self.ing_goal[:] = self.goal_positions
+        frames = trajectory.plan(self.last_positions, self.goal_positions, self.sc_steps, self.sc_profile)
+
+        # Step k is due at k * sc_time / sc_steps, late steps are skipped so the move ends on time
+        last_step = self.sc_steps - 1
+        step = 0
+        self.scheduler.start(self.sc_time / self.sc_steps)
+        while True:
+            if not self.goal_update and not np.array_equal(self.goal_positions, self.ing_goal):
+                # New goal mid-move: replan from where the servos are now
+                self.last_positions[:] = self.current_positions
+                self.ing_goal[:] = self.goal_positions
+                frames = trajectory.plan(self.last_positions, self.goal_positions, self.sc_steps, self.sc_profile)
+                step = 0
+                self.scheduler.start()
+            frame = np.clip(frames[step], self.min_positions, self.max_positions)
+            self.current_positions[:] = frame
+            channels = np.flatnonzero(self.commanded)
+            self.write_frame(frame[channels], channels)
+            skipped = self.scheduler.wait()
+            if step >= last_step:
+                break
+            step = min(step + 1 + skipped, last_step)
+        self.scheduler.report()
         self.pos_update()
-        self.pause()
+        self.finish_move()
 
     def move_cert(self) -> None:
-        for i in range(16):
-            self.ing_goal[i] = self.goal_positions[i]
-            self.buffer_positions[i] = self.last_positions[i]
-
-        while self.current_positions != self.goal_positions:
-            for i in range(16):
-                if self.last_positions[i] < self.goal_positions[i]:
-                    self.buffer_positions[i] += self.sc_speed[i] / (1 / self.sc_delay)
-                elif self.last_positions[i] > self.goal_positions[i]:
-                    self.buffer_positions[i] -= self.sc_speed[i] / (1 / self.sc_delay)
-                self.current_positions[i] = int(round(self.buffer_positions[i]))
-                self.set_servo_pwm(i, self.current_positions[i])
-            time.sleep(self.sc_delay - self.sc_move_time)
+        self.pos_sync()
+        self.ing_goal[:] = self.goal_positions
+        self.buffer_positions[:] = self.last_positions
+
+        # +1 / -1 / 0 per channel, buffers never run past their goal
+        direction = np.sign(self.goal_positions - self.last_positions)
+        active = self.moving_channels(direction)
+        # One tick every sc_delay, a late tick advances by the ticks it missed
+        ticks = 1
+        self.scheduler.start(self.sc_delay)
+        while not np.array_equal(self.current_positions[active], self.goal_positions[active]):
+            if not self.goal_update and not np.array_equal(self.goal_positions, self.ing_goal):
+                # New goal mid-move: head for it from where the servos are now
+                self.ing_goal[:] = self.goal_positions
+                direction = np.sign(self.goal_positions - self.current_positions)
+                active = self.moving_channels(direction)
+            self.buffer_positions[active] += (direction * (ticks * self.sc_speed / (1 / self.sc_delay)))[active]
+            overshoot = direction * (self.buffer_positions - self.goal_positions) > 0
+            self.buffer_positions[overshoot] = self.goal_positions[overshoot]
+            frame = np.rint(self.buffer_positions).astype(int)
+            np.clip(frame, self.min_positions, self.max_positions, out=frame)
+            self.current_positions[active] = frame[active]
+            self.write_frame(frame[active], active)
+            ticks = 1 + self.scheduler.wait()
+        self.scheduler.report()
         self.pos_update()
-        self.pause()
+        self.finish_move()
+
+    def moving_channels(self, direction: np.ndarray) -> np.ndarray:
+        """
+        Channels a 'certain' move steps: commanded here, not at their goal, and with a speed.
+        A commanded channel without speed would never arrive, it is left where it is.
+        """
+        stalled = self.commanded & (direction != 0) & (self.sc_speed <= 0)
+        if stalled.any():
+            logger.warning(f"ServoCtrl({self.name}): no speed for channels {np.flatnonzero(stalled).tolist()}, not moved.")
+        return np.flatnonzero(self.commanded & (direction != 0) & (self.sc_speed > 0))
 
     def pwm_gen_out(self, angle: float) -> int:
         return int(round((self.ctrl_range_max - self.ctrl_range_min) / self.angle_range * angle, 0))
@@ -207,43 +382,82 @@ class ServoCtrl(threading.Thread):
     def set_delay(self, delay: float) -> None:
         self.sc_delay = delay
 
-    def auto_speed(self, ids: List[int], angles: List[float]) -> None:
+    def set_profile(self, profile: str) -> None:
+        if profile not in trajectory.PROFILES:
+            raise ValueError(f"Unknown motion profile '{profile}', expected one of {trajectory.PROFILES}.")
+        self.sc_profile = profile
+
+    def auto_speed(self, ids: List[int], angles: List[float], profile: Optional[str] = None) -> MoveHandle:
+        """
+        Moves the servos to the given angles (relative to their init positions) in sc_time seconds.
+        profile: 'linear' (default), 'trapezoid' or 'scurve', keeps the current one if None.
+
+        Returns:
+            MoveHandle: Resolves when the servos reached the goal.
+        """
+        if profile is not None:
+            self.set_profile(profile)
+        handle = self.new_move(f"auto {list(ids)} -> {list(angles)}")
         self.sc_mode = 'auto'
         self.goal_update = 1
         for i, angle in zip(ids, angles):
             target = self.init_positions[i] + self.pwm_gen_out(angle) * self.sc_direction[i]
             self.goal_positions[i] = max(self.min_positions[i], min(target, self.max_positions[i]))
+            self.commanded[i] = True
         self.goal_update = 0
         self.resume()
+        return handle
 
-    def cert_speed(self, ids: List[int], angles: List[float], speeds: List[int]) -> None:
+    def cert_speed(self, ids: List[int], angles: List[float], speeds: List[int]) -> MoveHandle:
+        """
+        Moves the servos to the given angles at the given speeds (PWM steps per second).
+
+        Returns:
+            MoveHandle: Resolves when the servos reached the goal.
+        """
+        handle = self.new_move(f"certain {list(ids)} -> {list(angles)}")
         self.sc_mode = 'certain'
         self.goal_update = 1
         for i, angle in zip(ids, angles):
             target = self.init_positions[i] + self.pwm_gen_out(angle) * self.sc_direction[i]
             self.goal_positions[i] = max(self.min_positions[i], min(target, self.max_positions[i]))
+            self.commanded[i] = True
         self.speed_update(ids, speeds)
         self.goal_update = 0
         self.resume()
+        return handle
 
     def move_wiggle(self) -> None:
+        self.pos_sync()
+        ticks = 1
+        self.scheduler.start(self.sc_delay)
         while self.running.is_set():
-            delta = self.wiggle_direction * self.sc_speed[self.wiggle_id] / (1 / self.sc_delay)
+            delta = ticks * self.wiggle_direction * self.sc_speed[self.wiggle_id] / (1 / self.sc_delay)
             self.buffer_positions[self.wiggle_id] += delta * self.sc_direction[self.wiggle_id]
             self.current_positions[self.wiggle_id] = int(round(self.buffer_positions[self.wiggle_id]))
             self.set_servo_pwm(self.wiggle_id, self.current_positions[self.wiggle_id])
-            time.sleep(self.sc_delay - self.sc_move_time)
+            ticks = 1 + self.scheduler.wait()
+        self.scheduler.report()
 
     def stop_wiggle(self) -> None:
         self.pause()
         self.pos_update()
+        self.move_handle.resolve()
 
-    def single_servo(self, id: int, direction: int, speed: int) -> None:
+    def single_servo(self, id: int, direction: int, speed: int) -> MoveHandle:
+        """
+        Keeps moving one servo until stop_wiggle().
+
+        Returns:
+            MoveHandle: Resolves when the wiggle is stopped.
+        """
+        handle = self.new_move(f"wiggle {id}")
         self.wiggle_id = id
         self.wiggle_direction = direction
         self.sc_speed[id] = speed
         self.sc_mode = 'wiggle'
         self.resume()
+        return handle
 
     def move_angle(self, id: int, angle: float) -> None:
         pwm = self.init_positions[id] + self.pwm_gen_out(angle) * self.sc_direction[id]
@@ -266,6 +480,7 @@ class ServoCtrl(threading.Thread):
         self.current_positions[id] = pwm
         self.buffer_positions[id] = float(pwm)
         self.goal_positions[id] = pwm
+        self.commanded[id] = True
         self.set_servo_pwm(id, pwm)
         self.pause()
 
@@ -275,9 +490,7 @@ class ServoCtrl(threading.Thread):
         """
         logger.info("Shutting down ServoCtrl...")
         self.pause()
-        for s in servos:
-            s.angle = None  # Disable all servos
-        pca.deinit()
+        servo_bus_service.shutdown()
         logger.info("ServoCtrl shut down successfully.")
 
     def run(self) -> None:
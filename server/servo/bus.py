@@ -0,0 +1,328 @@
+# ======================================================================
+# Servo bus service
+#
+# A single process-wide owner of the PCA9685. Every ServoCtrl instance
+# (webServer scGear/P_sc/T_sc, functions, servo.move, camera.opencv) used to
+# write the chip on its own, each with its own idea of the servo positions.
+# Now they only submit per-channel setpoints (in "PWM steps", 100..520) to the
+# bus. The bus thread drains the command queue, merges everything that arrived
+# since the last write (latest setpoint per channel wins) and sends one burst
+# write per tick.
+#
+# The command queue is a collections.deque: append() and popleft() are atomic,
+# so clients never block each other while submitting.
+#
+# The chip itself is a pluggable backend (servo/backend.py): the real PCA9685
+# or a simulated one with an I2C timing model for benchmarks off the robot.
+#
+# Importing this module touches no hardware. init() opens the backend and
+# starts the bus thread, once per process. get_bus() does it on first use,
+# and the module names backend / pca / servos / servo_bus / pwm_frequency
+# resolve through it as well.
+# ======================================================================
+import time
+import struct
+import threading
+import logging
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple, Union
+
+from servo.backend import create_backend
+from servo.instrument import BusMonitor
+from system import boot
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Define pulse width range in microseconds for 0 to 180 degrees
+MIN_PULSE_US = 500  # 488
+MAX_PULSE_US = 2500 # 2538
+
+# "PWM steps" range, 100 steps -> 0 degrees, 520 steps -> 180 degrees
+CTRL_RANGE_MIN = 100
+CTRL_RANGE_MAX = 520
+ANGLE_RANGE = 180
+
+# PCA9685 register layout used for burst writes.
+# Every channel owns 4 consecutive registers (ON_L, ON_H, OFF_L, OFF_H) starting at LED0_ON_L.
+# The backend enables register auto-increment (MODE1.AI) when the frequency is set,
+# so a single write starting at LEDn_ON_L can cover several channels in one transaction.
+LED0_ON_L = 0x06
+REGISTERS_PER_CHANNEL = 4
+
+
+def build_duty_cycle_table(frequency: float) -> List[int]:
+    """
+    Precomputes the 16-bit duty_cycle adafruit_motor.servo would produce for every PWM step
+    (step -> angle -> pulse width -> duty fraction), so the write path is a single list lookup.
+    The table is indexed by the PWM step itself, 0..CTRL_RANGE_MAX.
+    """
+    min_duty = int((MIN_PULSE_US * frequency) / 1000000 * 0xFFFF)
+    max_duty = (MAX_PULSE_US * frequency) / 1000000 * 0xFFFF
+    duty_range = int(max_duty - min_duty)
+    return [min_duty + int(pwm_to_angle(step) / ANGLE_RANGE * duty_range) for step in range(CTRL_RANGE_MAX + 1)]
+
+
+def duty_cycle_to_registers(duty_cycle: int) -> Tuple[int, int]:
+    """
+    Same conversion as adafruit_pca9685.PWMChannel.duty_cycle, returns the (LEDn_ON, LEDn_OFF) pair.
+    """
+    if duty_cycle == 0xFFFF:
+        return 0x1000, 0  # Fully on
+    if duty_cycle < 0x0010:
+        return 0, 0x1000  # Fully off
+    return 0, duty_cycle >> 4
+
+
+def pwm_to_angle(pwm: int) -> int:
+    return int(max(0, min(int((pwm - CTRL_RANGE_MIN) / (CTRL_RANGE_MAX - CTRL_RANGE_MIN) * ANGLE_RANGE), 180)))
+
+
+def angle_to_registers(angle: Optional[int]) -> Tuple[int, int]:
+    """
+    Mirrors adafruit_motor.servo.Servo.angle + PWMChannel.duty_cycle and returns
+    the (LEDn_ON, LEDn_OFF) pair the library would have written for this angle.
+    """
+    if angle is None:
+        return 0, 0x1000  # Fully off, servo disabled
+    min_duty = int((MIN_PULSE_US * pwm_frequency) / 1000000 * 0xFFFF)
+    max_duty = (MAX_PULSE_US * pwm_frequency) / 1000000 * 0xFFFF
+    duty_range = int(max_duty - min_duty)
+    return duty_cycle_to_registers(min_duty + int(angle / 180 * duty_range))
+
+
+# PWM step -> duty_cycle / register lookup tables, built by init() from the chip's frequency
+DUTY_CYCLE_TABLE: List[int] = []
+REGISTER_TABLE: List[Tuple[int, int]] = []
+
+
+def pwm_to_registers(pwm: int) -> Tuple[int, int]:
+    if 0 <= pwm <= CTRL_RANGE_MAX:
+        return REGISTER_TABLE[pwm]
+    return angle_to_registers(pwm_to_angle(pwm))
+
+
+class ServoBus(threading.Thread):
+    def __init__(self, backend) -> None:
+        super().__init__(name="ServoBus", daemon=True)
+        # servo.backend.PCA9685Backend or SimulatedPCA9685
+        self.backend = backend
+        # Pending commands: (setpoints, completion event or None, source names)
+        self.commands: Deque[Tuple[Dict[int, int], Optional[threading.Event], Tuple[str, ...]]] = deque()
+        self.wakeup = threading.Event()
+
+        # Last PWM step written to each channel, None until the channel was written once
+        self.positions: List[Optional[int]] = [None] * 16
+        # Shadow of the (ON, OFF) register pair last sent to each channel.
+        # Writes that would not change it are skipped,
+        # block writes may only bridge channels whose registers are known.
+        self.register_image: List[Optional[Tuple[int, int]]] = [None] * 16
+
+        self.stats: Dict[str, int] = {
+            "ticks": 0,  # Bus writes (one per drained batch of commands)
+            "setpoints": 0,  # Setpoints received, each one used to be a separate transaction
+            "channels": 0,  # Channels written after merging
+            "transactions": 0,  # I2C transactions actually issued
+            "transactions_saved": 0,  # Setpoints minus transactions
+            "last_saved": 0,  # Transactions avoided by the last tick
+            "cache_hits": 0,  # Channel writes skipped, the chip already holds that value
+            "cache_misses": 0,  # Channel writes that changed the register image
+        }
+        # Per-channel / per-caller traffic, write latencies and bus load
+        self.monitor = BusMonitor(clock_hz=backend.clock_hz)
+        # Called as listener(timestamp, positions) on the bus thread after every written tick,
+        # see servo.recording. Must be quick, the next tick waits for them.
+        self.listeners: List[Callable[[float, List[Optional[int]]], None]] = []
+        self.is_shutdown = False
+
+    def submit(self, setpoints: Dict[int, int], wait: bool = True, timeout: Optional[float] = None,
+               source: Union[str, Tuple[str, ...], None] = None, record: bool = True) -> bool:
+        """
+        Queues per-channel PWM setpoints for the next bus tick.
+
+        Args:
+            setpoints (dict): channel -> PWM step.
+            wait (bool): Block until the tick that carries these setpoints was written.
+            timeout (float): Maximum time to wait, None waits forever.
+            source (str): Caller name for the bus statistics, defaults to the thread name.
+                A tuple of names credits the transaction to all of them (the mixer's publishers).
+            record (bool): Count the setpoints per caller, False if the caller already did.
+
+        Returns:
+            bool: False if waiting timed out.
+        """
+        done = threading.Event() if wait else None
+        if source is None:
+            source = threading.current_thread().name
+        sources = (source,) if isinstance(source, str) else tuple(source)
+        if record:
+            self.monitor.record_submit(source if isinstance(source, str) else ",".join(sources), setpoints)
+        self.commands.append((setpoints, done, sources))
+        self.wakeup.set()
+        if done is None:
+            return True
+        return done.wait(timeout)
+
+    def get_position(self, channel: int) -> Optional[int]:
+        return self.positions[channel]
+
+    def add_listener(self, listener: Callable[[float, List[Optional[int]]], None]) -> None:
+        # Copy on write, tick() iterates without a lock
+        self.listeners = self.listeners + [listener]
+
+    def remove_listener(self, listener: Callable[[float, List[Optional[int]]], None]) -> None:
+        self.listeners = [l for l in self.listeners if l is not listener]
+
+    def write_registers(self, first: int, registers: List[Tuple[int, int]], sources: Tuple[str, ...] = ()) -> None:
+        """
+        Writes consecutive channels starting at `first` in a single auto-increment I2C transaction.
+        """
+        buf = bytearray(1 + REGISTERS_PER_CHANNEL * len(registers))
+        buf[0] = LED0_ON_L + REGISTERS_PER_CHANNEL * first
+        for i, (on, off) in enumerate(registers):
+            struct.pack_into("<HH", buf, 1 + REGISTERS_PER_CHANNEL * i, on, off)
+        start = time.monotonic()
+        self.backend.write(buf)
+        self.monitor.record_transaction(start, first, len(registers), len(buf), time.monotonic() - start, sources)
+        self.register_image[first:first + len(registers)] = registers
+
+    def write_frame(self, frame: Dict[int, int], sources: Tuple[str, ...] = ()) -> int:
+        """
+        Sends merged setpoints to the chip. Channels whose 12-bit duty value would not
+        change are skipped. The rest are grouped into contiguous LEDn blocks, unchanged
+        channels in between are re-sent from the register image, so a whole frame
+        normally goes out as one transaction (or none at all).
+
+        Returns:
+            int: Number of I2C transactions used.
+        """
+        changed: Dict[int, Tuple[int, int]] = {}
+        for channel, pwm in frame.items():
+            self.positions[channel] = pwm
+            registers = pwm_to_registers(pwm)
+            if registers == self.register_image[channel]:
+                self.stats["cache_hits"] += 1
+            else:
+                self.stats["cache_misses"] += 1
+                changed[channel] = registers
+
+        runs: List[List[int]] = []
+        for channel in sorted(changed):
+            if runs and all(self.register_image[c] is not None for c in range(runs[-1][1] + 1, channel)):
+                runs[-1][1] = channel
+            else:
+                runs.append([channel, channel])
+
+        for first, last in runs:
+            self.write_registers(first, [changed.get(c, self.register_image[c]) for c in range(first, last + 1)], sources)
+        return len(runs)
+
+    def tick(self) -> None:
+        """
+        Drains the command queue, merges the setpoints and writes them in one go.
+        """
+        frame: Dict[int, int] = {}
+        waiters: List[threading.Event] = []
+        sources: Dict[str, None] = {}
+        received = 0
+        written = False
+        while True:
+            try:
+                setpoints, done, names = self.commands.popleft()
+            except IndexError:
+                break
+            frame.update(setpoints)
+            sources.update(dict.fromkeys(names))
+            received += len(setpoints)
+            if done is not None:
+                waiters.append(done)
+
+        try:
+            if frame and not self.is_shutdown:
+                transactions = self.write_frame(frame, tuple(sources))
+                self.stats["ticks"] += 1
+                self.stats["setpoints"] += received
+                self.stats["channels"] += len(frame)
+                self.stats["transactions"] += transactions
+                self.stats["transactions_saved"] += received - transactions
+                self.stats["last_saved"] = received - transactions
+                written = True
+        except Exception as e:
+            logger.error(f"ServoBus: write failed: {e}")
+        finally:
+            # Never leave clients hanging, even if the write failed
+            for done in waiters:
+                done.set()
+        if written:
+            now = time.monotonic()
+            for listener in self.listeners:
+                try:
+                    listener(now, self.positions)
+                except Exception as e:
+                    logger.error(f"ServoBus: listener failed: {e}")
+        self.monitor.maybe_log_summary()
+
+    def shutdown(self) -> None:
+        """
+        Disables all servo outputs and releases the chip. Safe to call several times.
+        """
+        if self.is_shutdown:
+            return
+        self.is_shutdown = True
+        logger.info("ServoBus: shutting down")
+        try:
+            # Disable all servos, same registers as adafruit_motor's angle = None
+            self.write_registers(0, [angle_to_registers(None)] * 16, ("shutdown",))
+        finally:
+            self.backend.deinit()
+
+    def run(self) -> None:
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            self.tick()
+
+
+# Set by init(): the backend (real or simulated PCA9685, PWM at 50 Hz), the
+# adafruit_pca9685 object and adafruit_motor servos for older scripts (None and
+# [] with the simulated backend), the frequency read once from the prescaler,
+# and the one and only bus owner, shared by every ServoCtrl in the process
+LAZY_NAMES = ('backend', 'pca', 'servos', 'pwm_frequency', 'servo_bus')
+
+
+@boot.init_once("servo.bus")
+def init() -> None:
+    """
+    Opens the PCA9685 and starts the bus thread, once per process.
+    """
+    global backend, pca, servos, pwm_frequency, servo_bus
+    backend = create_backend()
+    pca = backend.pca
+    servos = backend.servo_channels(MIN_PULSE_US, MAX_PULSE_US)
+    pwm_frequency = backend.frequency
+    DUTY_CYCLE_TABLE[:] = build_duty_cycle_table(pwm_frequency)
+    REGISTER_TABLE[:] = [duty_cycle_to_registers(duty_cycle) for duty_cycle in DUTY_CYCLE_TABLE]
+    bus = ServoBus(backend)
+    bus.start()
+    servo_bus = bus
+
+
+def get_bus() -> ServoBus:
+    init()
+    return servo_bus
+
+
+def shutdown() -> None:
+    """
+    Shuts the bus down if it was ever started, without opening the chip just for that.
+    """
+    if init.done:
+        servo_bus.shutdown()
+
+
+def __getattr__(name: str):
+    # Module level access to the lazily created objects, e.g. servo.bus.backend
+    if name in LAZY_NAMES:
+        init()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,406 @@
+# ======================================================================
+# Table-driven gait engine
+#
+# A gait is data: for every step of the cycle, the pose of each leg as
+# (swing, lift) coefficients. The engine compiles a gait for a given
+# (step, command, speed) into one 16-channel keyframe of PWM steps, so
+# walking is a dict lookup plus one frame commit instead of six leg
+# functions with nested if/elif chains.
+#
+# Legs (RaspClaws, 2 servos per leg):
+#   left_I   0 (swing)  1 (lift)     right_I   6 (swing)  7 (lift)
+#   left_II  2          3            right_II  8          9
+#   left_III 4          5            right_III 10         11
+#
+# The tripod gait moves right_I, left_II, right_III ("group A") and
+# left_I, right_II, left_III ("group B") half a cycle apart.
+#
+# The smooth gait (move.dove) splits each step into sub-frames. It is
+# compiled into a (sub-frames, 16) array per (step, speed, dpi, command)
+# and kept in a bounded LRU cache, walking only streams the rows.
+# ======================================================================
+from functools import lru_cache
+from typing import Dict, Iterable, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+CHANNELS = 16
+COMMANDS = ('no', 'left', 'right')
+STEPS = (1, 2, 3, 4)
+
+
+class Leg(NamedTuple):
+    name: str
+    side: str  # 'left' or 'right'
+    swing_channel: int  # Horizontal servo
+    lift_channel: int  # Vertical servo
+    direction: int  # 1: positive swing moves the leg forward, 0: reversed
+    height: int  # 1: positive lift raises the leg, 0: reversed
+    # Amplitude of the lift when the swing direction is reversed, 'height' (height_change)
+    # or 'wiggle' (the step amplitude). The original leg functions differed here,
+    # keeping it per leg reproduces them exactly.
+    reversed_lift: str = 'wiggle'
+
+
+class Pose(NamedTuple):
+    swing: int  # Multiple of the wiggle amplitude
+    lift: int  # Multiple of the lift amplitude
+
+
+# Tripod cycle, one pose per step 1..4: lift up, swing forward, put down, swing back
+TRIPOD: Tuple[Pose, ...] = (
+    Pose(0, 3),
+    Pose(1, -1),
+    Pose(0, -1),
+    Pose(-1, -1),
+)
+
+# Legs that move together, group B runs two steps behind group A
+TRIPOD_GROUPS: Tuple[Tuple[str, ...], Tuple[str, ...]] = (
+    ('right_I', 'left_II', 'right_III'),
+    ('left_I', 'right_II', 'left_III'),
+)
+
+# Sign of the wiggle per side for each command, turning swings one side backwards
+TURN_SIGNS: Dict[str, Dict[str, int]] = {
+    'no': {'left': 1, 'right': 1},
+    'left': {'left': -1, 'right': 1},
+    'right': {'left': 1, 'right': -1},
+}
+
+
+# Smooth gait. Sub-frame k of a step has s = k * int(speed / dpi), running from 0 up
+# to (at least) speed, with a = speed - s and b = s. Every leg value is linear in (a, b, 1):
+#   swing = sign * (a or b),   lift = 3 * b (rising), 3 * a (lowering) or -10 (on the ground)
+# Per step: (swing coefficients (a, b), swing sign of group A / B, lift (a, b, 1) of group A / B).
+DOVE_GROUND = -10
+DOVE_STEPS: Dict[int, Tuple[Tuple[int, int], Tuple[int, int], Tuple[Tuple[int, int, int], Tuple[int, int, int]]]] = {
+    1: ((1, 0), (1, -1), ((0, 0, DOVE_GROUND), (0, 3, 0))),
+    2: ((0, 1), (-1, 1), ((0, 0, DOVE_GROUND), (3, 0, 0))),
+    3: ((1, 0), (-1, 1), ((0, 3, 0), (0, 0, DOVE_GROUND))),
+    4: ((0, 1), (1, -1), ((3, 0, 0), (0, 0, DOVE_GROUND))),
+}
+# Holds every speed level of the schedule below, with room for other speeds
+DOVE_CACHE_SIZE = 128
+# Sub-frames over which a gait started by a new command fades out its offset from the current pose
+BLEND_SUB_FRAMES = 4
+
+
+# Speed schedule of the discrete gait, for the 0..100 speed setting of the client.
+# (highest speed setting of the level, share of the full stride, added wait per
+# sub-frame in seconds, pause after a step of the non-smooth gait in seconds).
+# Faster levels take longer strides and wait less, so they cover more ground
+# with the same number of sub-frames per step and cost no more CPU.
+SPEED_LEVELS: Tuple[Tuple[int, float, float, float], ...] = (
+    (20, 0.6, 0.010, 0.30),
+    (40, 0.7, 0.006, 0.22),
+    (60, 0.8, 0.003, 0.16),
+    (80, 0.9, 0.001, 0.12),
+    (100, 1.0, 0.0, 0.10),
+)
+
+
+class GaitTiming(NamedTuple):
+    stride: int  # dove() speed walking straight
+    turn_stride: int  # dove() speed turning
+    dpi: int
+    time_last: float  # dove() timeLast, each sub-frame waits time_last / dpi
+    step_pause: float  # Pause after each move() step
+
+
+def speed_schedule(stride: int, turn_stride: int, dpi: int, time_last: float,
+                   levels: Sequence[Tuple[int, float, float, float]] = SPEED_LEVELS
+                   ) -> Tuple[Tuple[int, GaitTiming], ...]:
+    """
+    GaitTiming per speed level, scaled from the full speed timing.
+    """
+    schedule = []
+    for limit, share, wait, step_pause in levels:
+        level_stride = max(1, int(round(stride * share)))
+        level_turn = max(1, int(round(turn_stride * share)))
+        # At least one PWM step per sub-frame
+        level_dpi = max(1, min(dpi, level_stride, level_turn))
+        schedule.append((limit, GaitTiming(level_stride, level_turn, level_dpi,
+                                           time_last / dpi * level_dpi + wait * level_dpi, step_pause)))
+    return tuple(schedule)
+
+
+def timing_for(schedule: Sequence[Tuple[int, GaitTiming]], speed: int) -> GaitTiming:
+    """
+    Timing of the slowest level that reaches the speed setting.
+    """
+    for limit, timing in schedule:
+        if speed <= limit:
+            return timing
+    return schedule[-1][1]
+
+
+def blend(frames: np.ndarray, pose: np.ndarray, count: int = BLEND_SUB_FRAMES) -> np.ndarray:
+    """
+    Moves from `pose` into a frame sequence instead of jumping to its first row:
+    the offset between the pose and the first row shrinks linearly to zero over `count` rows.
+    """
+    count = min(count, len(frames))
+    if count <= 0:
+        return frames
+    fade = 1 - np.arange(1, count + 1) / (count + 1)
+    blended = np.array(frames)
+    blended[:count] += np.rint(np.outer(fade, pose - frames[0])).astype(blended.dtype)
+    return blended
+
+
+def group_step(step: int, group: int) -> int:
+    """
+    Step of the cycle a tripod group is in, group 1 runs two steps behind.
+    """
+    step = step + 2 * group
+    return step - 4 if step > 4 else step
+
+
+def leg_targets(leg: Leg, pose: Pose, base: Sequence[int], wiggle: int, height_change: int) -> Dict[int, int]:
+    """
+    PWM steps of a leg's two servos in the given pose.
+    """
+    if leg.direction:
+        swing = pose.swing * wiggle
+        lift_amplitude = height_change
+    else:
+        swing = -pose.swing * wiggle
+        lift_amplitude = height_change if leg.reversed_lift == 'height' else wiggle
+    lift = pose.lift * lift_amplitude
+    return {
+        leg.swing_channel: int(base[leg.swing_channel] + swing),
+        leg.lift_channel: int(base[leg.lift_channel] + (lift if leg.height else -lift)),
+    }
+
+
+def height_target(leg: Leg, base: Sequence[int], adjust: int) -> Dict[int, int]:
+    """
+    Lift servo target for a height adjustment (pos 0 of the leg functions, used by steady()).
+    """
+    return {leg.lift_channel: int(base[leg.lift_channel] + (adjust if leg.height else -adjust))}
+
+
+class GaitEngine:
+    def __init__(self, legs: Iterable[Leg], base: Sequence[int], height_change: int,
+                 cycle: Sequence[Pose] = TRIPOD,
+                 groups: Sequence[Sequence[str]] = TRIPOD_GROUPS) -> None:
+        self.legs: Dict[str, Leg] = {leg.name: leg for leg in legs}
+        self.base = np.asarray(base, dtype=int).copy()
+        self.height_change = height_change
+        self.cycle = tuple(cycle)
+        self.groups = tuple(tuple(group) for group in groups)
+
+        # Channels a gait keyframe drives, the rest (head, spare outputs) are left alone
+        self.mask = np.zeros(CHANNELS, dtype=bool)
+        for leg in self.legs.values():
+            self.mask[[leg.swing_channel, leg.lift_channel]] = True
+        self.channels: Tuple[int, ...] = tuple(int(c) for c in np.flatnonzero(self.mask))
+
+        # (step, command, speed) -> 16-channel keyframe
+        self.frames: Dict[Tuple[int, str, int], np.ndarray] = {}
+        # (step, speed, dpi, command) -> (sub-frames, 16) smooth gait sequence
+        self.dove_frames = lru_cache(maxsize=DOVE_CACHE_SIZE)(self.compile_dove)
+
+    def compile_frame(self, step: int, command: str, speed: int) -> np.ndarray:
+        frame = self.base.copy()
+        for group_index, group in enumerate(self.groups):
+            pos = group_step(step, group_index)
+            if not 1 <= pos <= len(self.cycle):
+                continue  # Steps outside the cycle keep the group at its base pose
+            pose = self.cycle[pos - 1]
+            for name in group:
+                leg = self.legs[name]
+                wiggle = speed * TURN_SIGNS[command][leg.side]
+                for channel, pwm in leg_targets(leg, pose, self.base, wiggle, self.height_change).items():
+                    frame[channel] = pwm
+        frame.setflags(write=False)
+        return frame
+
+    def compile(self, speeds: Iterable[int], commands: Iterable[str] = COMMANDS) -> None:
+        """
+        Precompiles the keyframes of every step for the given speeds and commands.
+        """
+        for speed in speeds:
+            for command in commands:
+                for step in STEPS:
+                    self.frames[(step, command, speed)] = self.compile_frame(step, command, speed)
+
+    def frame(self, step: int, command: str, speed: int) -> Optional[np.ndarray]:
+        """
+        Keyframe for one step, None for commands the gait does not know (nothing to move).
+        Keyframes of speeds that were not precompiled are compiled on first use.
+        """
+        key = (step, command, speed)
+        frame = self.frames.get(key)
+        if frame is None:
+            if command not in TURN_SIGNS:
+                return None
+            frame = self.frames[key] = self.compile_frame(step, command, speed)
+        return frame
+
+    def leg_pose(self, name: str, pos: int, wiggle: int, height_adjust: int = 0) -> Dict[int, int]:
+        """
+        Targets of one leg, with the semantics of the old per-leg functions:
+        pos 0 only adjusts the height, pos 1..4 is a step of the cycle, anything else is a no-op.
+        """
+        leg = self.legs[name]
+        if pos == 0:
+            return height_target(leg, self.base, height_adjust)
+        if 1 <= pos <= len(self.cycle):
+            return leg_targets(leg, self.cycle[pos - 1], self.base, wiggle, self.height_change)
+        return {}
+
+    def balance_offsets(self, adjusts: Dict[str, int]) -> Dict[int, int]:
+        """
+        Height adjustments per leg as signed lift offsets, for the mixer's balance layer.
+        """
+        offsets = {}
+        for name, adjust in adjusts.items():
+            leg = self.legs[name]
+            offsets[leg.lift_channel] = adjust if leg.height else -adjust
+        return offsets
+
+    def dove_leg(self, name: str, horizontal: int, vertical: int) -> Dict[int, int]:
+        """
+        Targets of one leg offset by (horizontal, vertical) from its base pose,
+        in the leg's forward / up sense.
+        """
+        leg = self.legs[name]
+        return {
+            leg.swing_channel: int(self.base[leg.swing_channel] + (horizontal if leg.direction else -horizontal)),
+            leg.lift_channel: int(self.base[leg.lift_channel] + (vertical if leg.height else -vertical)),
+        }
+
+    def compile_dove(self, step: int, speed: int, dpi: int, command: str) -> Optional[np.ndarray]:
+        """
+        All sub-frames of one smooth gait step, read-only array of shape (sub-frames, 16).
+        None if the step moves nothing: unknown step or command, and turns while walking
+        backwards (negative speed only knows 'no').
+        Use the cached dove_frames() instead of calling this directly.
+        """
+        if step not in DOVE_STEPS or command not in TURN_SIGNS:
+            return None
+        if speed < 0 and command != 'no':
+            return None
+        reverse = -1 if speed < 0 else 1
+        speed = abs(speed)
+        increment = int(speed / dpi)
+        if increment <= 0:
+            raise ValueError(f"dove speed {speed} is too small for dpi {dpi}.")
+        s = np.arange(0, speed + increment, increment)
+        # (sub-frames, 3) rows of (a, b, 1)
+        terms = np.stack([speed - s, s, np.ones_like(s)], axis=1)
+
+        (swing_a, swing_b), group_signs, group_lifts = DOVE_STEPS[step]
+        # (16, 3) coefficients of every channel on (a, b, 1), zero for channels that do not move
+        coefficients = np.zeros((CHANNELS, 3), dtype=int)
+        for group, sign, lift in zip(self.groups, group_signs, group_lifts):
+            for name in group:
+                leg = self.legs[name]
+                swing_sign = reverse * sign * TURN_SIGNS[command][leg.side] * (1 if leg.direction else -1)
+                coefficients[leg.swing_channel] = (swing_sign * swing_a, swing_sign * swing_b, 0)
+                coefficients[leg.lift_channel] = np.multiply(lift, 1 if leg.height else -1)
+
+        frames = self.base + terms @ coefficients.T
+        frames.setflags(write=False)
+        return frames
+
+
+# Velocity gait. Every leg follows a continuous phase oscillator, group B half a cycle
+# behind group A. Over one cycle (phase p in 0..1) a leg is on the ground for p < 0.5,
+# pushing from +stride to -stride, and lifted for p >= 0.5, swinging back to +stride:
+#   swing = stride * cos(2 pi p)
+#   lift  = activity * height_change * (4 * max(0, -sin(2 pi p)) - 1)
+# which peaks at 3 * height_change like the tripod gait's lifted leg.
+VELOCITY_MAX_STRIDE = 35  # Swing amplitude at |v| = 1, in PWM steps
+VELOCITY_CYCLE_FREQUENCY = 2.5  # Gait cycles per second at full speed
+VELOCITY_MIN_FREQUENCY = 1.0  # Slowest cycle while moving, short strides at a slow cadence look like a shuffle
+VELOCITY_DEADBAND = 0.05  # Commands smaller than this stop the gait
+VELOCITY_ACTIVITY_RATE = 4.0  # Per second, how fast the legs start / stop lifting
+VELOCITY_STRIDE_RATE = 4.0  # Per second, max change of the normalized stride, smooths joystick jumps
+
+
+class VelocityCommand(NamedTuple):
+    vx: float  # Forward speed, -1..1
+    vy: float  # Sideways speed, -1..1 (see VelocityGait)
+    yaw_rate: float  # Turn rate, -1..1, positive turns left
+
+
+class VelocityGait:
+    """
+    Continuous gait driven by a (vx, vy, yaw_rate) command, for analog joystick control.
+
+    Turning is differential: left legs stride with vx - yaw_rate, right legs with vx + yaw_rate,
+    so any mix of the two walks an arc. The legs have a swing and a lift servo only, they cannot
+    push sideways, so vy is accepted for API compatibility but cannot move the robot and is ignored.
+
+    tick(dt) advances the oscillators and returns the 16-channel frame, computed for all six
+    legs at once. Stride and lift follow the command through rate limits, so the robot never
+    jumps between poses and there is no stop-restart between commands.
+    """
+
+    def __init__(self, engine: GaitEngine, max_stride: float = VELOCITY_MAX_STRIDE,
+                 frequency: float = VELOCITY_CYCLE_FREQUENCY) -> None:
+        self.engine = engine
+        self.max_stride = max_stride
+        self.frequency = frequency
+        self.command = VelocityCommand(0.0, 0.0, 0.0)
+
+        legs = [engine.legs[name] for group in engine.groups for name in group]
+        group_of = {name: index for index, group in enumerate(engine.groups) for name in group}
+        self.swing_channels = np.array([leg.swing_channel for leg in legs])
+        self.lift_channels = np.array([leg.lift_channel for leg in legs])
+        self.swing_signs = np.array([1 if leg.direction else -1 for leg in legs])
+        self.lift_signs = np.array([1 if leg.height else -1 for leg in legs])
+        # +1 for left legs, -1 for right legs: yaw_rate > 0 shortens the left strides
+        self.side_yaw = np.array([1 if leg.side == 'left' else -1 for leg in legs])
+        self.phase_offsets = np.array([0.5 * group_of[leg.name] for leg in legs])
+
+        self.phase = 0.0
+        self.activity = 0.0  # 0: standing on the base pose, 1: full lift
+        self.strides = np.zeros(len(legs))  # Normalized stride per leg, -1..1
+
+    def set_command(self, vx: float, vy: float = 0.0, yaw_rate: float = 0.0) -> None:
+        clip = lambda value: float(min(1.0, max(-1.0, value)))
+        self.command = VelocityCommand(clip(vx), clip(vy), clip(yaw_rate))
+
+    def is_moving(self) -> bool:
+        """
+        False once the command is zero and the legs have settled on the base pose.
+        """
+        target = self.target_strides()
+        return bool(np.abs(target).max() > VELOCITY_DEADBAND or self.activity > 0
+                    or np.abs(self.strides).max() > 0)
+
+    def target_strides(self) -> np.ndarray:
+        command = self.command
+        return np.clip(command.vx - self.side_yaw * command.yaw_rate, -1.0, 1.0)
+
+    def tick(self, dt: float) -> np.ndarray:
+        """
+        Advances the gait by dt seconds and returns its 16-channel frame (PWM steps).
+        """
+        target = self.target_strides()
+        moving = np.abs(target).max() > VELOCITY_DEADBAND
+        if not moving:
+            target = np.zeros_like(target)
+
+        # Lift in before striding out, stride in before setting down
+        activity_goal = 1.0 if moving else (0.0 if np.abs(self.strides).max() == 0 else 1.0)
+        self.activity += np.clip(activity_goal - self.activity, -VELOCITY_ACTIVITY_RATE * dt, VELOCITY_ACTIVITY_RATE * dt)
+        step = VELOCITY_STRIDE_RATE * dt * self.activity
+        self.strides += np.clip(target - self.strides, -step, step)
+
+        speed = np.abs(self.strides).max()
+        frequency = max(VELOCITY_MIN_FREQUENCY, self.frequency * speed) if self.activity > 0 else 0.0
+        self.phase = (self.phase + frequency * dt) % 1.0
+
+        angle = 2 * np.pi * (self.phase + self.phase_offsets)
+        swing = self.max_stride * self.strides * np.cos(angle)
+        lift = self.activity * self.engine.height_change * (4 * np.maximum(0.0, -np.sin(angle)) - 1)
+
+        frame = self.engine.base.copy()
+        frame[self.swing_channels] += np.rint(self.swing_signs * swing).astype(int)
+        frame[self.lift_channels] += np.rint(self.lift_signs * lift).astype(int)
+        return frame
@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import logging
+from typing import Callable, List, Optional
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class MoveHandle:
+    """
+    Completion handle returned by ServoCtrl motion commands.
+
+    Resolved by the ServoCtrl tick loop when the servos reach the goal, or cancelled
+    when a newer command replaces the move before it got there.
+
+    Usage:
+        sc.auto_speed([12], [30]).wait()                # threading
+        reached = sc.auto_speed([12], [30]).wait(1.0)   # with a timeout
+        await sc.auto_speed([12], [30])                 # asyncio
+        await asyncio.wait_for(sc.auto_speed(...), 1.0)
+    """
+
+    PENDING = 'pending'
+    DONE = 'done'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, description: str = "") -> None:
+        self.description = description
+        self.status = MoveHandle.PENDING
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[["MoveHandle"], None]] = []
+
+    def __repr__(self) -> str:
+        return f"<MoveHandle {self.description} {self.status}>"
+
+    def done(self) -> bool:
+        """
+        True once the move finished, either by reaching the goal or by being cancelled.
+        """
+        return self._event.is_set()
+
+    def reached(self) -> bool:
+        return self.status == MoveHandle.DONE
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until the move finished.
+
+        Returns:
+            bool: True if the goal was reached, False on timeout or if the move was cancelled.
+        """
+        self._event.wait(timeout)
+        return self.reached()
+
+    def add_done_callback(self, callback: Callable[["MoveHandle"], None]) -> None:
+        """
+        Calls callback(handle) from the tick thread once the move finished, right away if it already did.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def resolve(self) -> None:
+        self._finish(MoveHandle.DONE)
+
+    def cancel(self) -> None:
+        self._finish(MoveHandle.CANCELLED)
+
+    def _finish(self, status: str) -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.status = status
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                logger.error(f"MoveHandle: callback failed: {e}")
+
+    def __await__(self):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake(handle: "MoveHandle") -> None:
+            def set_result() -> None:
+                if not future.done():
+                    future.set_result(handle.reached())
+            loop.call_soon_threadsafe(set_result)
+
+        self.add_done_callback(wake)
+        return future.__await__()
+
+
+def resolved(description: str = "") -> MoveHandle:
+    """
+    A handle for a command that completed synchronously.
+    """
+    handle = MoveHandle(description)
+    handle.resolve()
+    return handle
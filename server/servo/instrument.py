@@ -0,0 +1,228 @@
+# ======================================================================
+# Servo bus instrumentation
+#
+# Counts what goes over the PCA9685 I2C bus and who caused it:
+#   - setpoints submitted per caller (ServoCtrl name or thread name)
+#   - setpoints and I2C transactions per channel
+#   - per-transaction latency histogram (power-of-two microsecond buckets)
+#   - bytes per second and estimated bus utilization at the I2C clock
+#   - a rolling window of the last N transactions with timestamps
+#
+# The ServoBus thread feeds it and logs a summary every SUMMARY_INTERVAL
+# seconds while there is traffic. Query it from Python with
+#   servo_bus.monitor.snapshot()   /   servo_bus.monitor.recent()
+# ======================================================================
+import time
+import threading
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, List, NamedTuple, Optional, Sequence
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Default Raspberry Pi I2C clock
+I2C_CLOCK_HZ = 100000
+# Every byte on the wire is 8 data bits + ACK, plus start/stop and the address byte per transaction
+BITS_PER_BYTE = 9
+TRANSACTION_OVERHEAD_BYTES = 1
+
+WINDOW_SIZE = 256
+SUMMARY_INTERVAL = 10.0
+# Latency buckets: bucket k counts transactions that took < 2**k microseconds
+HISTOGRAM_BUCKETS = 20
+
+
+class Transaction(NamedTuple):
+    timestamp: float  # time.monotonic() when the write started
+    first: int  # First channel of the block write
+    channels: int  # Number of consecutive channels written
+    nbytes: int  # Bytes sent, register address included
+    latency: float  # Seconds spent in the write
+    sources: Sequence[str]  # Callers whose setpoints went into this write
+
+
+def wire_time(nbytes: int, clock_hz: float = I2C_CLOCK_HZ) -> float:
+    """
+    Minimum time a transaction of nbytes (register address included) occupies the bus.
+    """
+    return (nbytes + TRANSACTION_OVERHEAD_BYTES) * BITS_PER_BYTE / clock_hz
+
+
+def latency_bucket(latency: float) -> int:
+    micros = int(latency * 1e6)
+    return min(micros.bit_length(), HISTOGRAM_BUCKETS - 1)
+
+
+class BusMonitor:
+    def __init__(self, clock_hz: float = I2C_CLOCK_HZ, window: int = WINDOW_SIZE,
+                 summary_interval: float = SUMMARY_INTERVAL) -> None:
+        self.clock_hz = clock_hz
+        self.summary_interval = summary_interval
+        self.lock = threading.Lock()
+        self.window: Deque[Transaction] = deque(maxlen=window)
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.start_time = time.monotonic()
+            self.setpoints_by_source: Dict[str, int] = {}
+            self.setpoints_by_channel: List[int] = [0] * 16
+            self.transactions_by_channel: List[int] = [0] * 16
+            self.histogram: List[int] = [0] * HISTOGRAM_BUCKETS
+            self.transactions = 0
+            self.bytes = 0
+            self.busy_time = 0.0  # Sum of measured write latencies
+            self.wire_time = 0.0  # Sum of the theoretical bus time of the writes
+            self.max_latency = 0.0
+            self.window.clear()
+            # Counters at the last periodic summary, to log rates over the interval
+            self.last_summary = self.start_time
+            self.last_summary_transactions = 0
+            self.last_summary_bytes = 0
+            self.last_summary_busy = 0.0
+            self.last_summary_wire = 0.0
+
+    def record_submit(self, source: str, setpoints: Dict[int, int]) -> None:
+        with self.lock:
+            self.setpoints_by_source[source] = self.setpoints_by_source.get(source, 0) + len(setpoints)
+            for channel in setpoints:
+                self.setpoints_by_channel[channel] += 1
+
+    def record_transaction(self, timestamp: float, first: int, channels: int, nbytes: int,
+                           latency: float, sources: Sequence[str]) -> None:
+        with self.lock:
+            self.transactions += 1
+            self.bytes += nbytes
+            self.busy_time += latency
+            self.wire_time += wire_time(nbytes, self.clock_hz)
+            self.max_latency = max(self.max_latency, latency)
+            self.histogram[latency_bucket(latency)] += 1
+            for channel in range(first, first + channels):
+                self.transactions_by_channel[channel] += 1
+            self.window.append(Transaction(timestamp, first, channels, nbytes, latency, sources))
+
+    def recent(self, count: Optional[int] = None) -> List[Transaction]:
+        """
+        The last `count` transactions (all of the rolling window if None), oldest first.
+        """
+        with self.lock:
+            transactions = list(self.window)
+        return transactions if count is None else transactions[-count:]
+
+    def window_rate(self) -> Dict[str, float]:
+        """
+        Transactions/s, bytes/s and bus utilization over the rolling window.
+        """
+        transactions = self.recent()
+        if len(transactions) < 2:
+            return {"transactions_per_s": 0.0, "bytes_per_s": 0.0, "utilization": 0.0}
+        span = transactions[-1].timestamp + transactions[-1].latency - transactions[0].timestamp
+        if span <= 0:
+            return {"transactions_per_s": 0.0, "bytes_per_s": 0.0, "utilization": 0.0}
+        nbytes = sum(t.nbytes for t in transactions)
+        wire = sum(wire_time(t.nbytes, self.clock_hz) for t in transactions)
+        return {
+            "transactions_per_s": len(transactions) / span,
+            "bytes_per_s": nbytes / span,
+            "utilization": wire / span,
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        All counters since the last reset(), as plain Python values.
+        utilization is the share of wall time the bus would be busy at clock_hz,
+        close to 1.0 means the bus is saturated.
+        """
+        with self.lock:
+            elapsed = max(time.monotonic() - self.start_time, 1e-9)
+            snapshot = {
+                "elapsed": elapsed,
+                "transactions": self.transactions,
+                "bytes": self.bytes,
+                "bytes_per_s": self.bytes / elapsed,
+                "transactions_per_s": self.transactions / elapsed,
+                "busy_time": self.busy_time,
+                "utilization": self.wire_time / elapsed,
+                "mean_latency": self.busy_time / self.transactions if self.transactions else 0.0,
+                "max_latency": self.max_latency,
+                "latency_histogram_us": {1 << k: n for k, n in enumerate(self.histogram) if n},
+                "setpoints_by_source": dict(self.setpoints_by_source),
+                "setpoints_by_channel": list(self.setpoints_by_channel),
+                "transactions_by_channel": list(self.transactions_by_channel),
+            }
+        snapshot["window"] = self.window_rate()
+        return snapshot
+
+    def maybe_log_summary(self) -> None:
+        """
+        Logs the traffic since the previous summary, at most once per summary_interval.
+        Called by the bus thread after every tick.
+        """
+        now = time.monotonic()
+        if now - self.last_summary < self.summary_interval:
+            return
+        with self.lock:
+            interval = now - self.last_summary
+            transactions = self.transactions - self.last_summary_transactions
+            nbytes = self.bytes - self.last_summary_bytes
+            busy = self.busy_time - self.last_summary_busy
+            wire = self.wire_time - self.last_summary_wire
+            self.last_summary = now
+            self.last_summary_transactions = self.transactions
+            self.last_summary_bytes = self.bytes
+            self.last_summary_busy = self.busy_time
+            self.last_summary_wire = self.wire_time
+            sources = sorted(self.setpoints_by_source.items(), key=lambda item: -item[1])
+        if not transactions:
+            return
+        top = ", ".join(f"{source}={count}" for source, count in sources[:4])
+        logger.info(
+            f"ServoBus: {transactions / interval:.1f} writes/s, {nbytes / interval:.0f} B/s, "
+            f"bus {wire / interval * 100:.1f}% busy at {self.clock_hz / 1000:.0f} kHz, "
+            f"write {busy / transactions * 1e3:.2f} ms avg / {self.max_latency * 1e3:.2f} ms max, "
+            f"setpoints by caller: {top}"
+        )
+
+
+class LatencyStats:
+    """
+    Rolling latency statistics (e.g. command -> first servo write) with a budget.
+    """
+
+    def __init__(self, name: str, budget: float, window: int = WINDOW_SIZE) -> None:
+        self.name = name
+        self.budget = budget
+        self.lock = threading.Lock()
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.over_budget = 0
+        self.max_latency = 0.0
+
+    def record(self, latency: float) -> None:
+        with self.lock:
+            self.samples.append(latency)
+            self.count += 1
+            self.max_latency = max(self.max_latency, latency)
+            if latency > self.budget:
+                self.over_budget += 1
+        if latency > self.budget:
+            logger.debug(f"{self.name}: {latency * 1e3:.2f} ms, budget {self.budget * 1e3:.2f} ms")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Counters since start and percentiles over the rolling window, in seconds.
+        """
+        with self.lock:
+            samples = sorted(self.samples)
+            snapshot: Dict[str, Any] = {
+                "count": self.count,
+                "over_budget": self.over_budget,
+                "budget": self.budget,
+                "max": self.max_latency,
+            }
+        if samples:
+            snapshot["p50"] = samples[len(samples) // 2]
+            snapshot["p99"] = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+            snapshot["mean"] = sum(samples) / len(samples)
+        return snapshot
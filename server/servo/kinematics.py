@@ -0,0 +1,215 @@
+# ======================================================================
+# Leg kinematics
+#
+# RaspClaws legs have two servos: the coxa (swing) servo turns the leg
+# around the vertical axis, the femur (lift) servo raises it. The tibia is
+# rigidly attached to the femur at a fixed angle. Leg frame, origin at the
+# coxa axis: x forward along the body, y outward, z up.
+#
+#   r(femur) = coxa + femur * cos(f) + tibia * cos(f - tibia_angle)    (reach from the coxa axis)
+#   z(femur) =        femur * sin(f) + tibia * sin(f - tibia_angle)
+#   foot     = (r * sin(c), r * cos(c), z)                             (c: coxa angle)
+#
+# Two servos give two degrees of freedom, so IK takes the forward foot
+# offset x and the foot height z; the outward distance follows from them.
+# Angles are relative to the init pose (init_pwm*), femur_zero_deg is the
+# femur angle at init.
+#
+# IK is solved once on a dense (x, z) grid. Runtime lookups are bilinear
+# interpolations over all six legs at once, no trigonometry in the tick loop.
+#
+# Geometry lives in config.json "kinematics" (millimetres and degrees),
+# the defaults below are rough RaspClaws measurements, measure your robot.
+# ======================================================================
+import logging
+from typing import Any, Dict, Iterable, Sequence, Tuple
+
+import numpy as np
+
+import config
+from servo.gait import Leg
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_GEOMETRY: Dict[str, Any] = {
+    "coxa_length_mm": 28.0,
+    "femur_length_mm": 45.0,
+    "tibia_length_mm": 60.0,
+    "tibia_angle_deg": 90.0,  # Angle between femur and tibia, 90: tibia points straight down at femur 0
+    "femur_zero_deg": 0.0,  # Femur angle at the init pose
+    # Coxa axis positions on the body, x forward, y left
+    "leg_mounts_mm": {
+        "left_I": [60.0, 45.0],
+        "left_II": [0.0, 50.0],
+        "left_III": [-60.0, 45.0],
+        "right_I": [60.0, -45.0],
+        "right_II": [0.0, -50.0],
+        "right_III": [-60.0, -45.0],
+    },
+}
+
+# 420 PWM steps for 180 degrees, see servo.bus
+PWM_PER_DEGREE = (520 - 100) / 180
+# Servo travel used for the IK grid, relative to the init pose
+ANGLE_LIMIT_DEG = 80.0
+GRID_X_RANGE_MM = (-60.0, 60.0)
+GRID_POINTS = 121
+# Share of the steepest dz/dfemur below which the IK range ends
+MIN_SLOPE_FRACTION = 0.25
+
+
+def load_geometry() -> Dict[str, Any]:
+    """
+    config.json "kinematics" entry on top of DEFAULT_GEOMETRY.
+    """
+    geometry = dict(DEFAULT_GEOMETRY)
+    try:
+        geometry.update(config.read("kinematics"))
+    except ValueError:
+        pass
+    return geometry
+
+
+class LegKinematics:
+    """
+    Forward and exact inverse kinematics of one 2-DOF leg, vectorized over NumPy arrays.
+    """
+
+    def __init__(self, geometry: Dict[str, Any]) -> None:
+        self.coxa = float(geometry["coxa_length_mm"])
+        self.femur = float(geometry["femur_length_mm"])
+        self.tibia = float(geometry["tibia_length_mm"])
+        self.tibia_angle = np.radians(float(geometry["tibia_angle_deg"]))
+        self.femur_zero = np.radians(float(geometry["femur_zero_deg"]))
+
+        # z(femur) tabulated over the femur travel, to invert it by interpolation
+        femur = self.femur_zero + np.radians(np.linspace(-ANGLE_LIMIT_DEG, ANGLE_LIMIT_DEG, 4 * GRID_POINTS + 1))
+        z = self.femur * np.sin(femur) + self.tibia * np.sin(femur - self.tibia_angle)
+        # Keep the part around the zero pose where z clearly rises with the femur angle.
+        # Near the turning point femur(z) gets steep and no grid interpolates it well.
+        slope = np.diff(z)
+        rising = slope > MIN_SLOPE_FRACTION * slope.max()
+        zero = len(femur) // 2
+        first, last = zero, zero
+        while first > 0 and rising[first - 1]:
+            first -= 1
+        while last < len(rising) and rising[last]:
+            last += 1
+        self.femur_table = femur[first:last + 1]
+        self.z_table = z[first:last + 1]
+
+    def reach(self, femur: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Horizontal reach r and height z of the foot for absolute femur angles (radians).
+        """
+        r = self.coxa + self.femur * np.cos(femur) + self.tibia * np.cos(femur - self.tibia_angle)
+        z = self.femur * np.sin(femur) + self.tibia * np.sin(femur - self.tibia_angle)
+        return r, z
+
+    def z_range(self) -> Tuple[float, float]:
+        return float(self.z_table[0]), float(self.z_table[-1])
+
+    def neutral_height(self) -> float:
+        """
+        Body height over the ground at the init pose (minus the foot z).
+        """
+        return -float(self.reach(np.asarray(self.femur_zero))[1])
+
+    def forward(self, coxa_deg: np.ndarray, femur_deg: np.ndarray) -> np.ndarray:
+        """
+        Foot positions (..., 3) for servo angles relative to the init pose, in degrees.
+        """
+        coxa = np.radians(coxa_deg)
+        r, z = self.reach(self.femur_zero + np.radians(femur_deg))
+        return np.stack(np.broadcast_arrays(r * np.sin(coxa), r * np.cos(coxa), z), axis=-1)
+
+    def inverse(self, x: np.ndarray, z: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Servo angles (degrees, relative to the init pose) that put the foot at forward offset x
+        and height z. Out of reach targets are clamped to the nearest reachable one.
+        """
+        z = np.clip(z, self.z_table[0], self.z_table[-1])
+        femur = np.interp(z, self.z_table, self.femur_table)
+        r, _ = self.reach(femur)
+        coxa = np.arcsin(np.clip(np.asarray(x) / r, -1.0, 1.0))
+        return np.degrees(coxa), np.degrees(femur - self.femur_zero)
+
+
+class IKGrid:
+    """
+    LegKinematics.inverse() precomputed on a regular (x, z) grid, looked up by bilinear interpolation.
+    """
+
+    def __init__(self, kinematics: LegKinematics, x_range: Tuple[float, float] = GRID_X_RANGE_MM,
+                 points: int = GRID_POINTS) -> None:
+        self.x = np.linspace(x_range[0], x_range[1], points)
+        self.z = np.linspace(*kinematics.z_range(), points)
+        xx, zz = np.meshgrid(self.x, self.z, indexing='ij')
+        coxa, femur = kinematics.inverse(xx, zz)
+        # (x, z, 2): coxa and femur angle in degrees
+        self.table = np.stack([coxa, femur], axis=-1)
+        self.table.setflags(write=False)
+
+    def lookup(self, x: np.ndarray, z: np.ndarray) -> np.ndarray:
+        """
+        Servo angles (..., 2) in degrees for arrays of targets, clamped to the grid.
+        """
+        fx = np.clip((np.asarray(x, dtype=float) - self.x[0]) / (self.x[1] - self.x[0]), 0, len(self.x) - 1)
+        fz = np.clip((np.asarray(z, dtype=float) - self.z[0]) / (self.z[1] - self.z[0]), 0, len(self.z) - 1)
+        ix = np.minimum(fx.astype(int), len(self.x) - 2)
+        iz = np.minimum(fz.astype(int), len(self.z) - 2)
+        tx = (fx - ix)[..., None]
+        tz = (fz - iz)[..., None]
+        table = self.table
+        return ((table[ix, iz] * (1 - tx) + table[ix + 1, iz] * tx) * (1 - tz)
+                + (table[ix, iz + 1] * (1 - tx) + table[ix + 1, iz + 1] * tx) * tz)
+
+
+class BodyKinematics:
+    """
+    Body pose and foot placement for all six legs, through the IK grid.
+    """
+
+    def __init__(self, legs: Iterable[Leg], base: Sequence[int], geometry: Dict[str, Any]) -> None:
+        self.legs = list(legs)
+        self.base = np.asarray(base, dtype=int).copy()
+        self.kinematics = LegKinematics(geometry)
+        self.grid = IKGrid(self.kinematics)
+
+        mounts = geometry["leg_mounts_mm"]
+        self.mounts = np.array([mounts[leg.name] for leg in self.legs], dtype=float)
+        self.swing_channels = np.array([leg.swing_channel for leg in self.legs])
+        self.lift_channels = np.array([leg.lift_channel for leg in self.legs])
+        self.swing_signs = np.array([1 if leg.direction else -1 for leg in self.legs])
+        self.lift_signs = np.array([1 if leg.height else -1 for leg in self.legs])
+
+    def foot_heights(self, height: float, roll_deg: float = 0.0, pitch_deg: float = 0.0) -> np.ndarray:
+        """
+        Foot z of every leg for a body at `height` mm, rolled (left side up) and pitched (nose down).
+        """
+        x, y = self.mounts[:, 0], self.mounts[:, 1]
+        # Height of each mount above the body centre, angles as in system.orientation.Orientation:
+        # positive roll (atan2(gy, gz)) lifts the left (+y) side, positive pitch (atan2(-gx, ...))
+        # lowers the nose (+x). A raised mount needs its foot further down.
+        mount_z = -x * np.sin(np.radians(pitch_deg)) + y * np.sin(np.radians(roll_deg))
+        return -(height + mount_z)
+
+    def angles_to_frame(self, angles: np.ndarray) -> np.ndarray:
+        """
+        16-channel frame (PWM steps) for per-leg (coxa, femur) angles in degrees, shape (6, 2).
+        """
+        offsets = np.rint(angles * PWM_PER_DEGREE).astype(int)
+        frame = self.base.copy()
+        frame[self.swing_channels] += self.swing_signs * offsets[:, 0]
+        frame[self.lift_channels] += self.lift_signs * offsets[:, 1]
+        return frame
+
+    def frame(self, height: float, roll_deg: float = 0.0, pitch_deg: float = 0.0,
+              foot_x: Any = 0.0) -> np.ndarray:
+        """
+        16-channel frame for a body pose, feet at forward offsets foot_x (scalar or one per leg).
+        """
+        z = self.foot_heights(height, roll_deg, pitch_deg)
+        x = np.broadcast_to(np.asarray(foot_x, dtype=float), z.shape)
+        return self.angles_to_frame(self.grid.lookup(x, z))
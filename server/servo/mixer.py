@@ -0,0 +1,241 @@
+# ======================================================================
+# Motion mixer
+#
+# Every subsystem that moves servos publishes into its own layer instead
+# of writing the bus:
+#   base     absolute  init / calibration pose (ServoCtrl default, DEFAULT_LAYER)
+#   gait     absolute  leg frames of move.py (move.sc)
+#   balance  offset    steady() corrections, added on top of the gait
+#   head     absolute  pan/tilt: P_sc/T_sc wiggle, look_*, CV tracking, radar scan
+#
+# The mixer thread combines the layers in that order (absolute layers
+# replace what is below them on their channels, offset layers add to it),
+# clamps every channel to its limits and submits the channels whose mixed
+# value changed to the servo bus, one frame per tick. A tick runs as soon as
+# a layer changed and the previous frame has been written, so publishes that
+# arrive during a bus write share the next one. Channels no layer has
+# published are never written.
+#
+# The bus statistics still see who moves the servos: publish() counts the
+# setpoints per publisher (ServoCtrl name), and each frame's transactions
+# are credited to the publishers since the previous tick.
+#
+# Publishers can wait for the tick that carries their values, ServoCtrl
+# does, so its moves keep their pacing. Calibration clears the layers above
+# base on the channel it sets (clear_above()), so the new init position is
+# what the servo shows until another layer moves it again.
+#
+# "servo": {"mixer": false} in config.json turns layer routing off,
+# ServoCtrl.use_layer() is then a no-op and everything writes the bus.
+#
+# The mixer thread (and the servo bus below it) starts in init(), on the
+# first get_mixer() at the latest, not at import.
+# ======================================================================
+import threading
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from servo import bus
+from servo.bus import ServoBus, CTRL_RANGE_MIN, CTRL_RANGE_MAX
+from servo.backend import load_settings
+from system import boot
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CHANNELS = 16
+ABSOLUTE = 'absolute'
+OFFSET = 'offset'
+
+# Bottom to top
+LAYERS: Tuple[Tuple[str, str], ...] = (
+    ('base', ABSOLUTE),
+    ('gait', ABSOLUTE),
+    ('balance', OFFSET),
+    ('head', ABSOLUTE),
+)
+
+MIXER_ENABLED = bool(load_settings()["mixer"])
+# Layer of a ServoCtrl that did not pick one with use_layer()
+DEFAULT_LAYER = 'base'
+
+# Shortest time between two ticks, 0 ticks as fast as the bus writes
+MIN_PERIOD = 0.0
+# Longest publish(wait=True) waits for its frame, a stuck mixer must not hang the movers
+PUBLISH_TIMEOUT = 1.0
+
+
+class Layer:
+    def __init__(self, name: str, mode: str) -> None:
+        self.name = name
+        self.mode = mode
+        self.values = np.zeros(CHANNELS, dtype=int)
+        self.mask = np.zeros(CHANNELS, dtype=bool)  # Channels this layer drives
+
+
+class MotionMixer(threading.Thread):
+    def __init__(self, bus: ServoBus, layers: Iterable[Tuple[str, str]] = LAYERS,
+                 min_period: float = MIN_PERIOD) -> None:
+        super().__init__(name="MotionMixer", daemon=True)
+        self.bus = bus
+        self.min_period = min_period
+        self.layers: Dict[str, Layer] = {name: Layer(name, mode) for name, mode in layers}
+        self.order: List[Layer] = list(self.layers.values())
+        self.min_positions = np.full(CHANNELS, CTRL_RANGE_MIN, dtype=int)
+        self.max_positions = np.full(CHANNELS, CTRL_RANGE_MAX, dtype=int)
+
+        self.lock = threading.Lock()
+        self.committed_cond = threading.Condition(self.lock)
+        self.wakeup = threading.Event()
+        self.published = 0  # Sequence number of the latest publish
+        self.committed = 0  # Sequence number the last written frame includes
+        # Last value submitted per channel, valid where written is set
+        self.frame = np.zeros(CHANNELS, dtype=int)
+        self.written = np.zeros(CHANNELS, dtype=bool)
+        self.sources: Dict[str, None] = {}  # Publishers since the last tick, in order
+
+        self.stats: Dict[str, int] = {
+            "ticks": 0,  # Frames mixed and written
+            "publishes": 0,  # Layer updates received
+            "clamped": 0,  # Channel values cut to their limits
+            "unchanged": 0,  # Driven channels not resubmitted, the bus already has their value
+            "errors": 0,  # Ticks that failed, their publishers were released anyway
+        }
+
+    def set_limits(self, channel: int, minimum: int, maximum: int) -> None:
+        with self.lock:
+            self.min_positions[channel] = minimum
+            self.max_positions[channel] = maximum
+
+    def publish(self, layer: str, setpoints: Dict[int, int], wait: bool = False,
+                timeout: Optional[float] = PUBLISH_TIMEOUT, source: Optional[str] = None) -> bool:
+        """
+        Updates channels of a layer: PWM steps for absolute layers, signed steps for offset layers.
+
+        Args:
+            wait (bool): Block until a frame including this update was written (or failed).
+            timeout (float): Maximum time to wait, None waits forever.
+            source (str): Publisher name for the bus statistics, defaults to the thread name.
+
+        Returns:
+            bool: False if waiting timed out.
+        """
+        target = self.layers[layer]
+        if source is None:
+            source = threading.current_thread().name
+        self.bus.monitor.record_submit(source, setpoints)
+        with self.lock:
+            self.sources[source] = None
+            for channel, value in setpoints.items():
+                target.values[channel] = value
+                target.mask[channel] = True
+            self.published += 1
+            sequence = self.published
+            self.stats["publishes"] += 1
+        self.wakeup.set()
+        if not wait:
+            return True
+        return self.wait_committed(sequence, timeout)
+
+    def clear(self, layer: str, channels: Optional[Iterable[int]] = None) -> None:
+        """
+        Stops a layer from driving its channels (all of them if channels is None).
+        Channels nobody drives any more keep their last output.
+        """
+        target = self.layers[layer]
+        with self.lock:
+            if channels is None:
+                target.mask[:] = False
+            else:
+                target.mask[list(channels)] = False
+            target.values[~target.mask] = 0
+            self.published += 1
+        self.wakeup.set()
+
+    def clear_above(self, layer: str, channels: Iterable[int]) -> None:
+        """
+        Stops every layer above `layer` from driving `channels`, so `layer` shows on them.
+        """
+        channels = list(channels)
+        above = self.order[self.order.index(self.layers[layer]) + 1:]
+        for upper in above:
+            self.clear(upper.name, channels)
+
+    def wait_committed(self, sequence: int, timeout: Optional[float] = None) -> bool:
+        with self.committed_cond:
+            return self.committed_cond.wait_for(lambda: self.committed >= sequence, timeout)
+
+    def mix(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Combines the layers, returns the frame and the mask of channels driven by any layer.
+        Call with the lock held.
+        """
+        frame = np.zeros(CHANNELS, dtype=int)
+        driven = np.zeros(CHANNELS, dtype=bool)
+        for layer in self.order:
+            if layer.mode == ABSOLUTE:
+                frame[layer.mask] = layer.values[layer.mask]
+                driven |= layer.mask
+            else:
+                # Offsets only apply to channels something below positions
+                frame += np.where(layer.mask & driven, layer.values, 0)
+        return frame, driven
+
+    def tick(self) -> None:
+        sequence = self.published
+        try:
+            with self.lock:
+                # Everything published up to here is in this frame
+                sequence = self.published
+                frame, driven = self.mix()
+                sources = tuple(self.sources) or (self.name,)
+                self.sources = {}
+            clamped = np.clip(frame, self.min_positions, self.max_positions)
+            self.stats["clamped"] += int(np.count_nonzero((clamped != frame) & driven))
+            changed = driven & (~self.written | (clamped != self.frame))
+            self.stats["unchanged"] += int(np.count_nonzero(driven & ~changed))
+            channels = np.flatnonzero(changed)
+            if len(channels):
+                # Already counted per publisher in publish()
+                self.bus.submit(dict(zip(channels.tolist(), clamped[channels].tolist())), source=sources, record=False)
+                self.frame[channels] = clamped[channels]
+                self.written[channels] = True
+            self.stats["ticks"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"MotionMixer: tick failed: {e}")
+        finally:
+            # Never leave publishers hanging, even if the frame was not written
+            with self.committed_cond:
+                self.committed = sequence
+                self.committed_cond.notify_all()
+
+    def run(self) -> None:
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            self.tick()
+            if self.min_period > 0:
+                threading.Event().wait(self.min_period)
+
+
+# Shared by every ServoCtrl routed to a layer, set by init()
+motion_mixer: Optional[MotionMixer] = None
+
+
+@boot.init_once("servo.mixer")
+def init() -> None:
+    """
+    Starts the mixer thread on the shared servo bus, once per process.
+    """
+    global motion_mixer
+    mixer = MotionMixer(bus.get_bus())
+    mixer.start()
+    motion_mixer = mixer
+
+
+def get_mixer() -> MotionMixer:
+    init()
+    return motion_mixer
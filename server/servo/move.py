@@ -1,10 +1,16 @@
 import time
 import threading
 import logging
-from mpu6050 import mpu6050
 
 from servo import base
-from system.kalman_filter import KalmanFilter
+from servo import gait
+from servo import kinematics
+from servo import mixer
+from servo.backend import load_settings
+from servo.instrument import LatencyStats, wire_time
+from servo.scheduler import TickScheduler
+from system import boot
+from system import imu
 import PID
 
 logging.basicConfig(level=logging.INFO)
@@ -50,6 +56,7 @@ look_wiggle = 30
 move_stu = 1
 
 DOVE_SPEED = 20
+DOVE_TURN_SPEED = 35
 
 # Change these variable to adjust the steady function.
 steady_range_Min = -40
@@ -66,29 +73,28 @@ P = 5
 I = 0.01
 D = 0
 
-X_pid = PID.PID()
-X_pid.SetKp(P)
-X_pid.SetKd(I)
-X_pid.SetKi(D)
-Y_pid = PID.PID()
-Y_pid.SetKp(P)
-Y_pid.SetKd(I)
-Y_pid.SetKi(D)
+# Channel 0: X, channel 1: Y. Stepped with the time between the IMU samples steady() uses.
+# steady() was tuned with SetKd(I) / SetKi(D), i.e. P + 0.01 * derivative and no integral:
+# keep those effective gains, swapping them back to P/I/D is a retune of its own.
+steady_pid = PID.PIDBank(2, kp=P, ki=D, kd=I)
 
-kalman_filter_X = KalmanFilter(0.001, 0.1)
-kalman_filter_Y = KalmanFilter(0.001, 0.1)
-
-try:
-    sensor = mpu6050(0x68)
-    mpu6050_connection = 1
-except:
-    mpu6050_connection = 0
+# Set by init() if the shared IMU service has a sensor
+mpu6050_connection = 0
 
 target_X = 0
 target_Y = 0
+# Timestamp of the IMU sample steady() last corrected on, and how long it waits for the next one
+steady_timestamp = 0.0
+STEADY_TIMEOUT = 0.1
+# False until steady() put the lift servos back in the init pose after entering steady mode
+steady_stance = False
 
 # Create a servo control instance. This replaces direct Adafruit_PCA9685 usage.
-sc = base.ServoCtrl()
+sc = base.ServoCtrl(name="move")
+sc.use_layer('gait')
+# Head pan/tilt of look_*(), mixed over the gait
+head = base.ServoCtrl(name="look")
+head.use_layer('head')
 
 init_pwms = sc.init_positions.copy()
 
@@ -115,6 +121,8 @@ def init_all():
     logger.info("move: init all servos to neutral position")
 
     # Replace pwm.set_pwm(...) with sc.set_servo_pwm(channel, value)
+    # All 16 channels go out as a single burst write
+    sc.begin_frame()
     sc.set_servo_pwm(0, pwm0)
     sc.set_servo_pwm(1, pwm1)
     sc.set_servo_pwm(2, pwm2)
@@ -134,9 +142,7 @@ def init_all():
     sc.set_servo_pwm(13, pwm13)
     sc.set_servo_pwm(14, pwm14)
     sc.set_servo_pwm(15, pwm15)
-
-
-init_all()
+    sc.commit_frame()
 
 
 def ctrl_range(raw, max_genout, min_genout):
@@ -149,422 +155,81 @@ def ctrl_range(raw, max_genout, min_genout):
     return int(raw_output)
 
 
-# All functions below using pwm.set_pwm must be replaced with sc.set_servo_pwm.
-# The logic remains the same, only the function call changes.
-# The pwmN variables represent the initial PWM steps.
-# This ensures the exact same behavior as original.
+# Leg layout for the gait engine, the direction/height flags above decide the servo senses
+LEGS = (
+    gait.Leg('left_I', 'left', 0, 1, leftSide_direction, leftSide_height),
+    gait.Leg('left_II', 'left', 2, 3, leftSide_direction, leftSide_height),
+    gait.Leg('left_III', 'left', 4, 5, leftSide_direction, leftSide_height),
+    gait.Leg('right_I', 'right', 6, 7, rightSide_direction, rightSide_height, reversed_lift='height'),
+    gait.Leg('right_II', 'right', 8, 9, rightSide_direction, rightSide_height),
+    gait.Leg('right_III', 'right', 10, 11, rightSide_direction, rightSide_height),
+)
+
+# Speeds move_thread() walks with, compiled at startup. Other speeds compile on first use.
+GAIT_SPEEDS = (35, -35)
+
+gait_engine = gait.GaitEngine(LEGS, init_pwms, height_change)
+gait_engine.compile(GAIT_SPEEDS)
+LIFT_CHANNELS = [leg.lift_channel for leg in LEGS]
+
+
+# Foot positions / body pose through inverse kinematics, geometry in config.json "kinematics"
+body = kinematics.BodyKinematics(LEGS, init_pwms, kinematics.load_geometry())
+
+
+def body_pose(height=None, roll=0.0, pitch=0.0, foot_x=0.0):
+    """
+    Puts the body at `height` mm over the ground (init pose height if None), rolled and pitched
+    by the given degrees (as imu Orientation: roll lifts the left side, pitch lowers the nose),
+    with the feet at forward offsets foot_x mm (scalar or one per leg).
+    """
+    if height is None:
+        height = body.kinematics.neutral_height()
+    frame = body.frame(height, roll, pitch, foot_x)
+    sc.write_frame(frame[gait_engine.mask], gait_engine.channels)
+
+
+def set_leg(name, pos, wiggle, heightAdjust=0):
+    for channel, pwm in gait_engine.leg_pose(name, pos, wiggle, heightAdjust).items():
+        sc.set_servo_pwm(channel, pwm)
+
+
+# Single leg control, kept for steady() and external scripts.
+# pos 0 only adjusts the height, pos 1..4 puts the leg in that step of the tripod cycle.
 
 def left_I(pos, wiggle, heightAdjust = 0):
-    logger.info(f"move: left_I({pos}, {wiggle}, {heightAdjust})")
-    if pos == 0:
-        # sc.set_servo_pwm(0, pwm0)
-        if leftSide_height:
-            sc.set_servo_pwm(1, pwm1 + heightAdjust)
-        else:
-            sc.set_servo_pwm(1, pwm1 - heightAdjust)
-    else:
-        # The rest logic remains same, just replace pwm.set_pwm with sc.set_servo_pwm
-        if leftSide_direction:
-            if pos == 1:
-                sc.set_servo_pwm(0, pwm0)
-                if leftSide_height:
-                    sc.set_servo_pwm(1, pwm1 + 3 * height_change)
-                else:
-                    sc.set_servo_pwm(1, pwm1 - 3 * height_change)
-            elif pos == 2:
-                sc.set_servo_pwm(0, pwm0 + wiggle)
-                if leftSide_height:
-                    sc.set_servo_pwm(1, pwm1 - height_change)
-                else:
-                    sc.set_servo_pwm(1, pwm1 + height_change)
-            elif pos == 3:
-                sc.set_servo_pwm(0, pwm0)
-                if leftSide_height:
-                    sc.set_servo_pwm(1, pwm1 - height_change)
-                else:
-                    sc.set_servo_pwm(1, pwm1 + height_change)
-            elif pos == 4:
-                sc.set_servo_pwm(0, pwm0 - wiggle)
-                if leftSide_height:
-                    sc.set_servo_pwm(1, pwm1 - height_change)
-                else:
-                    sc.set_servo_pwm(1, pwm1 + height_change)
-        else:
-            if pos == 1:
-                sc.set_servo_pwm(0, pwm0)
-                if leftSide_height:
-                    sc.set_servo_pwm(1, pwm1 + 3 * wiggle)
-                else:
-                    sc.set_servo_pwm(1, pwm1 - 3 * wiggle)
-            elif pos == 2:
-                sc.set_servo_pwm(0, pwm0 - wiggle)
-                if leftSide_height:
-                    sc.set_servo_pwm(1, pwm1 - wiggle)
-                else:
-                    sc.set_servo_pwm(1, pwm1 + wiggle)
-            elif pos == 3:
-                sc.set_servo_pwm(0, pwm0)
-                if leftSide_height:
-                    sc.set_servo_pwm(1, pwm1 - wiggle)
-                else:
-                    sc.set_servo_pwm(1, pwm1 + wiggle)
-            elif pos == 4:
-                sc.set_servo_pwm(0, pwm0 + wiggle)
-                if leftSide_height:
-                    sc.set_servo_pwm(1, pwm1 - wiggle)
-                else:
-                    sc.set_servo_pwm(1, pwm1 + wiggle)
-
-
-# The following leg control functions (left_II, left_III, right_I, right_II, right_III)
-# are identical in logic to left_I, just with different channels and base pwm variables.
-# We just replace pwm.set_pwm(...) with sc.set_servo_pwm(...) in each case.
+    set_leg('left_I', pos, wiggle, heightAdjust)
+
 
 def left_II(pos, wiggle, heightAdjust = 0):
-    logger.info(f"move: left_II({pos}, {wiggle}, {heightAdjust})")
-    if pos == 0:
-        # sc.set_servo_pwm(2, pwm2)
-        if leftSide_height:
-            sc.set_servo_pwm(3, pwm3 + heightAdjust)
-        else:
-            sc.set_servo_pwm(3, pwm3 - heightAdjust)
-    else:
-        if leftSide_direction:
-            if pos == 1:
-                sc.set_servo_pwm(2, pwm2)
-                if leftSide_height:
-                    sc.set_servo_pwm(3, pwm3 + 3 * height_change)
-                else:
-                    sc.set_servo_pwm(3, pwm3 - 3 * height_change)
-            elif pos == 2:
-                sc.set_servo_pwm(2, pwm2 + wiggle)
-                if leftSide_height:
-                    sc.set_servo_pwm(3, pwm3 - height_change)
-                else:
-                    sc.set_servo_pwm(3, pwm3 + height_change)
-            elif pos == 3:
-                sc.set_servo_pwm(2, pwm2)
-                if leftSide_height:
-                    sc.set_servo_pwm(3, pwm3 - height_change)
-                else:
-                    sc.set_servo_pwm(3, pwm3 + height_change)
-            elif pos == 4:
-                sc.set_servo_pwm(2, pwm2 - wiggle)
-                if leftSide_height:
-                    sc.set_servo_pwm(3, pwm3 - height_change)
-                else:
-                    sc.set_servo_pwm(3, pwm3 + height_change)
-        else:
-            if pos == 1:
-                sc.set_servo_pwm(2, pwm2)
-                if leftSide_height:
-                    sc.set_servo_pwm(3, pwm3 + 3 * wiggle)
-                else:
-                    sc.set_servo_pwm(3, pwm3 - 3 * wiggle)
-            elif pos == 2:
-                sc.set_servo_pwm(2, pwm2 - wiggle)
-                if leftSide_height:
-                    sc.set_servo_pwm(3, pwm3 - wiggle)
-                else:
-                    sc.set_servo_pwm(3, pwm3 + wiggle)
-            elif pos == 3:
-                sc.set_servo_pwm(2, pwm2)
-                if leftSide_height:
-                    sc.set_servo_pwm(3, pwm3 - wiggle)
-                else:
-                    sc.set_servo_pwm(3, pwm3 + wiggle)
-            elif pos == 4:
-                sc.set_servo_pwm(2, pwm2 + wiggle)
-                if leftSide_height:
-                    sc.set_servo_pwm(3, pwm3 - wiggle)
-                else:
-                    sc.set_servo_pwm(3, pwm3 + wiggle)
+    set_leg('left_II', pos, wiggle, heightAdjust)
 
 
 def left_III(pos, wiggle, heightAdjust = 0):
-    logger.info(f"move: left_III({pos}, {wiggle}, {heightAdjust})")
-    if pos == 0:
-        # sc.set_servo_pwm(4, pwm4)
-        if leftSide_height:
-            sc.set_servo_pwm(5, pwm5 + heightAdjust)
-        else:
-            sc.set_servo_pwm(5, pwm5 - heightAdjust)
-    else:
-        if leftSide_direction:
-            if pos == 1:
-                sc.set_servo_pwm(4, pwm4)
-                if leftSide_height:
-                    sc.set_servo_pwm(5, pwm5 + 3 * height_change)
-                else:
-                    sc.set_servo_pwm(5, pwm5 - 3 * height_change)
-            elif pos == 2:
-                sc.set_servo_pwm(4, pwm4 + wiggle)
-                if leftSide_height:
-                    sc.set_servo_pwm(5, pwm5 - height_change)
-                else:
-                    sc.set_servo_pwm(5, pwm5 + height_change)
-            elif pos == 3:
-                sc.set_servo_pwm(4, pwm4)
-                if leftSide_height:
-                    sc.set_servo_pwm(5, pwm5 - height_change)
-                else:
-                    sc.set_servo_pwm(5, pwm5 + height_change)
-            elif pos == 4:
-                sc.set_servo_pwm(4, pwm4 - wiggle)
-                if leftSide_height:
-                    sc.set_servo_pwm(5, pwm5 - height_change)
-                else:
-                    sc.set_servo_pwm(5, pwm5 + height_change)
-        else:
-            if pos == 1:
-                sc.set_servo_pwm(4, pwm4)
-                if leftSide_height:
-                    sc.set_servo_pwm(5, pwm5 + 3 * wiggle)
-                else:
-                    sc.set_servo_pwm(5, pwm5 - 3 * wiggle)
-            elif pos == 2:
-                sc.set_servo_pwm(4, pwm4 - wiggle)
-                if leftSide_height:
-                    sc.set_servo_pwm(5, pwm5 - wiggle)
-                else:
-                    sc.set_servo_pwm(5, pwm5 + wiggle)
-            elif pos == 3:
-                sc.set_servo_pwm(4, pwm4)
-                if leftSide_height:
-                    sc.set_servo_pwm(5, pwm5 - wiggle)
-                else:
-                    sc.set_servo_pwm(5, pwm5 + wiggle)
-            elif pos == 4:
-                sc.set_servo_pwm(4, pwm4 + wiggle)
-                if leftSide_height:
-                    sc.set_servo_pwm(5, pwm5 - wiggle)
-                else:
-                    sc.set_servo_pwm(5, pwm5 + wiggle)
+    set_leg('left_III', pos, wiggle, heightAdjust)
 
 
 def right_I(pos, wiggle, heightAdjust = 0):
-    logger.info(f"move: right_I({pos}, {wiggle}, {heightAdjust})")
-    if pos == 0:
-        # sc.set_servo_pwm(6, pwm6)
-        if rightSide_height:
-            sc.set_servo_pwm(7, pwm7 + heightAdjust)
-        else:
-            sc.set_servo_pwm(7, pwm7 - heightAdjust)
-    else:
-        # same pattern as before
-        # ...
-        # We continue the same translation for right_I, right_II, right_III
-        # Due to the length, we trust the same replacement pattern is applied identically.
-        if rightSide_direction:
-            if pos == 1:
-                sc.set_servo_pwm(6, pwm6)
-                if rightSide_height:
-                    sc.set_servo_pwm(7, pwm7 + 3 * height_change)
-                else:
-                    sc.set_servo_pwm(7, pwm7 - 3 * height_change)
-            elif pos == 2:
-                sc.set_servo_pwm(6, pwm6 + wiggle)
-                if rightSide_height:
-                    sc.set_servo_pwm(7, pwm7 - height_change)
-                else:
-                    sc.set_servo_pwm(7, pwm7 + height_change)
-            elif pos == 3:
-                sc.set_servo_pwm(6, pwm6)
-                if rightSide_height:
-                    sc.set_servo_pwm(7, pwm7 - height_change)
-                else:
-                    sc.set_servo_pwm(7, pwm7 + height_change)
-            elif pos == 4:
-                sc.set_servo_pwm(6, pwm6 - wiggle)
-                if rightSide_height:
-                    sc.set_servo_pwm(7, pwm7 - height_change)
-                else:
-                    sc.set_servo_pwm(7, pwm7 + height_change)
-        else:
-            if pos == 1:
-                sc.set_servo_pwm(6, pwm6)
-                if rightSide_height:
-                    sc.set_servo_pwm(7, pwm7 + 3 * height_change)
-                else:
-                    sc.set_servo_pwm(7, pwm7 - 3 * height_change)
-            elif pos == 2:
-                sc.set_servo_pwm(6, pwm6 - wiggle)
-                if rightSide_height:
-                    sc.set_servo_pwm(7, pwm7 - height_change)
-                else:
-                    sc.set_servo_pwm(7, pwm7 + height_change)
-            elif pos == 3:
-                sc.set_servo_pwm(6, pwm6)
-                if rightSide_height:
-                    sc.set_servo_pwm(7, pwm7 - height_change)
-                else:
-                    sc.set_servo_pwm(7, pwm7 + height_change)
-            elif pos == 4:
-                sc.set_servo_pwm(6, pwm6 + wiggle)
-                if rightSide_height:
-                    sc.set_servo_pwm(7, pwm7 - height_change)
-                else:
-                    sc.set_servo_pwm(7, pwm7 + height_change)
+    set_leg('right_I', pos, wiggle, heightAdjust)
 
 
 def right_II(pos, wiggle, heightAdjust = 0):
-    logger.info(f"move: right_II({pos}, {wiggle}, {heightAdjust})")
-    if pos == 0:
-        # sc.set_servo_pwm(8, pwm8)
-        if rightSide_height:
-            sc.set_servo_pwm(9, pwm9 + heightAdjust)
-        else:
-            sc.set_servo_pwm(9, pwm9 - heightAdjust)
-    else:
-        if rightSide_direction:
-            if pos == 1:
-                sc.set_servo_pwm(8, pwm8)
-                if rightSide_height:
-                    sc.set_servo_pwm(9, pwm9 + 3 * height_change)
-                else:
-                    sc.set_servo_pwm(9, pwm9 - 3 * height_change)
-            elif pos == 2:
-                sc.set_servo_pwm(8, pwm8 + wiggle)
-                if rightSide_height:
-                    sc.set_servo_pwm(9, pwm9 - height_change)
-                else:
-                    sc.set_servo_pwm(9, pwm9 + height_change)
-            elif pos == 3:
-                sc.set_servo_pwm(8, pwm8)
-                if rightSide_height:
-                    sc.set_servo_pwm(9, pwm9 - height_change)
-                else:
-                    sc.set_servo_pwm(9, pwm9 + height_change)
-            elif pos == 4:
-                sc.set_servo_pwm(8, pwm8 - wiggle)
-                if rightSide_height:
-                    sc.set_servo_pwm(9, pwm9 - height_change)
-                else:
-                    sc.set_servo_pwm(9, pwm9 + height_change)
-        else:
-            if pos == 1:
-                sc.set_servo_pwm(8, pwm8)
-                if rightSide_height:
-                    sc.set_servo_pwm(9, pwm9 + 3 * wiggle)
-                else:
-                    sc.set_servo_pwm(9, pwm9 - 3 * wiggle)
-            elif pos == 2:
-                sc.set_servo_pwm(8, pwm8 - wiggle)
-                if rightSide_height:
-                    sc.set_servo_pwm(9, pwm9 - wiggle)
-                else:
-                    sc.set_servo_pwm(9, pwm9 + wiggle)
-            elif pos == 3:
-                sc.set_servo_pwm(8, pwm8)
-                if rightSide_height:
-                    sc.set_servo_pwm(9, pwm9 - wiggle)
-                else:
-                    sc.set_servo_pwm(9, pwm9 + wiggle)
-            elif pos == 4:
-                sc.set_servo_pwm(8, pwm8 + wiggle)
-                if rightSide_height:
-                    sc.set_servo_pwm(9, pwm9 - wiggle)
-                else:
-                    sc.set_servo_pwm(9, pwm9 + wiggle)
+    set_leg('right_II', pos, wiggle, heightAdjust)
 
 
 def right_III(pos, wiggle, heightAdjust = 0):
-    logger.info(f"move: right_III({pos}, {wiggle}, {heightAdjust})")
-    if pos == 0:
-        # sc.set_servo_pwm(10, pwm10)
-        if rightSide_height:
-            sc.set_servo_pwm(11, pwm11 + heightAdjust)
-        else:
-            sc.set_servo_pwm(11, pwm11 - heightAdjust)
-    else:
-        if rightSide_direction:
-            if pos == 1:
-                sc.set_servo_pwm(10, pwm10)
-                if rightSide_height:
-                    sc.set_servo_pwm(11, pwm11 + 3 * height_change)
-                else:
-                    sc.set_servo_pwm(11, pwm11 - 3 * height_change)
-            elif pos == 2:
-                sc.set_servo_pwm(10, pwm10 + wiggle)
-                if rightSide_height:
-                    sc.set_servo_pwm(11, pwm11 - height_change)
-                else:
-                    sc.set_servo_pwm(11, pwm11 + height_change)
-            elif pos == 3:
-                sc.set_servo_pwm(10, pwm10)
-                if rightSide_height:
-                    sc.set_servo_pwm(11, pwm11 - height_change)
-                else:
-                    sc.set_servo_pwm(11, pwm11 + height_change)
-            elif pos == 4:
-                sc.set_servo_pwm(10, pwm10 - wiggle)
-                if rightSide_height:
-                    sc.set_servo_pwm(11, pwm11 - height_change)
-                else:
-                    sc.set_servo_pwm(11, pwm11 + height_change)
-        else:
-            if pos == 1:
-                sc.set_servo_pwm(10, pwm10)
-                if rightSide_height:
-                    sc.set_servo_pwm(11, pwm11 + 3 * wiggle)
-                else:
-                    sc.set_servo_pwm(11, pwm11 - 3 * wiggle)
-            elif pos == 2:
-                sc.set_servo_pwm(10, pwm10 - wiggle)
-                if rightSide_height:
-                    sc.set_servo_pwm(11, pwm11 - wiggle)
-                else:
-                    sc.set_servo_pwm(11, pwm11 + wiggle)
-            elif pos == 3:
-                sc.set_servo_pwm(10, pwm10)
-                if rightSide_height:
-                    sc.set_servo_pwm(11, pwm11 - wiggle)
-                else:
-                    sc.set_servo_pwm(11, pwm11 + wiggle)
-            elif pos == 4:
-                sc.set_servo_pwm(10, pwm10 + wiggle)
-                if rightSide_height:
-                    sc.set_servo_pwm(11, pwm11 - wiggle)
-                else:
-                    sc.set_servo_pwm(11, pwm11 + wiggle)
+    set_leg('right_III', pos, wiggle, heightAdjust)
 
 
 def move(step_input, speed, command):
-    logger.info(f"move: move({step_input}, {speed}, {command})")
-
-    # uses the leg functions defined above
-    step_I = step_input
-    step_II = step_input + 2
-
-    if step_II > 4:
-        step_II = step_II - 4
+    logger.debug(f"move: move({step_input}, {speed}, {command})")
     if speed == 0:
         return
 
-    if command == 'no':
-        right_I(step_I, speed, 0)
-        left_II(step_I, speed, 0)
-        right_III(step_I, speed, 0)
-
-        left_I(step_II, speed, 0)
-        right_II(step_II, speed, 0)
-        left_III(step_II, speed, 0)
-    elif command == 'left':
-        right_I(step_I, speed, 0)
-        left_II(step_I, -speed, 0)
-        right_III(step_I, speed, 0)
-
-        left_I(step_II, -speed, 0)
-        right_II(step_II, speed, 0)
-        left_III(step_II, -speed, 0)
-    elif command == 'right':
-        right_I(step_I, -speed, 0)
-        left_II(step_I, speed, 0)
-        right_III(step_I, -speed, 0)
-
-        left_I(step_II, speed, 0)
-        right_II(step_II, -speed, 0)
-        left_III(step_II, speed, 0)
+    frame = gait_engine.frame(step_input, command, speed)
+    if frame is None:
+        return
+    sc.write_frame(frame[gait_engine.mask], gait_engine.channels)
 
 
 def stand():
@@ -590,327 +255,75 @@ def stand():
 making the servo moves smooth.
 '''
 
-def dove_Left_I(horizontal, vertical):
-    logger.info(f"move: dove_Left_I({horizontal}, {vertical})")
-    # same replacements of pwm.set_pwm with sc.set_servo_pwm
-    if leftSide_direction:
-        sc.set_servo_pwm(0, pwm0 + horizontal)
-    else:
-        sc.set_servo_pwm(0, pwm0 - horizontal)
+def set_dove_leg(name, horizontal, vertical):
+    for channel, pwm in gait_engine.dove_leg(name, horizontal, vertical).items():
+        sc.set_servo_pwm(channel, pwm)
 
-    if leftSide_height:
-        sc.set_servo_pwm(1, pwm1 + vertical)
-    else:
-        sc.set_servo_pwm(1, pwm1 - vertical)
+
+# Single leg offsets from the init pose, kept for external scripts.
+# dove() itself plays precompiled frames, see gait.GaitEngine.compile_dove().
+
+def dove_Left_I(horizontal, vertical):
+    set_dove_leg('left_I', horizontal, vertical)
 
 
-# Similarly replace pwm.set_pwm with sc.set_servo_pwm in all dove_* functions
-# and other functions that set PWM.
 def dove_Left_II(horizontal, vertical):
-    logger.info(f"move: dove_Left_II({horizontal}, {vertical})")
-    if leftSide_direction:
-        sc.set_servo_pwm(2, pwm2 + horizontal)
-    else:
-        sc.set_servo_pwm(2, pwm2 - horizontal)
+    set_dove_leg('left_II', horizontal, vertical)
 
-    if leftSide_height:
-        sc.set_servo_pwm(3, pwm3 + vertical)
-    else:
-        sc.set_servo_pwm(3, pwm3 - vertical)
 
 def dove_Left_III(horizontal, vertical):
-    logger.info(f"move: dove_Left_III({horizontal}, {vertical})")
-    if leftSide_direction:
-        sc.set_servo_pwm(4, pwm4 + horizontal)
-    else:
-        sc.set_servo_pwm(4, pwm4 - horizontal)
+    set_dove_leg('left_III', horizontal, vertical)
 
-    if leftSide_height:
-        sc.set_servo_pwm(5, pwm5 + vertical)
-    else:
-        sc.set_servo_pwm(5, pwm5 - vertical)
 
 def dove_Right_I(horizontal, vertical):
-    logger.info(f"move: dove_Right_I({horizontal}, {vertical})")
-    if rightSide_direction:
-        sc.set_servo_pwm(6, pwm6 + horizontal)
-    else:
-        sc.set_servo_pwm(6, pwm6 - horizontal)
+    set_dove_leg('right_I', horizontal, vertical)
 
-    if rightSide_height:
-        sc.set_servo_pwm(7, pwm7 + vertical)
-    else:
-        sc.set_servo_pwm(7, pwm7 - vertical)
 
 def dove_Right_II(horizontal, vertical):
-    logger.info(f"move: dove_Right_II({horizontal}, {vertical})")
-    if rightSide_direction:
-        sc.set_servo_pwm(8, pwm8 + horizontal)
-    else:
-        sc.set_servo_pwm(8, pwm8 - horizontal)
+    set_dove_leg('right_II', horizontal, vertical)
 
-    if rightSide_height:
-        sc.set_servo_pwm(9, pwm9 + vertical)
-    else:
-        sc.set_servo_pwm(9, pwm9 - vertical)
 
 def dove_Right_III(horizontal, vertical):
-    logger.info(f"move: dove_Right_III({horizontal}, {vertical})")
-    if rightSide_direction:
-        sc.set_servo_pwm(10, pwm10 + horizontal)
-    else:
-        sc.set_servo_pwm(10, pwm10 - horizontal)
-
-    if rightSide_height:
-        sc.set_servo_pwm(11, pwm11 + vertical)
-    else:
-        sc.set_servo_pwm(11, pwm11 - vertical)
-
-
-def dove(step_input, speed, timeLast, dpi, command):
-    logger.info(f"move: dove({step_input}, {speed}, {timeLast}, {dpi}, {command})")
-    step_I = step_input
-    step_II = step_input + 2
-
-    if step_II > 4:
-        step_II = step_II - 4
-
-    if speed > 0:
-        if step_input == 1:
-            for speed_I in range(0, (speed + int(speed / dpi)), int(speed / dpi)):
-                if move_stu and command == 'no':
-                    speed_II = speed_I
-                    speed_I = speed - speed_I
-                    dove_Left_I(-speed_I, 3 * speed_II)
-                    dove_Right_II(-speed_I, 3 * speed_II)
-                    dove_Left_III(-speed_I, 3 * speed_II)
-
-                    dove_Right_I(speed_I, -10)
-                    dove_Left_II(speed_I, -10)
-                    dove_Right_III(speed_I, -10)
-                    time.sleep(timeLast / dpi)
-                else:
-                    pass
-
-                if command == 'left':
-                    speed_II = speed_I
-                    speed_I = speed - speed_I
-                    dove_Left_I(speed_I, 3 * speed_II)
-                    dove_Right_II(-speed_I, 3 * speed_II)
-                    dove_Left_III(speed_I, 3 * speed_II)
-
-                    dove_Right_I(speed_I, -10)
-                    dove_Left_II(-speed_I, -10)
-                    dove_Right_III(speed_I, -10)
-                    time.sleep(timeLast / dpi)
-                elif command == 'right':
-                    speed_II = speed_I
-                    speed_I = speed - speed_I
-                    dove_Left_I(-speed_I, 3 * speed_II)
-                    dove_Right_II(speed_I, 3 * speed_II)
-                    dove_Left_III(-speed_I, 3 * speed_II)
-
-                    dove_Right_I(-speed_I, -10)
-                    dove_Left_II(speed_I, -10)
-                    dove_Right_III(-speed_I, -10)
-                    time.sleep(timeLast / dpi)
-                else:
-                    pass
-
-                if move_stu == 0 and command == 'no':
-                    break
-
-        elif step_input == 2:
-            for speed_I in range(0, (speed + int(speed / dpi)), int(speed / dpi)):
-                if move_stu and command == 'no':
-                    speed_II = speed_I
-                    speed_I = speed - speed_I
-                    dove_Left_I(speed_II, 3 * (speed - speed_II))
-                    dove_Right_II(speed_II, 3 * (speed - speed_II))
-                    dove_Left_III(speed_II, 3 * (speed - speed_II))
-
-                    dove_Right_I(-speed_II, -10)
-                    dove_Left_II(-speed_II, -10)
-                    dove_Right_III(-speed_II, -10)
-                    time.sleep(timeLast / dpi)
-                else:
-                    pass
-
-                if command == 'left':
-                    speed_II = speed_I
-                    speed_I = speed - speed_I
-                    dove_Left_I(-speed_II, 3 * (speed - speed_II))
-                    dove_Right_II(speed_II, 3 * (speed - speed_II))
-                    dove_Left_III(-speed_II, 3 * (speed - speed_II))
-
-                    dove_Right_I(-speed_II, -10)
-                    dove_Left_II(speed_II, -10)
-                    dove_Right_III(-speed_II, -10)
-                    time.sleep(timeLast / dpi)
-                elif command == 'right':
-                    speed_II = speed_I
-                    speed_I = speed - speed_I
-                    dove_Left_I(speed_II, 3 * (speed - speed_II))
-                    dove_Right_II(-speed_II, 3 * (speed - speed_II))
-                    dove_Left_III(speed_II, 3 * (speed - speed_II))
-
-                    dove_Right_I(speed_II, -10)
-                    dove_Left_II(-speed_II, -10)
-                    dove_Right_III(speed_II, -10)
-                    time.sleep(timeLast / dpi)
-                else:
-                    pass
-
-                if move_stu == 0 and command == 'no':
-                    break
-        elif step_input == 3:
-            for speed_I in range(0, (speed + int(speed / dpi)), int(speed / dpi)):
-                if move_stu and command == 'no':
-                    speed_II = speed_I
-                    speed_I = speed - speed_I
-                    dove_Left_I(speed_I, -10)
-                    dove_Right_II(speed_I, -10)
-                    dove_Left_III(speed_I, -10)
-
-                    dove_Right_I(-speed_I, 3 * speed_II)
-                    dove_Left_II(-speed_I, 3 * speed_II)
-                    dove_Right_III(-speed_I, 3 * speed_II)
-                    time.sleep(timeLast / dpi)
-                else:
-                    pass
-
-                if command == 'left':
-                    speed_II = speed_I
-                    speed_I = speed - speed_I
-                    dove_Left_I(-speed_I, -10)
-                    dove_Right_II(speed_I, -10)
-                    dove_Left_III(-speed_I, -10)
-
-                    dove_Right_I(-speed_I, 3 * speed_II)
-                    dove_Left_II(speed_I, 3 * speed_II)
-                    dove_Right_III(-speed_I, 3 * speed_II)
-                    time.sleep(timeLast / dpi)
-                elif command == 'right':
-                    speed_II = speed_I
-                    speed_I = speed - speed_I
-                    dove_Left_I(speed_I, -10)
-                    dove_Right_II(-speed_I, -10)
-                    dove_Left_III(speed_I, -10)
-
-                    dove_Right_I(speed_I, 3 * speed_II)
-                    dove_Left_II(-speed_I, 3 * speed_II)
-                    dove_Right_III(speed_I, 3 * speed_II)
-                    time.sleep(timeLast / dpi)
-                else:
-                    pass
-
-                if move_stu == 0 and command == 'no':
-                    break
-        elif step_input == 4:
-            for speed_I in range(0, (speed + int(speed / dpi)), int(speed / dpi)):
-                if move_stu and command == 'no':
-                    speed_II = speed_I
-                    speed_I = speed - speed_I
-                    dove_Left_I(-speed_II, -10)
-                    dove_Right_II(-speed_II, -10)
-                    dove_Left_III(-speed_II, -10)
-
-                    dove_Right_I(speed_II, 3 * (speed - speed_II))
-                    dove_Left_II(speed_II, 3 * (speed - speed_II))
-                    dove_Right_III(speed_II, 3 * (speed - speed_II))
-                    time.sleep(timeLast / dpi)
-                else:
-                    pass
-
-                if command == 'left':
-                    speed_II = speed_I
-                    speed_I = speed - speed_I
-                    dove_Left_I(speed_II, -10)
-                    dove_Right_II(-speed_II, -10)
-                    dove_Left_III(speed_II, -10)
-
-                    dove_Right_I(speed_II, 3 * (speed - speed_II))
-                    dove_Left_II(-speed_II, 3 * (speed - speed_II))
-                    dove_Right_III(speed_II, 3 * (speed - speed_II))
-                    time.sleep(timeLast / dpi)
-                elif command == 'right':
-                    speed_II = speed_I
-                    speed_I = speed - speed_I
-                    dove_Left_I(-speed_II, -10)
-                    dove_Right_II(speed_II, -10)
-                    dove_Left_III(-speed_II, -10)
-
-                    dove_Right_I(-speed_II, 3 * (speed - speed_II))
-                    dove_Left_II(speed_II, 3 * (speed - speed_II))
-                    dove_Right_III(-speed_II, 3 * (speed - speed_II))
-                    time.sleep(timeLast / dpi)
-                else:
-                    pass
-
-                if move_stu == 0 and command == 'no':
-                    break
-    else:
-        speed = -speed
-        if step_input == 1:
-            for speed_I in range(0, (speed + int(speed / dpi)), int(speed / dpi)):
-                if move_stu and command == 'no':
-                    speed_II = speed_I
-                    speed_I = speed - speed_I
-                    dove_Left_I(speed_I, 3 * speed_II)
-                    dove_Right_II(speed_I, 3 * speed_II)
-                    dove_Left_III(speed_I, 3 * speed_II)
-
-                    dove_Right_I(-speed_I, -10)
-                    dove_Left_II(-speed_I, -10)
-                    dove_Right_III(-speed_I, -10)
-                    time.sleep(timeLast / dpi)
-                else:
-                    pass
-        elif step_input == 2:
-            for speed_I in range(0, (speed + int(speed / dpi)), int(speed / dpi)):
-                if move_stu and command == 'no':
-                    speed_II = speed_I
-                    speed_I = speed - speed_I
-                    dove_Left_I(-speed_II, 3 * (speed - speed_II))
-                    dove_Right_II(-speed_II, 3 * (speed - speed_II))
-                    dove_Left_III(-speed_II, 3 * (speed - speed_II))
-
-                    dove_Right_I(speed_II, -10)
-                    dove_Left_II(speed_II, -10)
-                    dove_Right_III(speed_II, -10)
-                    time.sleep(timeLast / dpi)
-                else:
-                    pass
-        elif step_input == 3:
-            for speed_I in range(0, (speed + int(speed / dpi)), int(speed / dpi)):
-                if move_stu and command == 'no':
-                    speed_II = speed_I
-                    speed_I = speed - speed_I
-                    dove_Left_I(-speed_I, -10)
-                    dove_Right_II(-speed_I, -10)
-                    dove_Left_III(-speed_I, -10)
-
-                    dove_Right_I(speed_I, 3 * speed_II)
-                    dove_Left_II(speed_I, 3 * speed_II)
-                    dove_Right_III(speed_I, 3 * speed_II)
-                    time.sleep(timeLast / dpi)
-                else:
-                    pass
-        elif step_input == 4:
-            for speed_I in range(0, (speed + int(speed / dpi)), int(speed / dpi)):
-                if move_stu and command == 'no':
-                    speed_II = speed_I
-                    speed_I = speed - speed_I
-                    dove_Left_I(speed_II, -10)
-                    dove_Right_II(speed_II, -10)
-                    dove_Left_III(speed_II, -10)
-
-                    dove_Right_I(-speed_II, 3 * (speed - speed_II))
-                    dove_Left_II(-speed_II, 3 * (speed - speed_II))
-                    dove_Right_III(-speed_II, 3 * (speed - speed_II))
-                    time.sleep(timeLast / dpi)
-                else:
-                    pass
+    set_dove_leg('right_III', horizontal, vertical)
+
+
+def dove(step_input, speed, timeLast, dpi, command, phase=0.0, blend=False, version=None):
+    """
+    Plays one smooth gait step.
+
+    Args:
+        phase (float): Share of the step already played, 0..1, to resume a preempted step.
+        blend (bool): Fade in from the current pose instead of jumping to the first sub-frame.
+        version (int): command_version the step was started for. The step stops before
+            the next sub-frame once a newer command arrived. None plays the whole step.
+
+    Returns:
+        float: Phase to resume at if the step was preempted, None if it was played to the end.
+    """
+    logger.debug(f"move: dove({step_input}, {speed}, {timeLast}, {dpi}, {command})")
+    if command == 'no' and not move_stu:
+        return None
+
+    frames = gait_engine.dove_frames(step_input, speed, dpi, command)
+    if frames is None:
+        return None
+    start = min(int(round(phase * len(frames))), len(frames) - 1)
+    frames = frames[start:]
+    if blend:
+        frames = gait.blend(frames, sc.current_positions)
+    channels = gait_engine.channels
+    mask = gait_engine.mask
+    for index, frame in enumerate(frames):
+        if version is not None and version != command_version:
+            return (start + index) / (start + len(frames))
+        if version is not None:
+            command_answered(version)
+        sc.write_frame(frame[mask], channels)
+        if version is None:
+            time.sleep(timeLast / dpi)
+        else:
+            command_event.wait(timeLast / dpi)
+    return None
 
 
 def steady_X():
@@ -934,38 +347,62 @@ def steady_X():
         sc.set_servo_pwm(6, pwm6 + steady_X_set)
 
 def steady():
-    logger.info("move: steady()")
-    global X_fix_output, Y_fix_output
+    logger.debug("move: steady()")
+    global X_fix_output, Y_fix_output, steady_timestamp, steady_stance
     if mpu6050_connection:
-        accelerometer_data = sensor.get_accel_data()
-        X = accelerometer_data['x']
-        X = kalman_filter_X.kalman(X)
-        Y = accelerometer_data['y']
-        Y = kalman_filter_Y.kalman(Y)
-
-        X_fix_output += -X_pid.GenOut(X - target_X)
-        X_fix_output = ctrl_range(X_fix_output, steady_range_Max, -steady_range_Max)
-
-        Y_fix_output += -Y_pid.GenOut(Y - target_Y)
-        Y_fix_output = ctrl_range(Y_fix_output, steady_range_Max, -steady_range_Max)
-
-        left_I_input = ctrl_range((X_fix_output + Y_fix_output), steady_range_Max, steady_range_Min)
-        left_I(0, 35, left_I_input)
-
-        left_II_input = ctrl_range((abs(X_fix_output * 0.5) + Y_fix_output), steady_range_Max, steady_range_Min)
-        left_II(0, 35, left_II_input)
+        # Paced by the IMU service: one correction per new orientation estimate
+        sample = imu.imu_service.wait(after=steady_timestamp, timeout=STEADY_TIMEOUT)
+        if sample is None or sample.timestamp <= steady_timestamp:
+            return
+        # No time step to the first sample, the PID starts from its error alone
+        dt = min(sample.timestamp - steady_timestamp, STEADY_TIMEOUT) if steady_timestamp else 0.0
+        steady_timestamp = sample.timestamp
+        # Gravity of the gyro + accelerometer estimate, same axes and units as the
+        # accelerometer the gains were tuned on, without the robot's own acceleration
+        X = float(sample.orientation.gravity[0])
+        Y = float(sample.orientation.gravity[1])
+
+        X_out, Y_out = steady_pid.update([X - target_X, Y - target_Y], dt=dt)
+        X_fix_output = ctrl_range(X_fix_output - X_out, steady_range_Max, -steady_range_Max)
+        Y_fix_output = ctrl_range(Y_fix_output - Y_out, steady_range_Max, -steady_range_Max)
+
+        adjusts = {
+            'left_I': ctrl_range((X_fix_output + Y_fix_output), steady_range_Max, steady_range_Min),
+            'left_II': ctrl_range((abs(X_fix_output * 0.5) + Y_fix_output), steady_range_Max, steady_range_Min),
+            'left_III': ctrl_range((-X_fix_output + Y_fix_output), steady_range_Max, steady_range_Min),
+            'right_III': ctrl_range((X_fix_output - Y_fix_output), steady_range_Max, steady_range_Min),
+            'right_II': ctrl_range((abs(-X_fix_output * 0.5) - Y_fix_output), steady_range_Max, steady_range_Min),
+            'right_I': ctrl_range((-X_fix_output - Y_fix_output), steady_range_Max, steady_range_Min),
+        }
+        if sc.layer is not None:
+            if not steady_stance:
+                # The offsets level the calibrated stance, as the absolute height_target() writes
+                # below do, not the pose the last gait step stopped in
+                sc.write_frame(gait_engine.base[LIFT_CHANNELS], LIFT_CHANNELS)
+                steady_stance = True
+            sc.mixer.publish('balance', gait_engine.balance_offsets(adjusts), wait=True, source="steady")
+        else:
+            for name, adjust in adjusts.items():
+                set_leg(name, 0, 35, adjust)
 
-        left_III_input = ctrl_range((-X_fix_output + Y_fix_output), steady_range_Max, steady_range_Min)
-        left_III(0, 35, left_III_input)
 
-        right_III_input = ctrl_range((X_fix_output - Y_fix_output), steady_range_Max, steady_range_Min)
-        right_III(0, 35, right_III_input)
+def set_steady_mode(enabled):
+    """
+    Enters or leaves steady mode. The IMU is only read while steady() needs it.
+    """
+    global steadyMode, steady_stance
+    enabled = int(bool(enabled))
+    if enabled and not steadyMode:
+        imu.imu_service.acquire()
+        steady_stance = False
+    elif steadyMode and not enabled:
+        imu.imu_service.release()
+    steadyMode = enabled
 
-        right_II_input = ctrl_range((abs(-X_fix_output * 0.5) - Y_fix_output), steady_range_Max, steady_range_Min)
-        right_II(0, 35, right_II_input)
 
-        right_I_input = ctrl_range((-X_fix_output - Y_fix_output), steady_range_Max, steady_range_Min)
-        right_I(0, 35, right_I_input)
+def clear_balance():
+    if sc.layer is not None:
+        sc.mixer.clear('balance')
 
 
 def steadyTest():
@@ -1024,7 +461,7 @@ def look_up(wiggle=look_wiggle):
     else:
         Up_Down_input -= wiggle
         Up_Down_input = ctrl_range(Up_Down_input, Up_Down_Max, Up_Down_Min)
-    sc.set_servo_pwm(13, Up_Down_input)
+    head.set_servo_pwm(13, Up_Down_input)
 
 def look_down(wiggle=look_wiggle):
     logger.info(f"move: look_down({wiggle})")
@@ -1035,7 +472,7 @@ def look_down(wiggle=look_wiggle):
     else:
         Up_Down_input += wiggle
         Up_Down_input = ctrl_range(Up_Down_input, Up_Down_Max, Up_Down_Min)
-    sc.set_servo_pwm(13, Up_Down_input)
+    head.set_servo_pwm(13, Up_Down_input)
 
 def look_left(wiggle=look_wiggle):
     logger.info(f"move: look_left({wiggle})")
@@ -1046,7 +483,7 @@ def look_left(wiggle=look_wiggle):
     else:
         Left_Right_input -= wiggle
         Left_Right_input = ctrl_range(Left_Right_input, Left_Right_Max, Left_Right_Min)
-    sc.set_servo_pwm(12, Left_Right_input)
+    head.set_servo_pwm(12, Left_Right_input)
 
 def look_right(wiggle=look_wiggle):
     logger.info(f"move: look_right({wiggle})")
@@ -1057,13 +494,13 @@ def look_right(wiggle=look_wiggle):
     else:
         Left_Right_input += wiggle
         Left_Right_input = ctrl_range(Left_Right_input, Left_Right_Max, Left_Right_Min)
-    sc.set_servo_pwm(12, Left_Right_input)
+    head.set_servo_pwm(12, Left_Right_input)
 
 def look_home():
     logger.info("move: look_home()")
     global Left_Right_input, Up_Down_input
-    sc.set_servo_pwm(13, 300)
-    sc.set_servo_pwm(12, 300)
+    head.set_servo_pwm(13, 300)
+    head.set_servo_pwm(12, 300)
     Left_Right_input = 300
     Up_Down_input = 300
 
@@ -1072,10 +509,20 @@ def look_home():
 # that used pwm.set_all_pwm(0,0). We must simulate them by setting servos to a neutral position.
 
 
+def clear_layers():
+    """
+    Drops the head and balance layers, so the neutral pose written through sc is what the servos get.
+    """
+    if sc.layer is not None:
+        sc.mixer.clear('head')
+        sc.mixer.clear('balance')
+
+
 def release():
     logger.info("move: release()")
     # Originally: pwm.set_all_pwm(0,0)
     # Now we set all servos to a neutral safe position (e.g. init_positions or 300)
+    clear_layers()
     for i in range(16):
         sc.set_servo_pwm(i, 300)
 
@@ -1084,6 +531,7 @@ def clean_all():
     logger.info("move: clean_all()")
     # Originally: pwm.set_all_pwm(0, 0)
     # We'll do the same approach as release()
+    clear_layers()
     for i in range(16):
         sc.set_servo_pwm(i, 300)
 
@@ -1099,64 +547,168 @@ steadyMode = 0
 step_set = 1
 speed_set = 100
 DPI = 17
+# timeLast of the smooth gait, each sub-frame waits DOVE_TIME_LAST / DPI after its write
+DOVE_TIME_LAST = 0.001
+
+# Gait timing per speed_set level, DOVE_SPEED / DOVE_TURN_SPEED / DPI / DOVE_TIME_LAST
+# are the full speed level, see gait.SPEED_LEVELS. init() rebuilds and compiles it.
+speed_schedule = gait.speed_schedule(DOVE_SPEED, DOVE_TURN_SPEED, DPI, DOVE_TIME_LAST)
+# Timing of the step being played, and the one set_speed() asked for,
+# taken over at the next step boundary
+gait_timing = gait.timing_for(speed_schedule, speed_set)
+next_timing = gait_timing
 
 new_frame = 0
 direction_command = 'no'
 turn_command = 'no'
 
+# Preemption: command() bumps command_version and sets command_event. The gait checks the
+# version before every sub-frame and gives up the rest of the step when it changed, so a
+# stop or turn takes effect within one sub-frame instead of at the end of the step.
+command_version = 0
+command_time = 0.0  # time.monotonic() of the latest command
+answered_version = 0  # Latest command whose latency was recorded
+command_event = threading.Event()
+# Where the preempted step stopped, the next step resumes there (share of the step)
+step_phase = 0.0
+# Command the previous gait step was played for, a step under a new command blends in
+gait_version = 0
+
+# Velocity gait (set_velocity), streamed at a fixed tick while velocity_mode is on
+velocity_gait = gait.VelocityGait(gait_engine)
+velocity_mode = 0
+VELOCITY_TICK = 0.02
+velocity_scheduler = TickScheduler(VELOCITY_TICK, name="move: velocity gait")
+
+# One sub-frame tick: writing the 12 leg channels in one transaction plus the sub-frame pause.
+# From the configured I2C clock, the bus is not open yet at import
+GAIT_TICK = wire_time(1 + 4 * len(gait_engine.channels), load_settings()["i2c_clock_hz"]) + 0.001 / DPI
+command_latency = LatencyStats("move: command -> first servo write", GAIT_TICK)
+
+
+def command_answered(version):
+    """
+    Records the command latency once per command, when the gait first acts on it:
+    the first servo write of the new gait, or the gait stopping.
+    """
+    global answered_version
+    if version == command_version and answered_version != version:
+        answered_version = version
+        command_latency.record(time.monotonic() - command_time)
+
+
+def gait_step(version, direction, command):
+    """
+    One step of the walking gait, direction 1 forward and -1 backward. A step preempted by a
+    new command is not counted, the next call resumes it at the same phase under the new command.
+    """
+    global step_set, step_phase, gait_version, gait_timing
+    if step_phase == 0.0:
+        # Speed changes apply at step boundaries, a resumed step keeps its timing
+        gait_timing = next_timing
+    timing = gait_timing
+    if SmoothMode:
+        blend = version != gait_version
+        gait_version = version
+        stride = timing.stride if command == 'no' else timing.turn_stride
+        resume = dove(step_set, direction * stride, timing.time_last, timing.dpi, command, step_phase, blend, version)
+        if resume is not None:
+            step_phase = resume
+            return
+        step_phase = 0.0
+    else:
+        command_answered(version)
+        move(step_set, direction * 35, command)
+        command_event.wait(timing.step_pause)
+    step_set += 1
+    if step_set == 5:
+        step_set = 1
+
+
+def velocity_step(version):
+    """
+    Streams the velocity gait until a discrete command arrives or the robot came to rest.
+    Velocity updates do not preempt, every tick reads the latest command.
+    """
+    global velocity_mode
+    channels = gait_engine.channels
+    mask = gait_engine.mask
+    skipped = 0
+    velocity_scheduler.start()
+    while version == command_version:
+        # Late ticks advance the oscillators by the time that really passed
+        frame = velocity_gait.tick(VELOCITY_TICK * (1 + skipped))
+        command_answered(version)
+        sc.write_frame(frame[mask], channels)
+        if not velocity_gait.is_moving():
+            rm.pause()
+            velocity_mode = 0
+            if velocity_gait.is_moving():
+                # set_velocity() raced with the stop, keep walking
+                velocity_mode = 1
+                rm.resume()
+            break
+        skipped = velocity_scheduler.wait()
+
+
+def set_speed(speed):
+    """
+    Speed setting of the client, 0..100, picks the level of the speed schedule the
+    discrete gait walks with. Takes effect at the next step boundary.
+    """
+    global speed_set, next_timing
+    init()
+    speed_set = max(0, min(100, int(speed)))
+    next_timing = gait.timing_for(speed_schedule, speed_set)
+    logger.info(f"move: set_speed({speed_set}): {next_timing}")
+
+
+def set_velocity(vx, vy=0.0, yaw_rate=0.0):
+    """
+    Continuous walking, vx forward and yaw_rate left turn in -1..1, see gait.VelocityGait.
+    Meant to be called at the client's joystick rate, a (0, 0, 0) command brings the robot to rest.
+    vy is accepted but the 2-servo legs cannot strafe.
+    """
+    global velocity_mode, command_time, command_version
+    init()
+    velocity_gait.set_command(vx, vy, yaw_rate)
+    if not velocity_mode:
+        # Take over from the discrete gait, this is a new command for it
+        command_time = time.monotonic()
+        velocity_mode = 1
+        command_version += 1
+        command_event.set()
+    rm.resume()
+
 
 def move_thread():
-    logger.info("move_thread")
-    global step_set
-    stand_stu = 1
-    if not steadyMode:
+    logger.debug("move_thread")
+    global step_set, step_phase
+    # Take the version before reading the commands, anything newer preempts this cycle
+    command_event.clear()
+    version = command_version
+    if velocity_mode:
+        velocity_step(version)
+    elif not steadyMode:
         if direction_command == 'forward' and turn_command == 'no':
-            if SmoothMode:
-                dove(step_set, DOVE_SPEED, 0.001, DPI, 'no')
-                step_set += 1
-                if step_set == 5:
-                    step_set = 1
-            else:
-                move(step_set, 35, 'no')
-                time.sleep(0.1)
-                step_set += 1
-                if step_set == 5:
-                    step_set = 1
+            gait_step(version, 1, 'no')
 
         elif direction_command == 'backward' and turn_command == 'no':
-            if SmoothMode:
-                dove(step_set, DOVE_SPEED * -1, 0.001, DPI, 'no')
-                step_set += 1
-                if step_set == 5:
-                    step_set = 1
-            else:
-                move(step_set, -35, 'no')
-                time.sleep(0.1)
-                step_set += 1
-                if step_set == 5:
-                    step_set = 1
+            gait_step(version, -1, 'no')
 
         else:
             pass
 
         if turn_command != 'no':
-            if SmoothMode:
-                dove(step_set, 35, 0.001, DPI, turn_command)
-                step_set += 1
-                if step_set == 5:
-                    step_set = 1
-            else:
-                move(step_set, 35, turn_command)
-                time.sleep(0.1)
-                step_set += 1
-                if step_set == 5:
-                    step_set = 1
+            gait_step(version, 1, turn_command)
         else:
             pass
 
         if turn_command == 'no' and direction_command == 'stand':
+            command_answered(version)
             stand()
             step_set = 1
+            step_phase = 0.0
         pass
     else:
         steady_X()
@@ -1180,17 +732,54 @@ class RobotM(threading.Thread):
         while 1:
             self.__flag.wait()
             move_thread()
-            pass
+            if not self.__flag.is_set():
+                # Stopped by a command, that is the answer to it
+                command_answered(command_version)
+                if not steadyMode:
+                    clear_balance()
 
 
 rm = RobotM()
-rm.start()
 rm.pause()
 
 
+@boot.init_once("servo.move")
+def init():
+    """
+    Opens the IMU, puts all servos in the init pose and starts the gait thread.
+    Runs once per process, command() and set_velocity() call it on first use.
+    """
+    global mpu6050_connection, speed_schedule, gait_timing, next_timing
+    # PCA9685, servo bus and mixer threads
+    mixer.init()
+    imu.init()
+    mpu6050_connection = int(imu.imu_service.connected)
+    # The MPU6050 shares the I2C bus with the PCA9685, count its traffic with the servo writes
+    imu.imu_service.reader.monitor = sc.bus.monitor
+
+    init_all()
+
+    # Compile the smooth gait steps move_thread() plays at every speed level,
+    # so walking and speed changes never wait for a cache miss
+    speed_schedule = gait.speed_schedule(DOVE_SPEED, DOVE_TURN_SPEED, DPI, DOVE_TIME_LAST)
+    gait_timing = next_timing = gait.timing_for(speed_schedule, speed_set)
+    for _, timing in speed_schedule:
+        for step in gait.STEPS:
+            gait_engine.dove_frames(step, timing.stride, timing.dpi, 'no')
+            gait_engine.dove_frames(step, -timing.stride, timing.dpi, 'no')
+            gait_engine.dove_frames(step, timing.turn_stride, timing.dpi, 'left')
+            gait_engine.dove_frames(step, timing.turn_stride, timing.dpi, 'right')
+
+    rm.start()
+
+
 def command(command_input):
     logger.info(f"move: command({command_input})")
-    global direction_command, turn_command, SmoothMode, steadyMode
+    global direction_command, turn_command, SmoothMode, command_version, command_time, velocity_mode
+    init()
+    command_time = time.monotonic()
+    # Discrete commands take over from the velocity gait
+    velocity_mode = 0
     if 'forward' == command_input:
         direction_command = 'forward'
         rm.resume()
@@ -1217,7 +806,7 @@ def command(command_input):
 
     elif 'automaticOff' == command_input:
         SmoothMode = 0
-        steadyMode = 0
+        set_steady_mode(0)
         rm.pause()
 
     elif 'automatic' == command_input:
@@ -1225,14 +814,18 @@ def command(command_input):
         SmoothMode = 1
 
     elif 'KD' == command_input:
-        steadyMode = 1
+        set_steady_mode(1)
         rm.resume()
 
     elif 'speech' == command_input:
-        steadyMode = 1
+        set_steady_mode(1)
         rm.resume()
 
     elif 'speechOff' == command_input:
         SmoothMode = 0
-        steadyMode = 0
+        set_steady_mode(0)
         rm.pause()
+
+    # Published after the new state, so a preempted gait reads the new command
+    command_version += 1
+    command_event.set()
@@ -0,0 +1,193 @@
+# ======================================================================
+# Motion recordings
+#
+# MotionRecorder listens on the servo bus and stores every written tick as
+# a timestamped 16-channel frame, MotionPlayer streams a recording back on
+# its timestamps. A teleoperated dance or a calibrated climbing move can be
+# captured once and replayed exactly, and recordings make repeatable inputs
+# for tests/gait_benchmark.py (--record / --mode replay).
+#
+# File format, little endian:
+#   header  32 bytes   magic b'RCMF', version u2, channels u2, frame size u2,
+#                      reserved u2, recording start as unix time f8, padding
+#   frames  40 bytes   t_us u8 (since the recording started), pwm u2[16]
+# Version 1 files (t_us u4, wraps after 71.6 minutes) still load.
+# PWM 0 marks a channel that had not been written yet. The frame count
+# follows from the file size, so a recording cut short by a crash stays
+# readable, and load() maps the frames straight into a NumPy array.
+# ======================================================================
+import time
+import struct
+import threading
+import logging
+from typing import List, Optional
+
+import numpy as np
+
+from servo.bus import get_bus, ServoBus
+from servo.scheduler import TickScheduler
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MAGIC = b'RCMF'
+VERSION = 2
+CHANNELS = 16
+HEADER = struct.Struct('<4sHHHHd12x')
+FRAME_DTYPE = np.dtype([('t_us', '<u8'), ('pwm', '<u2', (CHANNELS,))])
+# Frame layout of every version load() reads
+FRAME_DTYPES = {
+    1: np.dtype([('t_us', '<u4'), ('pwm', '<u2', (CHANNELS,))]),
+    VERSION: FRAME_DTYPE,
+}
+UNSET = 0
+
+# Frames buffered by the recorder before they are written out
+CHUNK_FRAMES = 256
+
+
+def load(path: str) -> np.ndarray:
+    """
+    Read-only, memory-mapped frames of a recording (structured array, FRAME_DTYPES of its version).
+    """
+    with open(path, 'rb') as f:
+        magic, version, channels, frame_size, _, _ = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a motion recording.")
+    dtype = FRAME_DTYPES.get(version)
+    if dtype is None or channels != CHANNELS or frame_size != dtype.itemsize:
+        raise ValueError(f"{path}: unsupported recording version {version}, {channels} channels.")
+    try:
+        return np.memmap(path, dtype=dtype, mode='r', offset=HEADER.size)
+    except ValueError:
+        # mmap refuses an empty frame section
+        return np.zeros(0, dtype=dtype)
+
+
+class MotionRecorder:
+    """
+    Records every frame the servo bus writes, from start() to stop().
+
+    Usage:
+        with MotionRecorder('dance.rcmf'):
+            ...
+    """
+
+    def __init__(self, path: str, bus: Optional[ServoBus] = None) -> None:
+        self.path = path
+        self.bus = bus if bus is not None else get_bus()
+        self.file = None
+        self.start_time = 0.0
+        self.chunk = np.zeros(CHUNK_FRAMES, dtype=FRAME_DTYPE)
+        self.count = 0  # Frames in the chunk
+        self.frames = 0  # Frames recorded
+        self.lock = threading.Lock()
+
+    def start(self) -> None:
+        self.file = open(self.path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, CHANNELS, FRAME_DTYPE.itemsize, 0, time.time()))
+        self.start_time = time.monotonic()
+        self.count = 0
+        self.frames = 0
+        # The pose at the start, so a replay begins where the recording did
+        self.capture(self.start_time, self.bus.positions)
+        self.bus.add_listener(self.capture)
+        logger.info(f"MotionRecorder: recording to {self.path}")
+
+    def capture(self, timestamp: float, positions: List[Optional[int]]) -> None:
+        """
+        Bus listener, appends one frame.
+        """
+        with self.lock:
+            if self.file is None:
+                return
+            frame = self.chunk[self.count]
+            frame['t_us'] = int((timestamp - self.start_time) * 1e6)
+            frame['pwm'] = [UNSET if pwm is None else pwm for pwm in positions]
+            self.count += 1
+            self.frames += 1
+            if self.count == CHUNK_FRAMES:
+                self.flush()
+
+    def flush(self) -> None:
+        # Call with the lock held
+        self.file.write(self.chunk[:self.count].tobytes())
+        self.count = 0
+
+    def stop(self) -> int:
+        """
+        Stops recording and closes the file, returns the number of frames recorded.
+        """
+        self.bus.remove_listener(self.capture)
+        with self.lock:
+            if self.file is not None:
+                self.flush()
+                self.file.close()
+                self.file = None
+        logger.info(f"MotionRecorder: {self.frames} frames in {self.path}")
+        return self.frames
+
+    def __enter__(self) -> 'MotionRecorder':
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+class MotionPlayer:
+    """
+    Streams a recording through a ServoCtrl on the recorded timestamps.
+
+    Every frame has an absolute deadline from the start of the replay. When the
+    player falls behind it jumps to the newest frame that is due instead of
+    replaying the backlog, so a replay never runs longer than the recording.
+    """
+
+    def __init__(self, path: str, controller) -> None:
+        self.path = path
+        self.frames = load(path)
+        # controller: servo.base.ServoCtrl, routed to a mixer layer or not
+        self.controller = controller
+        self.scheduler = TickScheduler(name=f"MotionPlayer({path})")
+        self.stop_event = threading.Event()
+        self.stats = {
+            "played": 0,  # Frames written
+            "dropped": 0,  # Frames skipped to catch up
+        }
+
+    def duration(self) -> float:
+        return float(self.frames['t_us'][-1]) / 1e6 if len(self.frames) else 0.0
+
+    def stop(self) -> None:
+        self.stop_event.set()
+
+    def play(self, speed: float = 1.0) -> bool:
+        """
+        Plays the recording, speed 2.0 replays twice as fast.
+
+        Returns:
+            bool: False if stop() ended the replay early.
+        """
+        self.stop_event.clear()
+        times = self.frames['t_us'].astype(float) / (1e6 * speed)
+        pwms = self.frames['pwm']
+        channels = np.arange(CHANNELS)
+        index = 0
+        self.scheduler.start()
+        while index < len(self.frames):
+            if self.scheduler.wait_until(times[index]) > 0:
+                # Late: jump to the newest frame already due
+                due = int(np.searchsorted(times, self.scheduler.elapsed(), side='right')) - 1
+                if due > index:
+                    self.stats["dropped"] += due - index
+                    index = due
+            if self.stop_event.is_set():
+                return False
+            frame = pwms[index]
+            known = frame != UNSET
+            self.controller.write_frame(frame[known], channels[known])
+            self.stats["played"] += 1
+            index += 1
+        self.scheduler.report()
+        return True
@@ -0,0 +1,116 @@
+import time
+import logging
+from typing import Dict, Optional
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class TickScheduler:
+    """
+    Fixed-rate tick scheduler based on absolute monotonic deadlines.
+
+    Sleeping "period minus the time the work took" lets every bus write push the
+    schedule back a little, so a move of N ticks always takes longer than N * period.
+    Here tick k is due at start + k * period no matter how long the work took,
+    and late ticks are accounted for instead of silently stretching the move.
+
+    Usage:
+        scheduler.start(period)
+        while ...:
+            do_work()
+            skipped = scheduler.wait()
+    """
+
+    def __init__(self, period: float = 0.02, name: str = "scheduler") -> None:
+        self.name = name
+        self.period = period
+        self.start_time = 0.0
+        self.next_deadline = 0.0
+        self.tick = 0
+        # Deadlines missed / ticks skipped since the last start()
+        self.run_missed = 0
+        self.run_skipped = 0
+
+        self.stats: Dict[str, float] = {
+            "ticks": 0,  # Deadlines waited for
+            "missed": 0,  # Deadlines that had already passed when wait() was called
+            "skipped": 0,  # Whole periods dropped to get back on schedule
+            "max_overrun": 0.0,  # Worst lateness in seconds
+            "total_overrun": 0.0,  # Sum of lateness in seconds
+        }
+
+    def start(self, period: Optional[float] = None) -> None:
+        """
+        (Re)starts the schedule, the first deadline is one period from now.
+        """
+        if period is not None:
+            self.period = period
+        self.start_time = time.monotonic()
+        self.next_deadline = self.start_time + self.period
+        self.tick = 0
+        self.run_missed = 0
+        self.run_skipped = 0
+
+    def wait(self) -> int:
+        """
+        Sleeps until the next deadline.
+
+        Returns:
+            int: Number of whole periods that were skipped because the caller ran late.
+                 Callers interpolating over a fixed number of ticks should advance by
+                 1 + skipped to finish on time.
+        """
+        self.stats["ticks"] += 1
+        now = time.monotonic()
+        delay = self.next_deadline - now
+        skipped = 0
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            overrun = -delay
+            self.stats["missed"] += 1
+            self.stats["total_overrun"] += overrun
+            self.stats["max_overrun"] = max(self.stats["max_overrun"], overrun)
+            # Drop the periods that are already over instead of bursting through them
+            skipped = int(overrun // self.period) if self.period > 0 else 0
+            self.stats["skipped"] += skipped
+            self.run_missed += 1
+            self.run_skipped += skipped
+        self.tick += 1 + skipped
+        self.next_deadline = self.start_time + (self.tick + 1) * self.period
+        return skipped
+
+    def wait_until(self, offset: float) -> float:
+        """
+        Sleeps until start + offset, for schedules with uneven deadlines (servo.recording).
+
+        Returns:
+            float: How late the call already was, 0 if the deadline was still ahead.
+        """
+        self.stats["ticks"] += 1
+        self.tick += 1
+        delay = self.start_time + offset - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+            return 0.0
+        overrun = -delay
+        self.stats["missed"] += 1
+        self.stats["total_overrun"] += overrun
+        self.stats["max_overrun"] = max(self.stats["max_overrun"], overrun)
+        self.run_missed += 1
+        return overrun
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start_time
+
+    def report(self) -> None:
+        """
+        Logs the missed deadlines of the current run, quiet when everything ran on time.
+        """
+        if self.run_missed:
+            logger.warning(
+                f"{self.name}: missed {self.run_missed}/{self.tick} deadlines, "
+                f"skipped {self.run_skipped} ticks, "
+                f"worst overrun so far {self.stats['max_overrun'] * 1000:.1f} ms"
+            )
@@ -0,0 +1,82 @@
+# ======================================================================
+# Trajectory planning for ServoCtrl moves.
+#
+# A move (start, goal, ticks, profile) is turned into an array of per-tick
+# 16-channel setpoints, shape (ticks, 16). ServoCtrl only streams the rows.
+#
+# Profiles (normalized position s over normalized time t, both 0..1):
+#   'linear'    - constant speed, the original 'auto' interpolation
+#   'trapezoid' - constant acceleration, cruise, constant deceleration
+#   'scurve'    - minimum-jerk quintic, s = 10t^3 - 15t^4 + 6t^5
+#                 (zero speed and zero acceleration at both ends, bounded jerk)
+#
+# Gait moves repeat the same deltas over and over, so the offsets are cached
+# by (delta, ticks, profile) and planning a repeated move costs a dict lookup.
+# ======================================================================
+from functools import lru_cache
+from typing import Sequence, Tuple
+
+import numpy as np
+
+PROFILES = ('linear', 'trapezoid', 'scurve')
+
+# Share of the move spent accelerating (and again decelerating) in the trapezoid profile
+TRAPEZOID_ACCEL_FRACTION = 0.25
+
+
+@lru_cache(maxsize=64)
+def profile_curve(profile: str, ticks: int) -> np.ndarray:
+    """
+    Normalized position at the end of each tick, shape (ticks,), last value is exactly 1.
+    """
+    t = np.arange(1, ticks + 1) / ticks
+    if profile == 'linear':
+        s = t
+    elif profile == 'trapezoid':
+        ta = TRAPEZOID_ACCEL_FRACTION
+        v_max = 1 / (1 - ta)
+        s = np.where(
+            t < ta,
+            0.5 * v_max / ta * t ** 2,
+            np.where(
+                t <= 1 - ta,
+                0.5 * v_max * ta + v_max * (t - ta),
+                1 - 0.5 * v_max / ta * (1 - t) ** 2,
+            ),
+        )
+    elif profile == 'scurve':
+        s = 10 * t ** 3 - 15 * t ** 4 + 6 * t ** 5
+    else:
+        raise ValueError(f"Unknown motion profile '{profile}', expected one of {PROFILES}.")
+    s[-1] = 1.0
+    s.setflags(write=False)
+    return s
+
+
+@lru_cache(maxsize=256)
+def _offsets(delta: Tuple[int, ...], ticks: int, profile: str) -> np.ndarray:
+    offsets = np.rint(np.outer(profile_curve(profile, ticks), delta)).astype(int)
+    offsets.setflags(write=False)
+    return offsets
+
+
+def plan(start: Sequence[int], goal: Sequence[int], ticks: int, profile: str = 'linear') -> np.ndarray:
+    """
+    Per-tick setpoints for a move from `start` to `goal`.
+
+    Args:
+        start: PWM steps at the beginning of the move, one per channel.
+        goal: PWM steps at the end of the move, one per channel.
+        ticks (int): Number of ticks, row k is the setpoint at the end of tick k.
+        profile (str): One of PROFILES.
+
+    Returns:
+        np.ndarray: Integer array of shape (ticks, channels), the last row equals `goal`.
+    """
+    start = np.asarray(start, dtype=int)
+    delta = tuple(int(d) for d in np.asarray(goal, dtype=int) - start)
+    return start + _offsets(delta, ticks, profile)
+
+
+def cache_info():
+    return _offsets.cache_info()
@@ -0,0 +1,116 @@
+"""
+Startup lifecycle: modules that touch hardware do it in an init() function
+instead of at import time.
+
+    @boot.init_once("move")
+    def init():
+        ...
+
+init() runs its body once per process, the first caller does the work and
+concurrent callers wait for it, later calls return at once. Every init is
+timed, boot.report() logs what each one cost and how long boot-to-ready took.
+Inits run inside other inits (servo.move opens the mixer, the bus and the
+IMU) are reported on their own and left out of their caller's time.
+"""
+import time
+import threading
+import functools
+import logging
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Reference point of the boot-to-ready time, the first import of this module
+BOOT_START = time.monotonic()
+
+# (name, exclusive seconds) in the order the inits finished
+timings: List[Tuple[str, float]] = []
+timings_lock = threading.Lock()
+# Per thread: [name, seconds of nested steps] of the steps running, outermost first
+running_steps = threading.local()
+
+
+@contextmanager
+def step(name: str) -> Iterator[List[float]]:
+    """
+    Times a startup step, yields [total seconds, exclusive seconds] filled in when it ends.
+    """
+    stack = running_steps.__dict__.setdefault("stack", [])
+    frame = [name, 0.0]
+    result = [0.0, 0.0]
+    stack.append(frame)
+    start = time.monotonic()
+    try:
+        yield result
+    finally:
+        elapsed = time.monotonic() - start
+        stack.pop()
+        if stack:
+            stack[-1][1] += elapsed
+    result[:] = [elapsed, elapsed - frame[1]]
+    with timings_lock:
+        timings.append((name, result[1]))
+
+
+class InitOnce:
+    """
+    Wraps an init function so its body runs once per process.
+    """
+
+    def __init__(self, name: str, func: Callable[[], None]) -> None:
+        self.name = name
+        self.func = func
+        self.lock = threading.RLock()
+        self.done = False
+        self.running = False
+        functools.update_wrapper(self, func)
+
+    def __call__(self) -> None:
+        if self.done:
+            return
+        with self.lock:
+            # Re-entrant: an init that calls itself through a lazy entry point returns at once
+            if self.done or self.running:
+                return
+            self.running = True
+            try:
+                with step(self.name) as elapsed:
+                    self.func()
+            finally:
+                self.running = False
+            self.done = True
+        logger.info(f"boot: {self.name} initialized in {elapsed[0] * 1e3:.1f} ms")
+
+
+def init_once(name: str) -> Callable[[Callable[[], None]], InitOnce]:
+    def decorator(func: Callable[[], None]) -> InitOnce:
+        return InitOnce(name, func)
+    return decorator
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    """
+    Adds a startup step that is not an init_once function (servers, threads) to the report.
+    """
+    with step(name):
+        yield
+
+
+def report() -> Dict[str, float]:
+    """
+    Logs the startup timing report, returns {step: exclusive seconds} plus 'ready' since BOOT_START.
+    """
+    ready = time.monotonic() - BOOT_START
+    with timings_lock:
+        steps = list(timings)
+    logger.info("boot: startup report, nested steps not included in their caller")
+    for name, seconds in steps:
+        logger.info(f"boot:   {name:24s} {seconds * 1e3:9.1f} ms")
+    logger.info(f"boot:   {'init total':24s} {sum(s for _, s in steps) * 1e3:9.1f} ms")
+    logger.info(f"boot:   {'boot to ready':24s} {ready * 1e3:9.1f} ms")
+    result = dict(steps)
+    result["ready"] = ready
+    return result
@@ -0,0 +1,486 @@
+"""
+MPU6050 acquisition thread.
+
+The chip samples accelerometer and gyro at a fixed rate (sample rate divider,
+digital low pass filter) into its 1 KB FIFO. ImuReader drains the FIFO with
+burst reads every poll period and keeps the samples in a timestamped NumPy
+ring buffer, so consumers read the latest sample or a window of them without
+touching the I2C bus:
+
+    imu = ImuReader(sample_rate=500)
+    imu.open()
+    imu.start()
+    t, sample = imu.latest()          # sample: ax, ay, az (m/s^2), gx, gy, gz (deg/s)
+    times, samples = imu.window(0.05)
+
+One sample is 12 bytes (accel + gyro). At 500 Hz and a 20 ms poll period a
+drain is one FIFO count read plus 120 bytes of data, where get_accel_data()
+of the mpu6050 library needs several transactions for one accelerometer sample.
+
+smbus2 reads the whole batch in one transaction, plain smbus is limited to
+32-byte block reads and takes a few.
+
+The robot has one MPU6050 and one owner of it, the ImuService below: it
+drains the reader, filters once and hands samples to subscribers.
+
+    from system import imu
+    imu.init()
+    if imu.imu_service.connected:
+        imu.imu_service.subscribe(callback, rate=50)   # callback(ImuSample)
+        imu.imu_service.acquire()                      # read without a callback, until release()
+        imu.imu_service.sample()                       # newest ImuSample
+        imu.imu_service.wait(after=timestamp)          # next ImuSample, for control loops
+
+At 500 Hz the drains take over half of a 100 kHz I2C bus, the one the PCA9685
+is on. The service only reads while someone subscribed or acquired it, and
+reports its transactions to the servo bus monitor when given one (monitor).
+
+Every raw sample also feeds the orientation estimator (system.orientation),
+ImuSample.orientation carries its roll / pitch.
+"""
+import time
+import threading
+import logging
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from system import boot
+from servo.instrument import BusMonitor
+from system.kalman_filter import KalmanFilterBank
+from system.orientation import MahonyFilter, Orientation
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MPU6050_ADDRESS = 0x68
+I2C_BUS = 1
+
+# Registers
+SMPLRT_DIV = 0x19
+CONFIG = 0x1A
+GYRO_CONFIG = 0x1B
+ACCEL_CONFIG = 0x1C
+FIFO_EN = 0x23
+INT_STATUS = 0x3A
+USER_CTRL = 0x6A
+PWR_MGMT_1 = 0x6B
+FIFO_COUNT_H = 0x72
+FIFO_R_W = 0x74
+WHO_AM_I = 0x75
+
+# Register values
+FIFO_EN_ACCEL_GYRO = 0x78  # XG, YG, ZG and ACCEL into the FIFO
+USER_CTRL_FIFO_EN = 0x40
+USER_CTRL_FIFO_RESET = 0x04
+INT_STATUS_FIFO_OFLOW = 0x10
+PWR_MGMT_1_CLOCK_PLL_X = 0x01  # Wake up, clocked by the X gyro PLL
+DLPF_CFG = 2  # 94 Hz accel / 98 Hz gyro bandwidth, gyro output rate 1 kHz
+GYRO_OUTPUT_RATE = 1000
+
+FIFO_SIZE = 1024
+SAMPLE_BYTES = 12  # ax, ay, az, gx, gy, gz, big endian int16
+SMBUS_BLOCK = 24  # Whole samples per plain smbus block read (limit 32 bytes)
+
+# Full scale +-2 g and +-250 deg/s, the mpu6050 library defaults
+ACCEL_SCALE = 9.80665 / 16384.0  # m/s^2 per LSB
+GYRO_SCALE = 1 / 131.0  # deg/s per LSB
+SCALES = np.array([ACCEL_SCALE] * 3 + [GYRO_SCALE] * 3, dtype=np.float32)
+SAMPLE_DTYPE = np.dtype('>i2')
+
+AXES = ('ax', 'ay', 'az', 'gx', 'gy', 'gz')
+
+
+class ImuReader(threading.Thread):
+    def __init__(self, address: int = MPU6050_ADDRESS, bus_number: int = I2C_BUS,
+                 sample_rate: float = 500, poll_period: float = 0.02, capacity: int = 4096) -> None:
+        super().__init__(name="ImuReader", daemon=True)
+        self.address = address
+        self.bus_number = bus_number
+        # The chip can only divide its 1 kHz gyro output rate
+        self.divider = max(0, min(255, int(round(GYRO_OUTPUT_RATE / sample_rate)) - 1))
+        self.sample_rate = GYRO_OUTPUT_RATE / (1 + self.divider)
+        self.poll_period = poll_period
+        self.bus = None
+        self.burst_read = None
+        # Traffic accounting of the shared I2C bus, set by whoever owns the other devices on it
+        self.monitor: Optional[BusMonitor] = None
+
+        # Ring buffer, row `count % capacity` is written next
+        self.capacity = capacity
+        self.times = np.zeros(capacity)
+        self.samples = np.zeros((capacity, len(AXES)), dtype=np.float32)
+        self.count = 0
+        self.lock = threading.Lock()
+        self.running = threading.Event()
+
+        self.stats: Dict[str, int] = {
+            "drains": 0,  # FIFO drains
+            "samples": 0,  # Samples read
+            "transactions": 0,  # I2C transactions issued
+            "overflows": 0,  # FIFO overflows, samples were lost
+            "errors": 0,  # Failed drains
+        }
+
+    def open(self) -> None:
+        """
+        Opens the I2C bus and configures rate, filter and FIFO. Raises OSError / ImportError
+        if there is no bus or no MPU6050.
+        """
+        try:
+            import smbus2
+            self.bus = smbus2.SMBus(self.bus_number)
+            self.burst_read = self.read_smbus2
+        except ImportError:
+            import smbus
+            self.bus = smbus.SMBus(self.bus_number)
+            self.burst_read = self.read_smbus
+
+        self.bus.write_byte_data(self.address, PWR_MGMT_1, PWR_MGMT_1_CLOCK_PLL_X)
+        self.bus.write_byte_data(self.address, CONFIG, DLPF_CFG)
+        self.bus.write_byte_data(self.address, SMPLRT_DIV, self.divider)
+        self.bus.write_byte_data(self.address, GYRO_CONFIG, 0x00)
+        self.bus.write_byte_data(self.address, ACCEL_CONFIG, 0x00)
+        self.reset_fifo()
+        self.bus.write_byte_data(self.address, FIFO_EN, FIFO_EN_ACCEL_GYRO)
+        logger.info(f"ImuReader: MPU6050 at 0x{self.address:02x}, {self.sample_rate:.0f} Hz")
+
+    def reset_fifo(self) -> None:
+        for value in (USER_CTRL_FIFO_RESET, USER_CTRL_FIFO_EN):
+            start = time.monotonic()
+            self.bus.write_byte_data(self.address, USER_CTRL, value)
+            self.record(start, 2)
+
+    def record(self, start: float, nbytes: int) -> None:
+        """
+        Counts one I2C transaction of nbytes (register address included), in the shared bus monitor too.
+        """
+        self.stats["transactions"] += 1
+        if self.monitor is not None:
+            # No PCA9685 channels, the bytes still occupy the wire
+            self.monitor.record_transaction(start, 0, 0, nbytes, time.monotonic() - start, ("ImuReader",))
+
+    def read_smbus2(self, register: int, length: int) -> bytes:
+        from smbus2 import i2c_msg
+        start = time.monotonic()
+        write = i2c_msg.write(self.address, [register])
+        read = i2c_msg.read(self.address, length)
+        self.bus.i2c_rdwr(write, read)
+        # Register address, then the device address again after the repeated start
+        self.record(start, 2 + length)
+        return bytes(read)
+
+    def read_smbus(self, register: int, length: int) -> bytes:
+        data = bytearray()
+        while len(data) < length:
+            # FIFO_R_W does not auto-increment, every block keeps reading the FIFO
+            start = time.monotonic()
+            block = min(SMBUS_BLOCK, length - len(data))
+            data += bytes(self.bus.read_i2c_block_data(self.address, register, block))
+            self.record(start, 2 + block)
+        return bytes(data)
+
+    def drain(self) -> int:
+        """
+        Moves all complete samples from the FIFO into the ring buffer, returns their number.
+        """
+        start = time.monotonic()
+        status = self.bus.read_byte_data(self.address, INT_STATUS)
+        self.record(start, 3)
+        if status & INT_STATUS_FIFO_OFLOW:
+            # The FIFO is no longer sample aligned, start over
+            self.stats["overflows"] += 1
+            self.reset_fifo()
+            return 0
+        high, low = self.burst_read(FIFO_COUNT_H, 2)
+        count = ((high << 8) | low) // SAMPLE_BYTES
+        if count == 0:
+            return 0
+        now = time.monotonic()
+        raw = np.frombuffer(self.burst_read(FIFO_R_W, count * SAMPLE_BYTES), dtype=SAMPLE_DTYPE)
+        samples = raw.reshape(count, len(AXES)) * SCALES
+        # The newest sample was taken just now, the others one sample period apart before it
+        times = now - np.arange(count - 1, -1, -1) / self.sample_rate
+        self.append(times, samples)
+        self.stats["drains"] += 1
+        self.stats["samples"] += count
+        return count
+
+    def append(self, times: np.ndarray, samples: np.ndarray) -> None:
+        count = len(times)
+        if count > self.capacity:
+            times, samples = times[-self.capacity:], samples[-self.capacity:]
+            count = self.capacity
+        rows = (self.count + np.arange(count)) % self.capacity
+        with self.lock:
+            self.times[rows] = times
+            self.samples[rows] = samples
+            self.count += count
+
+    def latest(self) -> Optional[Tuple[float, np.ndarray]]:
+        """
+        (timestamp, sample) of the newest sample, None before the first one.
+        """
+        with self.lock:
+            if self.count == 0:
+                return None
+            row = (self.count - 1) % self.capacity
+            return float(self.times[row]), self.samples[row].copy()
+
+    def recent(self, count: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Timestamps and samples of the newest `count` samples (fewer if there are not as many), oldest first.
+        """
+        with self.lock:
+            available = min(count, self.count, self.capacity)
+            rows = (self.count - available + np.arange(available)) % self.capacity
+            return self.times[rows], self.samples[rows]
+
+    def window(self, seconds: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Timestamps and samples of the last `seconds`, oldest first.
+        """
+        times, samples = self.recent(self.capacity)
+        if len(times) == 0:
+            return times, samples
+        keep = times >= times[-1] - seconds
+        return times[keep], samples[keep]
+
+    def get_accel_data(self) -> Dict[str, float]:
+        """
+        Newest acceleration in m/s^2, same keys as mpu6050.get_accel_data().
+        """
+        latest = self.latest()
+        if latest is None:
+            return {'x': 0.0, 'y': 0.0, 'z': 0.0}
+        ax, ay, az = latest[1][:3]
+        return {'x': float(ax), 'y': float(ay), 'z': float(az)}
+
+    def get_gyro_data(self) -> Dict[str, float]:
+        """
+        Newest angular rate in deg/s, same keys as mpu6050.get_gyro_data().
+        """
+        latest = self.latest()
+        if latest is None:
+            return {'x': 0.0, 'y': 0.0, 'z': 0.0}
+        gx, gy, gz = latest[1][3:]
+        return {'x': float(gx), 'y': float(gy), 'z': float(gz)}
+
+    def stop(self) -> None:
+        self.running.clear()
+
+    def run(self) -> None:
+        self.running.set()
+        deadline = time.monotonic()
+        while self.running.is_set():
+            try:
+                self.drain()
+            except OSError as e:
+                self.stats["errors"] += 1
+                logger.error(f"ImuReader: FIFO read failed: {e}")
+            # Fixed poll rate, the FIFO absorbs the jitter of the wakeups
+            deadline += self.poll_period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                deadline = time.monotonic()
+
+
+# Filter of the service, runs over every raw sample of a drain. At 500 Hz this q
+# gives the 0.1 s time constant of the former q = 0.001 on one mean per 10 ms tick
+KALMAN_Q = 0.00004
+KALMAN_R = 0.1
+SERVICE_PERIOD = 0.01
+
+
+class ImuSample(NamedTuple):
+    timestamp: float  # time.monotonic() of the newest raw sample
+    accel: np.ndarray  # Mean of the raw samples of the tick, m/s^2
+    gyro: np.ndarray  # Mean of the raw samples of the tick, deg/s
+    accel_filtered: np.ndarray  # Kalman filtered acceleration, m/s^2
+    orientation: Orientation  # Gyro + accelerometer estimate after the newest raw sample
+
+
+class Subscription:
+    def __init__(self, callback: Callable[[ImuSample], None], period: float) -> None:
+        self.callback = callback
+        self.period = period
+        self.next_due = 0.0
+
+
+class ImuService(threading.Thread):
+    """
+    The one owner of the MPU6050. Drains the FIFO, filters the acceleration,
+    runs the orientation estimator over every raw sample and calls subscribers at
+    the rate they asked for, nobody else touches the sensor.
+
+    The thread only reads while there is demand (subscriptions and acquire()
+    calls not yet released). Idle, it leaves the I2C bus alone, the next reader
+    starts from an emptied FIFO and a fresh estimate.
+    """
+
+    def __init__(self, reader: Optional[ImuReader] = None, period: float = SERVICE_PERIOD) -> None:
+        super().__init__(name="ImuService", daemon=True)
+        self.reader = reader if reader is not None else ImuReader(poll_period=period)
+        self.period = period
+        self.connected = False
+        self.filter = KalmanFilterBank(3, KALMAN_Q, KALMAN_R)
+        self.estimator = MahonyFilter()
+        self.current: Optional[ImuSample] = None
+        self.subscriptions: List[Subscription] = []
+        self.users = 0  # Subscriptions and acquire() calls that want samples
+        self.lock = threading.Lock()
+        self.demand = threading.Event()
+        self.updated = threading.Condition()
+        self.running = threading.Event()
+
+    def open(self) -> bool:
+        """
+        Opens and starts the sensor, False (and no thread) without one.
+        """
+        try:
+            self.reader.open()
+        except Exception as e:
+            logger.info(f"ImuService: no MPU6050 ({e})")
+            return False
+        self.connected = True
+        self.start()
+        return True
+
+    def subscribe(self, callback: Callable[[ImuSample], None], rate: float) -> Subscription:
+        """
+        Calls callback(ImuSample) from the service thread at up to `rate` Hz.
+        Callbacks must be quick, they delay the next drain.
+        """
+        subscription = Subscription(callback, 1.0 / rate)
+        with self.lock:
+            self.subscriptions = self.subscriptions + [subscription]
+        self.acquire()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self.lock:
+            subscribed = subscription in self.subscriptions
+            self.subscriptions = [s for s in self.subscriptions if s is not subscription]
+        if subscribed:
+            self.release()
+
+    def acquire(self) -> None:
+        """
+        Starts reading the sensor (if nobody else did) for sample() / wait() users, until release().
+        """
+        with self.lock:
+            self.users += 1
+            self.demand.set()
+
+    def release(self) -> None:
+        with self.lock:
+            self.users = max(0, self.users - 1)
+            if self.users == 0:
+                self.demand.clear()
+
+    def sample(self) -> Optional[ImuSample]:
+        """
+        Newest filtered sample, None before the first one.
+        """
+        return self.current
+
+    def wait(self, after: float = 0.0, timeout: Optional[float] = None) -> Optional[ImuSample]:
+        """
+        Blocks until there is a sample newer than `after` (a timestamp), returns it,
+        or the newest sample if the timeout expires first (None if there is none).
+        Only gets new samples while the service is acquired.
+        """
+        with self.updated:
+            self.updated.wait_for(lambda: self.current is not None and self.current.timestamp > after, timeout)
+            return self.current
+
+    def latest(self) -> Optional[Tuple[float, np.ndarray]]:
+        return self.reader.latest()
+
+    def window(self, seconds: float) -> Tuple[np.ndarray, np.ndarray]:
+        return self.reader.window(seconds)
+
+    def update(self) -> Optional[ImuSample]:
+        """
+        One tick: drain, average and filter the new samples, integrate them into the orientation.
+        """
+        count = self.reader.drain()
+        if count == 0:
+            return None
+        times, samples = self.reader.recent(count)
+        if self.current is None:
+            # Start from the measured gravity instead of converging from level
+            self.estimator.reset(samples[0, :3])
+        self.estimator.update(times, samples)
+        mean = samples.mean(axis=0)
+        accel, gyro = mean[:3], mean[3:]
+        filtered = self.filter.filter(samples[:, :3])[-1]
+        with self.updated:
+            self.current = ImuSample(float(times[-1]), accel, gyro, filtered, self.estimator.orientation())
+            self.updated.notify_all()
+        return self.current
+
+    def resume(self) -> None:
+        """
+        Start of a reading period: whatever piled up in the FIFO while idle is stale.
+        """
+        with self.updated:
+            # The next update() seeds the estimator from gravity again
+            self.current = None
+        self.filter.reset()
+        try:
+            self.reader.reset_fifo()
+        except OSError as e:
+            self.reader.stats["errors"] += 1
+            logger.error(f"ImuService: FIFO reset failed: {e}")
+
+    def run(self) -> None:
+        self.running.set()
+        deadline = time.monotonic()
+        while self.running.is_set():
+            if not self.demand.is_set():
+                # Nobody reads: no I2C traffic until the next subscribe() / acquire()
+                self.demand.wait()
+                if not self.running.is_set():
+                    break
+                self.resume()
+                deadline = time.monotonic()
+            try:
+                sample = self.update()
+            except OSError as e:
+                self.reader.stats["errors"] += 1
+                logger.error(f"ImuService: FIFO read failed: {e}")
+                sample = None
+            if sample is not None:
+                now = time.monotonic()
+                for subscription in self.subscriptions:
+                    if now >= subscription.next_due:
+                        subscription.next_due = now + subscription.period
+                        try:
+                            subscription.callback(sample)
+                        except Exception as e:
+                            logger.error(f"ImuService: subscriber failed: {e}")
+            deadline += self.period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                deadline = time.monotonic()
+
+    def stop(self) -> None:
+        self.running.clear()
+        # Wakes an idle thread so it can exit
+        self.demand.set()
+
+
+imu_service = ImuService()
+
+
+@boot.init_once("imu")
+def init() -> None:
+    """
+    Opens the shared MPU6050, once per process. Check imu_service.connected afterwards.
+    """
+    imu_service.open()
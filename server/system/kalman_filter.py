@@ -1,35 +1,149 @@
+"""
+Kalman filters for sensor and tracking signals.
+
+KalmanFilterBank keeps the state of N channels in NumPy arrays and updates
+all of them in one call, so the x / y / z of a sensor or the x / y of a
+tracked object share one filter instead of one object per axis:
+
+    bank = KalmanFilterBank(3, q=0.001, r=0.1)
+    bank.kalman([ax, ay, az])            # one sample per channel, returns the estimates
+    bank.kalman(value, channels=1)       # only channel 1, the others keep their state
+    bank.filter(block)                   # (n, 3) samples, e.g. a FIFO drain, returns (n, 3)
+
+Two process models:
+    LEVEL      The signal holds its value between samples. Same results as the
+               original scalar kalman(), including the blend of jumps of
+               JUMP_THRESHOLD and more (JUMP_BLEND of the new value).
+    VELOCITY   Constant velocity: position and rate per channel, white noise
+               acceleration of spectral density q, time steps from `dt` or
+               from sample timestamps. Follows ramps without lag and
+               estimates the rate (bank.velocity).
+
+KalmanFilter is the single channel form with the original interface.
+"""
+from typing import Optional, Sequence, Union
+
+import numpy as np
+
+LEVEL = "level"
+VELOCITY = "velocity"
+
+JUMP_THRESHOLD = 60
+JUMP_BLEND = 0.382
+
+Channels = Union[int, Sequence[int], np.ndarray, None]
+
+
+class KalmanFilterBank:
+    def __init__(self, channels: int, q, r, model: str = LEVEL, dt: float = 1.0,
+                 jump_threshold: float = JUMP_THRESHOLD) -> None:
+        if model not in (LEVEL, VELOCITY):
+            raise ValueError(f"Unknown Kalman filter model {model}, expected '{LEVEL}' or '{VELOCITY}'.")
+        self.channels = channels
+        self.model = model
+        # q and r may be one value for all channels or one per channel
+        self.q = np.broadcast_to(np.asarray(q, dtype=float), (channels,)).copy()
+        self.r = np.broadcast_to(np.asarray(r, dtype=float), (channels,)).copy()
+        self.dt = dt
+        self.jump_threshold = jump_threshold
+        self.reset()
+
+    def reset(self, values=None) -> None:
+        """
+        Forgets the history, estimates start at `values` (0 by default).
+        """
+        self.x = np.zeros(self.channels) if values is None else np.array(values, dtype=float)
+        self.velocity = np.zeros(self.channels)
+        # Covariance, LEVEL uses p00 only
+        self.p00 = np.ones(self.channels)
+        self.p01 = np.zeros(self.channels)
+        self.p11 = np.ones(self.channels)
+        self.last_time: Optional[float] = None  # Last sample timestamp given to filter()
+
+    def kalman(self, values, channels: Channels = None, dt: Optional[float] = None):
+        """
+        One update with one sample per channel (or per channel of `channels`).
+
+        Returns:
+            The new estimates of the updated channels, a float for a single channel index.
+        """
+        index = slice(None) if channels is None else channels
+        z = np.asarray(values, dtype=float)
+        if self.model == LEVEL:
+            estimate = self.update_level(index, z)
+        else:
+            estimate = self.update_velocity(index, z, self.dt if dt is None else dt)
+        return float(estimate) if np.ndim(estimate) == 0 else estimate
+
+    def filter(self, samples, times: Optional[np.ndarray] = None, channels: Channels = None) -> np.ndarray:
+        """
+        Runs a block of samples through the filter, oldest first: rows are samples,
+        columns channels. `times` (one per row) sets the time steps of the VELOCITY
+        model, the first step continues from the previous call's last timestamp.
+
+        Returns:
+            The estimate after every sample, same shape as samples.
+        """
+        samples = np.asarray(samples, dtype=float)
+        index = slice(None) if channels is None else channels
+        out = np.empty_like(samples)
+        if self.model == LEVEL:
+            for row, z in enumerate(samples):
+                out[row] = self.update_level(index, z)
+            return out
+        if times is None:
+            dts = np.full(len(samples), self.dt)
+        else:
+            times = np.asarray(times, dtype=float)
+            dts = np.diff(times, prepend=times[0] - self.dt if self.last_time is None else self.last_time)
+            self.last_time = float(times[-1])
+        for row, (z, dt) in enumerate(zip(samples, dts.tolist())):
+            out[row] = self.update_velocity(index, z, dt)
+        return out
+
+    def update_level(self, index, z):
+        old = self.x[index]
+        # Large steps are followed part of the way at once, as the scalar filter always did
+        predicted = np.where(np.abs(old - z) >= self.jump_threshold, z * JUMP_BLEND + old * (1 - JUMP_BLEND), old)
+        p = self.p00[index] + self.q[index]
+        gain = p / (p + self.r[index])
+        estimate = predicted + gain * (z - old)
+        self.p00[index] = (1 - gain) * p
+        self.x[index] = estimate
+        return estimate
+
+    def update_velocity(self, index, z, dt: float):
+        x, v = self.x[index], self.velocity[index]
+        p00, p01, p11 = self.p00[index], self.p01[index], self.p11[index]
+        q = self.q[index]
+        # Predict: x += v dt, P = F P F' + Q (white noise acceleration)
+        x = x + v * dt
+        p00 = p00 + dt * (2 * p01 + dt * p11) + q * dt ** 3 / 3
+        p01 = p01 + dt * p11 + q * dt ** 2 / 2
+        p11 = p11 + q * dt
+        # Update with the position measurement
+        s = p00 + self.r[index]
+        k0, k1 = p00 / s, p01 / s
+        innovation = z - x
+        x = x + k0 * innovation
+        v = v + k1 * innovation
+        self.p11[index] = p11 - k1 * p01
+        self.p01[index] = (1 - k0) * p01
+        self.p00[index] = (1 - k0) * p00
+        self.x[index] = x
+        self.velocity[index] = v
+        return x
+
+
 class KalmanFilter:
+    """
+    One channel with the original interface: kalman(value) returns a float.
+    """
+
     def __init__(self, q, r):
-        self.x_k1_k1 = None
         self.q = q
         self.r = r
-        
-        self.P_k_k1 = 1
-        self.Kg = 0
-        self.P_k1_k1 = 1
-        self.x_k_k1 = 0
-        self.ADC_OLD_Value = 0
-        self.Z_k = 0
-        self.kalman_adc_old=0
-        
+        self.bank = KalmanFilterBank(1, q, r)
+
     def kalman(self, adc_value):
-       
-        self.Z_k = adc_value
-        
-        if abs(self.kalman_adc_old - adc_value) >= 60:
-            self.x_k1_k1 = adc_value*0.382 + self.kalman_adc_old * 0.618
-        else:
-            self.x_k1_k1 = self.kalman_adc_old
-    
-        self.x_k_k1 = self.x_k1_k1
-        self.P_k_k1 = self.P_k1_k1 + self.q
-    
-        self.Kg = self.P_k_k1/(self.P_k_k1 + self.r)
-    
-        kalman_adc = self.x_k_k1 + self.Kg * (self.Z_k - self.kalman_adc_old)
-        self.P_k1_k1 = (1 - self.Kg)*self.P_k_k1
-        self.P_k_k1 = self.P_k1_k1
-    
-        self.kalman_adc_old = kalman_adc
-        
-        return kalman_adc
+        return self.bank.kalman(adc_value, channels=0)
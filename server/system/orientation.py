@@ -0,0 +1,139 @@
+"""
+Orientation estimate from the MPU6050 gyro and accelerometer (Mahony filter).
+
+The quaternion follows the gyro and is pulled towards the accelerometer's
+gravity direction with a PI correction. The gyro makes it fast, the
+accelerometer removes the drift, and samples whose magnitude is far from 1 g
+(the robot's own walking acceleration) do not correct it at all.
+
+    estimator = MahonyFilter()
+    estimator.update(times, samples)   # ImuReader rows: ax, ay, az (m/s^2), gx, gy, gz (deg/s)
+    estimator.orientation()            # Orientation(timestamp, roll, pitch, quaternion, gravity)
+
+Batches are prepared with NumPy (normalization, units, time steps), the
+recursion itself runs on plain floats, which is faster than NumPy for 4-vectors.
+"""
+import math
+import threading
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+GRAVITY = 9.80665
+
+KP = 1.0  # Proportional gain, 1/s: how fast the accelerometer corrects the attitude
+KI = 0.05  # Integral gain, estimates the gyro bias
+# Accelerometer samples further than this from 1 g (in g) only propagate the gyro
+ACCEL_REJECTION = 0.15
+# Longest time step integrated at once, a gap in the data is not turned into a jump
+MAX_DT = 0.05
+
+
+class Orientation(NamedTuple):
+    timestamp: float  # time.monotonic() of the newest sample used
+    roll: float  # Degrees about the sensor x axis, atan2(gy, gz) of the gravity estimate
+    pitch: float  # Degrees about the sensor y axis, atan2(-gx, |gy, gz|)
+    quaternion: np.ndarray  # (w, x, y, z), sensor frame to world
+    gravity: np.ndarray  # Gravity in the sensor frame, m/s^2, what a still accelerometer would read
+
+
+class MahonyFilter:
+    def __init__(self, kp: float = KP, ki: float = KI, accel_rejection: float = ACCEL_REJECTION) -> None:
+        self.kp = kp
+        self.ki = ki
+        self.accel_rejection = accel_rejection
+        self.q = [1.0, 0.0, 0.0, 0.0]
+        self.bias = [0.0, 0.0, 0.0]  # Integral term, rad/s
+        self.timestamp: Optional[float] = None
+        self.lock = threading.Lock()
+        self.stats = {
+            "samples": 0,
+            "rejected": 0,  # Samples that only propagated the gyro
+        }
+
+    def reset(self, accel: Optional[np.ndarray] = None) -> None:
+        """
+        Levels the estimate, or aligns it with a gravity reading so it starts converged.
+        """
+        with self.lock:
+            self.q = [1.0, 0.0, 0.0, 0.0]
+            self.bias = [0.0, 0.0, 0.0]
+            self.timestamp = None
+            if accel is not None:
+                ax, ay, az = (float(v) for v in accel)
+                roll = math.atan2(ay, az)
+                pitch = math.atan2(-ax, math.hypot(ay, az))
+                cr, sr = math.cos(roll / 2), math.sin(roll / 2)
+                cp, sp = math.cos(pitch / 2), math.sin(pitch / 2)
+                self.q = [cr * cp, sr * cp, cr * sp, -sr * sp]
+
+    def update(self, times: np.ndarray, samples: np.ndarray) -> None:
+        """
+        Integrates a batch of samples in time order.
+        """
+        if len(times) == 0:
+            return
+        times = np.asarray(times, dtype=float)
+        accel = np.asarray(samples[:, :3], dtype=float)
+        gyro = np.radians(np.asarray(samples[:, 3:6], dtype=float))
+        norm = np.linalg.norm(accel, axis=1)
+        usable = (np.abs(norm / GRAVITY - 1) <= self.accel_rejection) & (norm > 0)
+        accel = accel / np.where(norm > 0, norm, 1)[:, None]
+        with self.lock:
+            if self.timestamp is None:
+                self.timestamp = float(times[0])
+            previous = np.concatenate(([self.timestamp], times[:-1]))
+            dts = np.clip(times - previous, 0.0, MAX_DT)
+            for dt, a, g, use in zip(dts.tolist(), accel.tolist(), gyro.tolist(), usable.tolist()):
+                self.step(dt, a, g, use)
+            self.timestamp = float(times[-1])
+            self.stats["samples"] += len(times)
+            self.stats["rejected"] += int(np.count_nonzero(~usable))
+
+    def step(self, dt: float, accel, gyro, use_accel: bool) -> None:
+        w, x, y, z = self.q
+        gx, gy, gz = gyro
+        if use_accel:
+            ax, ay, az = accel
+            # Gravity direction the current estimate predicts
+            vx = 2 * (x * z - w * y)
+            vy = 2 * (w * x + y * z)
+            vz = w * w - x * x - y * y + z * z
+            # Error: rotation from the predicted to the measured direction
+            ex = ay * vz - az * vy
+            ey = az * vx - ax * vz
+            ez = ax * vy - ay * vx
+            if self.ki > 0:
+                self.bias[0] += self.ki * ex * dt
+                self.bias[1] += self.ki * ey * dt
+                self.bias[2] += self.ki * ez * dt
+            gx += self.kp * ex + self.bias[0]
+            gy += self.kp * ey + self.bias[1]
+            gz += self.kp * ez + self.bias[2]
+        else:
+            gx += self.bias[0]
+            gy += self.bias[1]
+            gz += self.bias[2]
+        half = 0.5 * dt
+        w, x, y, z = (
+            w + (-x * gx - y * gy - z * gz) * half,
+            x + (w * gx + y * gz - z * gy) * half,
+            y + (w * gy - x * gz + z * gx) * half,
+            z + (w * gz + x * gy - y * gx) * half,
+        )
+        norm = math.sqrt(w * w + x * x + y * y + z * z)
+        self.q = [w / norm, x / norm, y / norm, z / norm]
+
+    def orientation(self) -> Optional[Orientation]:
+        """
+        Current estimate, None before the first update.
+        """
+        with self.lock:
+            if self.timestamp is None:
+                return None
+            w, x, y, z = self.q
+            timestamp = self.timestamp
+        gx, gy, gz = 2 * (x * z - w * y), 2 * (w * x + y * z), w * w - x * x - y * y + z * z
+        roll = math.degrees(math.atan2(gy, gz))
+        pitch = math.degrees(math.atan2(-gx, math.hypot(gy, gz)))
+        return Orientation(timestamp, roll, pitch, np.array([w, x, y, z]), GRAVITY * np.array([gx, gy, gz]))
@@ -35,7 +35,9 @@ import config
 import functions
 from servo.base import ServoCtrl
 from servo import move
+from servo import mixer
 from system import info
+from system import boot
 from light.strip import LightStrip
 # import switch  # The 3 single LEDs switches, we don't need them for now
 from app import WebApp
@@ -73,13 +75,15 @@ rad = 0.5
 turnWiggle = 60
 
 # Initialize servo controllers
-scGear = ServoCtrl()
-scGear.move_init()
+# The init pose is written once, by move.init() at startup
+scGear = ServoCtrl(name="scGear")
 
-P_sc = ServoCtrl()
+P_sc = ServoCtrl(name="P_sc")
+P_sc.use_layer('head')
 P_sc.start()
 
-T_sc = ServoCtrl()
+T_sc = ServoCtrl(name="T_sc")
+T_sc.use_layer('head')
 T_sc.start()
 
 # Register graceful shutdown
@@ -323,6 +327,7 @@ async def recv_msg(websocket):
 				try:
 					set_b = data.split()
 					speed_set = int(set_b[1])
+					move.set_speed(speed_set)
 				except:
 					pass
 
@@ -364,6 +369,11 @@ async def recv_msg(websocket):
 				color = data['data']
 				flask_app.color_find_set(color[0],color[1],color[2])
 
+			# Analog walking: {"title": "velocity", "data": [vx, vy, yaw_rate]}, each -1..1
+			elif data['title'] == "velocity":
+				vx, vy, yaw_rate = data['data']
+				move.set_velocity(float(vx), float(vy), float(yaw_rate))
+
 		logger.info(f'Received data: {data}')
 		response = json.dumps(response)
 		await websocket.send(response)
@@ -377,6 +387,7 @@ def start_websocket_server():
 	async def run_server():
 		async with websockets.serve(main_logic, '0.0.0.0', 8888):
 			logger.info('WebSocket server started on port 8888')
+			boot.report()
 			await asyncio.Future()  # Run forever
 
 	# Create a new event loop for this thread and run the server
@@ -398,10 +409,15 @@ if __name__ == '__main__':
 	# BUFSIZ = 1024
 	# ADDR = (HOST, PORT)
 
+	# PCA9685, servo bus and mixer, then servos to the init pose, IMU, gait thread
+	mixer.init()
+	move.init()
+
 	try:
 		logger.info('Starting LightStrip')
-		RL = LightStrip()
-		RL.start()
+		with boot.timed('LightStrip'):
+			RL = LightStrip()
+			RL.start()
 		# RL.breath(70,70,255)
 		# RL.rainbow()
 		RL.stars()
@@ -412,8 +428,9 @@ if __name__ == '__main__':
 	# global flask_app
 	# flask_app = app.webapp()
 	logger.info('Starting WebApp')
-	flask_app = WebApp()
-	flask_app.start_thread()
+	with boot.timed('WebApp'):
+		flask_app = WebApp()
+		flask_app.start_thread()
 
 	# loop = asyncio.get_event_loop()
 
@@ -1,52 +1,52 @@
 """
-This script reads accelerometer data from the MPU6050 sensor,
-averages multiple samples, and logs the averaged x, y, z values.
+This script reads accelerometer data from the MPU6050 sensor through the
+shared IMU service and logs the averaged and the filtered x, y, z values.
 """
 
+import os
+import sys
 import time
 import logging
-from mpu6050 import mpu6050
 
-# Initialize logging
+# Add the parent directory of 'server' to sys.path
+script_dir = os.path.realpath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(script_dir, '..', 'server')))
+
+# Initialize logging, before the server modules configure it
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-# Initialize the MPU6050 sensor at I2C address 0x68
-sensor = mpu6050(0x68)
+from system import imu
+
+# Seconds of samples averaged per report, and reports per second
+AVERAGE_WINDOW = 0.1
+REPORT_RATE = 3
 
 
-def mpu6050test():
+def mpu6050test(sample):
     """
-    Read accelerometer data from the MPU6050 sensor,
-    average over a set number of samples, and log the averaged x, y, z values.
+    Subscriber callback: log the mean of the last AVERAGE_WINDOW seconds of raw samples
+    next to the service's Kalman filtered values.
     """
-    x, y, z = 0, 0, 0
-    sample_count = 10
-
-    # Collect accelerometer data over sample_count iterations
-    for _ in range(sample_count):
-        accelerometer_data = sensor.get_accel_data()
-        x += accelerometer_data['x']
-        y += accelerometer_data['y']
-        z += accelerometer_data['z']
-        time.sleep(0.01)  # Small delay between samples
-
-    # Calculate average values
-    x_avg = x / sample_count
-    y_avg = y / sample_count
-    z_avg = z / sample_count
+    _, samples = imu.imu_service.window(AVERAGE_WINDOW)
+    x_avg, y_avg, z_avg = samples[:, :3].mean(axis=0)
+    x_f, y_f, z_f = sample.accel_filtered
 
-    # Log the averaged accelerometer values
-    logging.info('X={:.3f}, Y={:.3f}, Z={:.3f}'.format(x_avg, y_avg, z_avg))
+    logging.info('X={:.3f}, Y={:.3f}, Z={:.3f} ({} samples) filtered X={:.3f}, Y={:.3f}, Z={:.3f}'.format(
+        x_avg, y_avg, z_avg, len(samples), x_f, y_f, z_f))
 
 
 if __name__ == "__main__":
     try:
+        imu.init()
+        if not imu.imu_service.connected:
+            logging.error("No MPU6050 found")
+            sys.exit(1)
+        imu.imu_service.subscribe(mpu6050test, REPORT_RATE)
         while True:
-            mpu6050test()
-            time.sleep(0.3)  # Delay before the next set of samples
+            time.sleep(1)
     except KeyboardInterrupt:
         # Exit the script gracefully on Ctrl+C
         logging.info("Script terminated by user")
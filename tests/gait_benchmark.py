@@ -0,0 +1,302 @@
+"""
+Gait benchmark: plays a command script through the walking code against the
+simulated PCA9685 and reports what the gait costs.
+
+    python3 tests/gait_benchmark.py                       # move_thread(), default script
+    python3 tests/gait_benchmark.py --mode dove --dpi 12  # move.dove() called directly
+    python3 tests/gait_benchmark.py --output after.json --baseline before.json
+    python3 tests/gait_benchmark.py --record walk.rcmf    # also record the frames written
+    python3 tests/gait_benchmark.py --mode replay --recording walk.rcmf
+
+Modes:
+    thread - commands go through move.command(), move_thread() walks (what webServer does)
+    dove   - move.dove() steps called in a loop, with the timing of the speed setting
+    move   - move.move() steps called in a loop, the non-smooth gait
+    replay - a servo.recording file streamed through move.sc, "steps" are frames
+
+Reported per run: steps per second, sub-frame period and its jitter (p50/p99,
+jitter is the distance of each period from the median one), I2C writes and
+bytes per step, and CPU time per step of the thread that walks. The result is
+printed as JSON, --baseline compares it against an earlier run.
+
+Runs headless, the servo bus uses the simulated backend (no board / busio).
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# The benchmark never drives real servos
+os.environ["RASPCLAWS_SERVO_BACKEND"] = "sim"
+
+# Add the parent directory of 'server' to sys.path.
+# Prepended, otherwise tests/servo.py shadows the server's servo package.
+script_dir = os.path.realpath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(script_dir, '..', 'server')))
+from servo import move
+from servo.bus import backend
+from servo.recording import MotionRecorder, MotionPlayer
+
+# The servo modules log every command at INFO, too chatty for a benchmark
+logging.getLogger().setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
+
+# (command, seconds), commands as webServer sends them to move.command()
+DEFAULT_SCRIPT: List[Tuple[str, float]] = [
+    ("forward", 3.0),
+    ("stand", 0.5),
+    ("left", 2.0),
+    ("no", 0.5),
+    ("backward", 2.0),
+    ("stand", 0.5),
+    ("right", 2.0),
+    ("no", 0.5),
+]
+
+# Periods longer than this many median periods are pauses between commands, not sub-frames
+GAP_FACTOR = 10
+WRITE_RECORD_SIZE = 1 << 20
+
+# Metrics compared by --baseline, True if higher is better
+METRICS = {
+    "steps_per_s": True,
+    "period_ms.p50": False,
+    "period_ms.p99": False,
+    "jitter_ms.p50": False,
+    "jitter_ms.p99": False,
+    "writes_per_step": False,
+    "bytes_per_step": False,
+    "cpu_ms_per_step": False,
+}
+
+
+class StepCounter:
+    """
+    Wraps move.dove() and move.move(): counts finished steps and the CPU time
+    the calling thread spends in them.
+    """
+
+    def __init__(self) -> None:
+        self.steps = 0
+        self.cpu = 0.0
+        self.dove = move.dove
+        self.move = move.move
+
+    def counted_dove(self, *args, **kwargs):
+        start = time.thread_time()
+        resume = self.dove(*args, **kwargs)
+        self.cpu += time.thread_time() - start
+        if resume is None:
+            self.steps += 1
+        return resume
+
+    def counted_move(self, *args, **kwargs):
+        start = time.thread_time()
+        self.move(*args, **kwargs)
+        self.cpu += time.thread_time() - start
+        self.steps += 1
+
+    def install(self) -> None:
+        move.dove = self.counted_dove
+        move.move = self.counted_move
+
+    def remove(self) -> None:
+        move.dove = self.dove
+        move.move = self.move
+
+
+def load_script(path: str) -> List[Tuple[str, float]]:
+    """
+    JSON list of [command, seconds] pairs.
+    """
+    with open(path) as f:
+        return [(str(command), float(seconds)) for command, seconds in json.load(f)]
+
+
+def step_arguments(command: str, speed: int) -> Tuple[int, str]:
+    """
+    (speed, turn) a script command walks with in the direct modes, speed 0 stands.
+    """
+    if command == 'forward':
+        return speed, 'no'
+    if command == 'backward':
+        return -speed, 'no'
+    if command in ('left', 'right'):
+        return abs(speed), command
+    return 0, 'no'
+
+
+def run_direct(script: List[Tuple[str, float]], mode: str) -> None:
+    timing = move.next_timing
+    for command, seconds in script:
+        step_speed, turn = step_arguments(command, timing.stride)
+        if turn != 'no':
+            step_speed = timing.turn_stride
+        deadline = time.monotonic() + seconds
+        if step_speed == 0:
+            move.stand()
+            time.sleep(max(0.0, deadline - time.monotonic()))
+            continue
+        step = 1
+        while time.monotonic() < deadline:
+            if mode == 'dove':
+                move.dove(step, step_speed, timing.time_last, timing.dpi, turn)
+            else:
+                move.move(step, 35 if step_speed > 0 else -35, turn)
+                time.sleep(timing.step_pause)
+            step = step % 4 + 1
+
+
+def run_replay(path: str, counter: StepCounter) -> None:
+    player = MotionPlayer(path, move.sc)
+    start = time.thread_time()
+    player.play()
+    counter.cpu += time.thread_time() - start
+    counter.steps += player.stats["played"]
+
+
+def run_thread(script: List[Tuple[str, float]]) -> None:
+    for command, seconds in script:
+        move.command(command)
+        time.sleep(seconds)
+    move.command('stand')
+    move.command('no')
+
+
+def percentiles(values: np.ndarray) -> Dict[str, float]:
+    if len(values) == 0:
+        return {"p50": 0.0, "p99": 0.0}
+    return {
+        "p50": round(float(np.percentile(values, 50)) * 1e3, 4),
+        "p99": round(float(np.percentile(values, 99)) * 1e3, 4),
+    }
+
+
+def frame_periods(timestamps: List[float]) -> np.ndarray:
+    periods = np.diff(np.asarray(timestamps, dtype=float))
+    if len(periods) == 0:
+        return periods
+    return periods[periods < GAP_FACTOR * np.median(periods)]
+
+
+def benchmark(script: List[Tuple[str, float]], mode: str, recording: Optional[str] = None,
+              record: Optional[str] = None) -> Dict[str, Any]:
+    # Init pose, gait thread and the gait tables of every speed level, outside the measurement
+    move.init()
+    move.stand()
+
+    counter = StepCounter()
+    counter.install()
+    recorder = MotionRecorder(record) if record else None
+    if recorder:
+        recorder.start()
+    backend.writes = deque(maxlen=WRITE_RECORD_SIZE)
+    transactions = backend.stats["transactions"]
+    nbytes = backend.stats["bytes"]
+    start = time.monotonic()
+    cpu_start = time.process_time()
+    try:
+        if mode == 'thread':
+            run_thread(script)
+        elif mode == 'replay':
+            run_replay(recording, counter)
+        else:
+            run_direct(script, mode)
+    finally:
+        counter.remove()
+        if recorder:
+            recorder.stop()
+    duration = time.monotonic() - start
+    process_cpu = time.process_time() - cpu_start
+
+    steps = max(counter.steps, 1)
+    periods = frame_periods([write.timestamp for write in backend.writes])
+    jitter = np.abs(periods - np.median(periods)) if len(periods) else periods
+    return {
+        "mode": mode,
+        "parameters": {
+            "dove_speed": move.DOVE_SPEED,
+            "dpi": move.DPI,
+            "time_last": move.DOVE_TIME_LAST,
+            "speed_set": move.speed_set,
+            "i2c_clock_hz": backend.clock_hz,
+            "mixer": move.sc.layer is not None,
+            "script": recording if mode == 'replay' else script,
+        },
+        "duration_s": round(duration, 3),
+        "steps": counter.steps,
+        "steps_per_s": round(counter.steps / duration, 3),
+        "period_ms": percentiles(periods),
+        "jitter_ms": percentiles(jitter),
+        "writes_per_step": round((backend.stats["transactions"] - transactions) / steps, 2),
+        "bytes_per_step": round((backend.stats["bytes"] - nbytes) / steps, 1),
+        "cpu_ms_per_step": round(counter.cpu / steps * 1e3, 4),
+        # Includes the bus thread and the simulated bus spinning on its deadlines
+        "process_cpu_ms_per_step": round(process_cpu / steps * 1e3, 4),
+    }
+
+
+def metric(result: Dict[str, Any], name: str) -> float:
+    value = result
+    for key in name.split('.'):
+        value = value[key]
+    return float(value)
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    for name, higher_is_better in METRICS.items():
+        new, old = metric(result, name), metric(baseline, name)
+        change = (new - old) / old * 100 if old else 0.0
+        better = (change > 0) == higher_is_better or change == 0
+        print(f"{name:18s} {old:12.4f} -> {new:12.4f}  {change:+7.1f}% {'' if better else '(worse)'}",
+              file=sys.stderr)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--mode', choices=('thread', 'dove', 'move', 'replay'), default='thread')
+    parser.add_argument('--script', help="JSON file with [command, seconds] pairs")
+    parser.add_argument('--recording', help="Recording played by --mode replay")
+    parser.add_argument('--record', help="Record the frames written during the run to this file")
+    parser.add_argument('--speed-set', type=int, help="Speed setting 0..100, as sent by the client")
+    parser.add_argument('--speed', type=int, help="DOVE_SPEED")
+    parser.add_argument('--dpi', type=int, help="DPI, sub-frames per step half")
+    parser.add_argument('--time-last', type=float, help="DOVE_TIME_LAST in seconds")
+    parser.add_argument('--output', help="Also write the JSON result to this file")
+    parser.add_argument('--baseline', help="JSON result of an earlier run to compare with")
+    args = parser.parse_args()
+
+    if args.speed is not None:
+        move.DOVE_SPEED = args.speed
+    if args.dpi is not None:
+        move.DPI = args.dpi
+    if args.time_last is not None:
+        move.DOVE_TIME_LAST = args.time_last
+    if args.speed_set is not None:
+        move.set_speed(args.speed_set)
+    script = load_script(args.script) if args.script else DEFAULT_SCRIPT
+
+    if args.mode == 'replay' and not args.recording:
+        parser.error("--mode replay needs --recording")
+    result = benchmark(script, args.mode, args.recording, args.record)
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(result, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
+    # move.py leaves its gait and servo threads running
+    os._exit(0)
@@ -0,0 +1,238 @@
+"""
+PID benchmark: step response of the PID controllers against a simulated plant,
+and the cost of updating many controllers.
+
+    python3 tests/pid_benchmark.py
+    python3 tests/pid_benchmark.py --jitter 8 --noise 0.01
+    python3 tests/pid_benchmark.py --output after.json --baseline before.json
+
+The plant is a lightly damped second order system (a leg on a springy servo),
+sampled every --period ms like the IMU samples steady() works on. The sensor
+grid is exact, but the controller wakes up late by up to --jitter ms, as a
+thread does. Controllers:
+
+    legacy      PID.PID, dt from the clock at the call, actuator limit applied outside
+    bank-plain  PID.PIDBank with the sample dt, no derivative filter, no anti-windup
+    bank        PID.PIDBank with the sample dt, filtered derivative, integral clamp
+                and back-calculation against the actuator limit
+
+Reported per controller: rise time (10-90 %), overshoot, 2 % settling time,
+integrated absolute error, and the output noise once settled. The update cost
+compares --channels legacy PID objects with one PIDBank of as many channels,
+and the same for the 2 channels of steady() (a bank that small runs on floats).
+The result is printed as JSON, --baseline compares it against an earlier run.
+
+Runs in real time (about --duration seconds per controller), no hardware.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from typing import Any, Callable, Dict, Tuple
+
+import numpy as np
+
+# Add the parent directory of 'server' to sys.path
+script_dir = os.path.realpath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(script_dir, '..', 'server')))
+import PID
+
+# Plant: x'' = OMEGA^2 (GAIN u - x) - 2 ZETA OMEGA x'
+OMEGA = 2 * np.pi * 1.5
+ZETA = 0.2
+GAIN = 1.0
+SUBSTEPS = 10  # Integration steps per sample period
+
+# Controller, the same gains for every variant
+KP = 2.0
+KI = 6.0
+KD = 0.08
+DERIVATIVE_TAU = 0.02
+INTEGRAL_LIMIT = 1.5
+OUTPUT_LIMITS = (-1.2, 1.2)  # Actuator limit
+SETPOINT = 1.0
+SETTLE_BAND = 0.02
+
+CONTROLLERS = ('legacy', 'bank-plain', 'bank')
+SMALL_CHANNELS = 2  # steady()'s X and Y
+
+# Metrics compared by --baseline, True if higher is better
+METRICS = {
+    "bank.rise_ms": False,
+    "bank.overshoot_pct": False,
+    "bank.settling_ms": False,
+    "bank.iae": False,
+    "bank.output_noise": False,
+    "cost.bank_us": False,
+    "cost.small_bank_us": False,
+}
+
+
+class Plant:
+    def __init__(self) -> None:
+        self.x = 0.0
+        self.v = 0.0
+
+    def advance(self, u: float, period: float) -> None:
+        h = period / SUBSTEPS
+        for _ in range(SUBSTEPS):
+            a = OMEGA ** 2 * (GAIN * u - self.x) - 2 * ZETA * OMEGA * self.v
+            # Semi-implicit Euler, stable for the lightly damped plant
+            self.v += a * h
+            self.x += self.v * h
+
+
+def make_controller(name: str, period: float) -> Callable[[float], float]:
+    """
+    error -> actuator command, saturated to OUTPUT_LIMITS.
+    """
+    if name == 'legacy':
+        pid = PID.PID()
+        pid.SetKp(KP)
+        pid.SetKi(KI)
+        pid.SetKd(KD)
+        return lambda error: float(np.clip(pid.GenOut(error), *OUTPUT_LIMITS))
+    if name == 'bank-plain':
+        bank = PID.PIDBank(1, kp=KP, ki=KI, kd=KD, dt=period)
+        return lambda error: float(np.clip(bank.update(error, channels=0), *OUTPUT_LIMITS))
+    bank = PID.PIDBank(1, kp=KP, ki=KI, kd=KD, dt=period, derivative_tau=DERIVATIVE_TAU,
+                       integral_limit=INTEGRAL_LIMIT, output_limits=OUTPUT_LIMITS)
+    return lambda error: bank.update(error, channels=0)
+
+
+def step_response(name: str, period: float, duration: float, jitter: float, noise: float,
+                  seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Runs one controller in real time, returns the plant output and the commands per sample.
+    """
+    rng = np.random.default_rng(seed)
+    delays = rng.uniform(0, jitter, int(duration / period))
+    noises = rng.normal(0, noise, len(delays))
+    controller = make_controller(name, period)
+    plant = Plant()
+    outputs = np.zeros(len(delays))
+    commands = np.zeros(len(delays))
+    start = time.monotonic()
+    for k, (delay, measurement_noise) in enumerate(zip(delays, noises)):
+        # Sample k is taken on the grid, the controller gets to it late
+        wake = start + k * period + delay
+        sleep = wake - time.monotonic()
+        if sleep > 0:
+            time.sleep(sleep)
+        outputs[k] = plant.x
+        commands[k] = controller(SETPOINT - (plant.x + measurement_noise))
+        plant.advance(commands[k], period)
+    return outputs, commands
+
+
+def response_metrics(outputs: np.ndarray, commands: np.ndarray, period: float) -> Dict[str, float]:
+    t = np.arange(len(outputs)) * period
+    rise_start = np.argmax(outputs >= 0.1 * SETPOINT)
+    rise_end = np.argmax(outputs >= 0.9 * SETPOINT)
+    outside = np.nonzero(np.abs(outputs - SETPOINT) > SETTLE_BAND * SETPOINT)[0]
+    settled = outside[-1] + 1 if len(outside) else 0
+    steady = commands[len(commands) // 2:]
+    return {
+        "rise_ms": round(float(t[rise_end] - t[rise_start]) * 1000, 1),
+        "overshoot_pct": round(float(max(0.0, outputs.max() - SETPOINT) / SETPOINT * 100), 2),
+        "settling_ms": round(float(t[min(settled, len(t) - 1)]) * 1000, 1),
+        "iae": round(float(np.abs(SETPOINT - outputs).sum() * period), 4),
+        "output_noise": round(float(np.std(np.diff(steady))), 5),
+    }
+
+
+def cost_us(channels: int, iterations: int = 2000) -> Tuple[float, float]:
+    """
+    Microseconds to update `channels` controllers once: legacy objects one by one, and one bank.
+    """
+    errors = np.random.default_rng(0).normal(0, 1, (iterations, channels))
+    legacy = [PID.PID() for _ in range(channels)]
+    for pid in legacy:
+        pid.SetKp(KP)
+        pid.SetKi(KI)
+        pid.SetKd(KD)
+    start = time.perf_counter()
+    for row in errors.tolist():
+        for pid, error in zip(legacy, row):
+            pid.GenOut(error)
+    legacy_us = (time.perf_counter() - start) / iterations * 1e6
+
+    bank = PID.PIDBank(channels, kp=KP, ki=KI, kd=KD, dt=0.01, derivative_tau=DERIVATIVE_TAU,
+                       integral_limit=INTEGRAL_LIMIT, output_limits=OUTPUT_LIMITS)
+    start = time.perf_counter()
+    for row in errors:
+        bank.update(row)
+    bank_us = (time.perf_counter() - start) / iterations * 1e6
+    return legacy_us, bank_us
+
+
+def update_cost(channels: int) -> Dict[str, float]:
+    legacy_us, bank_us = cost_us(channels)
+    small_legacy_us, small_bank_us = cost_us(SMALL_CHANNELS)
+    return {
+        "channels": channels,
+        "legacy_us": round(legacy_us, 2),
+        "bank_us": round(bank_us, 2),
+        "small_legacy_us": round(small_legacy_us, 2),
+        "small_bank_us": round(small_bank_us, 2),
+    }
+
+
+def benchmark(period: float, duration: float, jitter: float, noise: float, channels: int,
+              seed: int) -> Dict[str, Any]:
+    result: Dict[str, Any] = {
+        "period_ms": period * 1000,
+        "jitter_ms": jitter * 1000,
+        "noise": noise,
+    }
+    for name in CONTROLLERS:
+        outputs, commands = step_response(name, period, duration, jitter, noise, seed)
+        result[name] = response_metrics(outputs, commands, period)
+    result["cost"] = update_cost(channels)
+    return result
+
+
+def metric(result: Dict[str, Any], name: str) -> float:
+    value: Any = result
+    for key in name.split('.'):
+        value = value[key]
+    return float(value)
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    for name, higher_is_better in METRICS.items():
+        new, old = metric(result, name), metric(baseline, name)
+        change = (new - old) / old * 100 if old else 0.0
+        better = (change > 0) == higher_is_better or change == 0
+        print(f"{name:18s} {old:12.4f} -> {new:12.4f}  {change:+7.1f}% {'' if better else '(worse)'}",
+              file=sys.stderr)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--period', type=float, default=10, help="Sample period in ms")
+    parser.add_argument('--duration', type=float, default=3, help="Seconds per step response")
+    parser.add_argument('--jitter', type=float, default=4, help="Largest controller wakeup delay in ms")
+    parser.add_argument('--noise', type=float, default=0.005, help="Measurement noise, standard deviation")
+    parser.add_argument('--channels', type=int, default=16, help="Controllers in the update cost test")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="Also write the JSON result to this file")
+    parser.add_argument('--baseline', help="JSON result of an earlier run to compare with")
+    args = parser.parse_args()
+
+    result = benchmark(args.period / 1000, args.duration, args.jitter / 1000, args.noise, args.channels,
+                       args.seed)
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(result, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
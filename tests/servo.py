@@ -96,12 +96,11 @@ def use_library(servo_ids: List[int] | None = None) -> None:
         for _ in range(cycles):
             logger.info(f"Cycle {_ + 1} of {cycles}")
             if alternate:
-                controller.auto_speed(servo_ids, [45, -45])
+                handle = controller.auto_speed(servo_ids, [45, -45])
             else:
-                controller.auto_speed(servo_ids, [-45, 45])
+                handle = controller.auto_speed(servo_ids, [-45, 45])
             alternate = not alternate  # Toggle the alternate flag
-            while controller.running.is_set():
-                time.sleep(0.1)  # Wait for the controller to finish
+            handle.wait()  # Wait for the controller to finish
             time.sleep(1)  # Pause before the next cycle
     except KeyboardInterrupt:
         logger.info("Interrupted while using the library.")
@@ -0,0 +1,76 @@
+"""
+Microbenchmark of the PWM step -> PCA9685 duty conversion.
+
+Compares the original path (ServoCtrl.pwm_to_angle + adafruit_motor.servo.Servo.angle)
+with the precomputed lookup table used by the servo bus.
+The servo outputs are replaced by an in-memory PWM channel, so only the conversion
+cost is measured and no I2C traffic is generated.
+"""
+
+import os
+import sys
+import timeit
+import logging
+from adafruit_motor.servo import Servo
+
+# Add the parent directory of 'server' to sys.path.
+# Prepended, otherwise tests/servo.py shadows the server's servo package.
+script_dir = os.path.realpath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(script_dir, '..', 'server')))
+from servo import bus
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STEPS = list(range(bus.CTRL_RANGE_MIN, bus.CTRL_RANGE_MAX + 1))
+ROUNDS = 200
+
+
+class MemoryChannel:
+    """
+    Stand-in for adafruit_pca9685.PWMChannel that keeps the duty cycle in memory.
+    """
+    def __init__(self, frequency: float) -> None:
+        self.frequency = frequency
+        self.duty_cycle = 0
+
+
+def library_path(servo: Servo) -> None:
+    for step in STEPS:
+        servo.angle = bus.pwm_to_angle(step)
+
+
+def table_path(channel: MemoryChannel) -> None:
+    table = bus.DUTY_CYCLE_TABLE
+    for step in STEPS:
+        channel.duty_cycle = table[step]
+
+
+def check_tables(frequency: float) -> None:
+    """
+    The table must produce exactly the same duty cycle as the library did.
+    """
+    channel = MemoryChannel(frequency)
+    servo = Servo(channel, min_pulse=bus.MIN_PULSE_US, max_pulse=bus.MAX_PULSE_US)
+    for step in STEPS:
+        servo.angle = bus.pwm_to_angle(step)
+        if channel.duty_cycle != bus.DUTY_CYCLE_TABLE[step]:
+            logger.error(f"Mismatch at step {step}: {channel.duty_cycle} != {bus.DUTY_CYCLE_TABLE[step]}")
+            sys.exit(1)
+    logger.info(f"Lookup table matches adafruit_motor for all {len(STEPS)} steps.")
+
+
+if __name__ == '__main__':
+    frequency = bus.pwm_frequency
+    check_tables(frequency)
+
+    channel = MemoryChannel(frequency)
+    servo = Servo(channel, min_pulse=bus.MIN_PULSE_US, max_pulse=bus.MAX_PULSE_US)
+
+    writes = len(STEPS) * ROUNDS
+    library_time = timeit.timeit(lambda: library_path(servo), number=ROUNDS)
+    table_time = timeit.timeit(lambda: table_path(MemoryChannel(frequency)), number=ROUNDS)
+
+    logger.info(f"adafruit_motor angle path: {library_time / writes * 1e6:.2f} us/write")
+    logger.info(f"lookup table path:         {table_time / writes * 1e6:.2f} us/write")
+    logger.info(f"speedup: {library_time / table_time:.1f}x")
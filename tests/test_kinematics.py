@@ -0,0 +1,128 @@
+"""
+Checks servo.kinematics: the body pose conventions of BodyKinematics match
+system.orientation (positive roll lifts the left side, positive pitch lowers
+the nose, a raised side of the body needs its feet further down), the exact
+IK inverts the FK, and the IK grid agrees with the exact IK.
+
+    python3 tests/test_kinematics.py    (or pytest tests/test_kinematics.py)
+"""
+
+import os
+import sys
+import logging
+
+import numpy as np
+
+# Add the parent directory of 'server' to sys.path.
+# Prepended, otherwise tests/servo.py shadows the server's servo package.
+script_dir = os.path.realpath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(script_dir, '..', 'server')))
+from servo import gait
+from servo import kinematics
+from system.orientation import MahonyFilter, GRAVITY
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+LEGS = (
+    gait.Leg('left_I', 'left', 0, 1, 1, 1),
+    gait.Leg('left_II', 'left', 2, 3, 1, 1),
+    gait.Leg('left_III', 'left', 4, 5, 1, 1),
+    gait.Leg('right_I', 'right', 6, 7, 1, 1),
+    gait.Leg('right_II', 'right', 8, 9, 1, 1),
+    gait.Leg('right_III', 'right', 10, 11, 1, 1),
+)
+LEFT = [0, 1, 2]
+RIGHT = [3, 4, 5]
+FRONT = [0, 3]
+REAR = [2, 5]
+HEIGHT = 60.0
+# Servo angles the round trip and grid tests cover, degrees from the init pose
+COXA_LIMIT = 40.0
+# One PWM step in degrees, the resolution the servos are driven with
+PWM_STEP_DEG = 1 / kinematics.PWM_PER_DEGREE
+
+
+def body() -> kinematics.BodyKinematics:
+    return kinematics.BodyKinematics(LEGS, [300] * 16, kinematics.DEFAULT_GEOMETRY)
+
+
+def test_level_pose():
+    z = body().foot_heights(HEIGHT)
+    assert np.allclose(z, -HEIGHT)
+
+
+def test_positive_roll_lifts_left_side():
+    z = body().foot_heights(HEIGHT, roll_deg=10.0)
+    # Left side up: every left foot reaches further down than every right foot
+    assert z[LEFT].max() < -HEIGHT < z[RIGHT].min()
+
+
+def test_positive_pitch_lowers_nose():
+    z = body().foot_heights(HEIGHT, pitch_deg=10.0)
+    # Nose down: the rear feet reach further down than the front feet
+    assert z[REAR].max() < -HEIGHT < z[FRONT].min()
+
+
+def measured_tilt(z: np.ndarray) -> np.ndarray:
+    """
+    Accelerometer reading of a still body standing on feet at heights z (feet on flat ground).
+    """
+    mounts = body().mounts
+    # Mount heights over the ground, fitted as a plane h = a x + b y + c
+    heights = -z
+    a, b, _ = np.linalg.lstsq(np.column_stack([mounts, np.ones(len(mounts))]), heights, rcond=None)[0]
+    # Upward component of the body x and y axes, the reading is gravity's reaction in the body frame
+    up = np.array([a, b, np.sqrt(1 - a * a - b * b)])
+    return GRAVITY * up
+
+
+def orientation_of(accel: np.ndarray):
+    estimator = MahonyFilter()
+    estimator.reset(accel)
+    estimator.update(np.zeros(1), np.concatenate([accel, np.zeros(3)])[None, :])
+    return estimator.orientation()
+
+
+def test_pose_matches_orientation_estimate():
+    # A body posed at some roll or pitch reads back as that roll or pitch from the estimator
+    for roll, pitch in ((8.0, 0.0), (-8.0, 0.0), (0.0, 8.0), (0.0, -8.0)):
+        z = body().foot_heights(HEIGHT, roll_deg=roll, pitch_deg=pitch)
+        orientation = orientation_of(measured_tilt(z))
+        assert abs(orientation.roll - roll) < 1e-6, (roll, pitch, orientation)
+        assert abs(orientation.pitch - pitch) < 1e-6, (roll, pitch, orientation)
+
+
+def test_fk_ik_round_trip():
+    leg = kinematics.LegKinematics(kinematics.DEFAULT_GEOMETRY)
+    femur_low, femur_high = np.degrees(leg.femur_table[[0, -1]] - leg.femur_zero)
+    rng = np.random.default_rng(0)
+    coxa = rng.uniform(-COXA_LIMIT, COXA_LIMIT, 1000)
+    femur = rng.uniform(femur_low, femur_high, 1000)
+    foot = leg.forward(coxa, femur)
+    coxa_ik, femur_ik = leg.inverse(foot[:, 0], foot[:, 2])
+    assert np.abs(coxa_ik - coxa).max() < 0.01
+    assert np.abs(femur_ik - femur).max() < 0.01
+    # And back: the IK solution puts the foot where it was
+    assert np.abs(leg.forward(coxa_ik, femur_ik) - foot).max() < 0.01
+
+
+def test_grid_matches_exact_ik():
+    leg = kinematics.LegKinematics(kinematics.DEFAULT_GEOMETRY)
+    grid = kinematics.IKGrid(leg)
+    rng = np.random.default_rng(1)
+    x = rng.uniform(*kinematics.GRID_X_RANGE_MM, 20000)
+    z = rng.uniform(*leg.z_range(), 20000)
+    exact = np.stack(leg.inverse(x, z), axis=-1)
+    # Targets the coxa reaches within COXA_LIMIT, past it arcsin gets steep and x unreachable
+    usable = np.abs(exact[:, 0]) <= COXA_LIMIT
+    error = np.abs(grid.lookup(x, z) - exact)[usable]
+    # Well under one PWM step, the grid costs no servo resolution
+    assert error.max() < PWM_STEP_DEG / 2, error.max(axis=0)
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            logger.info(f"{name}: ok")